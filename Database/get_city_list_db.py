@@ -1,3 +1,4 @@
+import os
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
@@ -14,6 +15,9 @@ engine = create_engine(
     connect_args={"check_same_thread": False}
 )
 
+# A forked worker opens its own connections
+os.register_at_fork(after_in_child=lambda: engine.dispose(close=False))
+
 # Configure the session maker
 SessionLocal = sessionmaker(
     autocommit=False,
@@ -1,39 +1,100 @@
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy import create_engine
+from fastapi import HTTPException
 from Models import Base
 from Models.models import *
 import os
+import threading
+import time
+from contextlib import contextmanager
 
-SUPABASE_URL = os.getenv("SUPABASE_DB_URL")
+# The engine is created on first use rather than at import time, so the
+# app can start while the database is briefly unreachable
+engine = None
+_initialized = False
+_init_lock = threading.Lock()
 
-# Create the database engine
-engine = create_engine(
-    SUPABASE_URL,
-    pool_size=5,
-    max_overflow=10,
-)
-
-# Configure the session maker
+# Configure the session maker; it is bound once the engine exists
 SessionLocal = sessionmaker(
     autocommit=False,
     autoflush=False,
-    bind=engine
 )
 
 
+def get_engine():
+    """
+    Create the database engine from SUPABASE_DB_URL if needed.
+    """
+    global engine
+    if engine is None:
+        with _init_lock:
+            if engine is None:
+                url = os.getenv("SUPABASE_DB_URL")
+                if not url:
+                    raise RuntimeError("SUPABASE_DB_URL is not set.")
+                engine = create_engine(
+                    url,
+                    pool_size=5,
+                    max_overflow=10,
+                )
+                SessionLocal.configure(bind=engine)
+    return engine
+
+
+def _dispose_after_fork():
+    # A forked worker opens its own connections; close=False leaves the
+    # parent's to the parent
+    if engine is not None:
+        engine.dispose(close=False)
+
+
+os.register_at_fork(after_in_child=_dispose_after_fork)
+
+
 def create_tables():
     """
     Create tables defined in the Models if they do not exist.
-    """ 
-    Base.metadata.create_all(bind=engine)
+    """
+    Base.metadata.create_all(bind=get_engine())
 
 
-create_tables()
+def init_db(retries: int = 5, delay: float = 1.0) -> bool:
+    """
+    Create the engine and any missing tables, retrying with exponential
+    backoff. Returns False if the database stayed unreachable.
+    """
+    global _initialized
+    if _initialized:
+        return True
+    for attempt in range(retries):
+        try:
+            create_tables()
+            _initialized = True
+            return True
+        except Exception as e:
+            print(f"Database initialization failed (attempt {attempt + 1}/{retries}): {e}")
+            if attempt < retries - 1:
+                time.sleep(delay * 2 ** attempt)
+    return False
 
 
-def get_verified_db():
+@contextmanager
+def verified_session():
+    """
+    A session on the city metrics database, for routes that only sometimes
+    need one.
+    """
+    # Retry once per request if startup could not reach the database
+    if not _initialized and not init_db(retries=1):
+        raise HTTPException(
+            status_code=503, detail="City metrics database is unavailable.")
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+
+def get_verified_db():
+    with verified_session() as db:
+        yield db
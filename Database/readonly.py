@@ -0,0 +1,207 @@
+import os
+import sqlite3
+import threading
+import numpy as np
+from utils.constants import SQLITE_IMMUTABLE
+
+DATABASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CITY_LIST_PATH = os.path.join(DATABASE_DIR, "CityList.db")
+NEWS_PATH = os.path.join(DATABASE_DIR, "news.db")
+
+# Connection tuning for files that are only ever read by the app
+MMAP_SIZE = 256 * 1024 * 1024
+CACHE_SIZE_KB = 64 * 1024
+CACHED_STATEMENTS = 128
+
+
+class CityRow:
+    __slots__ = ("id", "city", "state_name", "state_code")
+
+    def __init__(self, id, city, state_name, state_code):
+        self.id = id
+        self.city = city
+        self.state_name = state_name
+        self.state_code = state_code
+
+
+class NewsRow:
+    __slots__ = ("id", "name", "url")
+
+    def __init__(self, id, name, url):
+        self.id = id
+        self.name = name
+        self.url = url
+
+
+class CityTable:
+    """
+    Cities held in a few flat buffers instead of one object per city: the
+    sorted IDs, and the names as one UTF-8 blob with an offsets array. A
+    table built before the server forks its workers stays in pages they all
+    share, since reading it never touches per-city reference counts. NULL
+    names are stored as empty strings.
+    """
+
+    # Names stored per city, in CityRow order after the ID
+    FIELDS = ("city", "state_name", "state_code")
+
+    def __init__(self, rows: list[tuple]):
+        rows = sorted(rows, key=lambda row: row[0])
+        self.ids = np.array([row[0] for row in rows], dtype=np.int64)
+        encoded = [(value or "").encode() for row in rows for value in row[1:4]]
+        self.offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(value) for value in encoded], out=self.offsets[1:])
+        self.text = b"".join(encoded)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __getitem__(self, position: int) -> CityRow:
+        if not 0 <= position < len(self.ids):
+            raise IndexError(position)
+        start = position * 3
+        names = [self.text[self.offsets[i]:self.offsets[i + 1]].decode()
+                 for i in range(start, start + 3)]
+        return CityRow(int(self.ids[position]), *names)
+
+    def __iter__(self):
+        return (self[position] for position in range(len(self)))
+
+    def position(self, id: int) -> int | None:
+        position = int(np.searchsorted(self.ids, id))
+        if position == len(self.ids) or self.ids[position] != id:
+            return None
+        return position
+
+    def get(self, id: int) -> CityRow | None:
+        position = self.position(id)
+        return None if position is None else self[position]
+
+
+class ReadOnlyDB:
+    """
+    A read-only SQLite file with one tuned connection per thread, used in
+    place of per-request SQLAlchemy sessions on the hot read paths.
+    """
+
+    def __init__(self, path: str, immutable: bool = SQLITE_IMMUTABLE):
+        self.path = path
+        self.immutable = immutable
+        self.local = threading.local()
+
+    def connect(self) -> sqlite3.Connection:
+        # immutable=1 also skips file locking and change detection, so it is
+        # only safe while nothing writes to the file
+        uri = f"file:{self.path}?mode=ro"
+        if self.immutable:
+            uri += "&immutable=1"
+        conn = sqlite3.connect(
+            uri, uri=True, cached_statements=CACHED_STATEMENTS)
+        conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+        conn.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KB}")
+        conn.execute("PRAGMA query_only = 1")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        return conn
+
+    def reset(self):
+        """
+        Forget the connections opened so far. A forked worker must not use
+        its parent's connections.
+        """
+        self.local = threading.local()
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = self.connect()
+            self.local.conn = conn
+        return conn
+
+    def fetchall(self, sql: str, params: tuple = ()) -> list[tuple]:
+        return self.conn.execute(sql, params).fetchall()
+
+    def fetchone(self, sql: str, params: tuple = ()) -> tuple | None:
+        return self.conn.execute(sql, params).fetchone()
+
+    def table_version(self, table: str) -> str:
+        """
+        The max id and row count of a table, which change whenever rows are
+        added or removed.
+        """
+        max_id, count = self.fetchone(f"SELECT max(id), count(*) FROM {table}")
+        return f"{max_id}-{count}"
+
+
+city_list_db = ReadOnlyDB(CITY_LIST_PATH)
+news_db = ReadOnlyDB(NEWS_PATH)
+os.register_at_fork(after_in_child=city_list_db.reset)
+os.register_at_fork(after_in_child=news_db.reset)
+
+# The whole city list in memory, when preloaded by serve.py; lookups by ID
+# go to SQLite otherwise
+city_table = None
+
+# SQLite's LIKE is case-insensitive for ASCII, matching the ilike filters
+# the SQLAlchemy queries used
+SEARCH_CITIES_SQL = """
+    SELECT id, city, state_name, state_code FROM city_metrics
+    WHERE city LIKE ?1 OR state_name LIKE ?1 OR state_code LIKE ?1
+    ORDER BY CASE WHEN city LIKE ?1 THEN 1 ELSE 2 END
+    LIMIT ?2
+"""
+
+FIND_NEWS_SQL = "SELECT id, name, url FROM news WHERE name LIKE ? LIMIT 1"
+
+GET_CITY_SQL = "SELECT id, city, state_name, state_code FROM city_metrics WHERE id = ?"
+
+
+def search_cities(q: str, limit: int = 20) -> list[CityRow]:
+    """
+    Cities whose name, state name or state code contains q, with city name
+    matches first.
+    """
+    rows = city_list_db.fetchall(SEARCH_CITIES_SQL, (f"%{q}%", limit))
+    return [CityRow(*row) for row in rows]
+
+
+ALL_CITIES_SQL = "SELECT id, city, state_name, state_code FROM city_metrics"
+
+
+def preload_city_table() -> CityTable:
+    """
+    Load the city list into memory for get_city and get_cities. Changes to
+    CityList.db are not seen until the next start.
+    """
+    global city_table
+    city_table = CityTable(city_list_db.fetchall(ALL_CITIES_SQL))
+    return city_table
+
+
+def get_city(id: int) -> CityRow | None:
+    if city_table is not None:
+        return city_table.get(id)
+    row = city_list_db.fetchone(GET_CITY_SQL, (id,))
+    return CityRow(*row) if row else None
+
+
+def get_cities(ids: list[int]) -> dict[int, CityRow]:
+    """
+    The cities with the given IDs, in one query.
+    """
+    if city_table is not None:
+        rows = (city_table.get(id) for id in ids)
+        return {row.id: row for row in rows if row is not None}
+    placeholders = ", ".join("?" * len(ids))
+    rows = city_list_db.fetchall(
+        "SELECT id, city, state_name, state_code FROM city_metrics "
+        f"WHERE id IN ({placeholders})", tuple(ids))
+    return {row[0]: CityRow(*row) for row in rows}
+
+
+def find_news(name: str) -> NewsRow | None:
+    """
+    The first news page whose name contains `name`.
+    """
+    row = news_db.fetchone(FIND_NEWS_SQL, (f"%{name}%",))
+    return NewsRow(*row) if row else None
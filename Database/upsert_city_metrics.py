@@ -0,0 +1,57 @@
+from datetime import datetime
+
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects import postgresql, sqlite
+from Models.models import CityMetrics
+
+
+# Columns never overwritten when an existing row is upserted
+_INSERT_ONLY_COLUMNS = {"id", "created_at", "search_id"}
+
+
+def ensure_search_id_unique(bind):
+    """
+    Create the unique index on search_id that ON CONFLICT upserts rely on.
+    Tables created before the index existed do not get it from create_all;
+    migrate_search_id_unique.py removes their duplicates and calls this.
+    """
+    for index in CityMetrics.__table__.indexes:
+        if index.unique and [c.name for c in index.columns] == ["search_id"]:
+            index.create(bind=bind, checkfirst=True)
+
+
+def upsert_city_metrics(db: Session | Connection, rows: list[dict]) -> int:
+    """
+    Insert or update CityMetrics rows keyed on search_id in one executemany
+    statement. The caller is responsible for committing.
+    """
+    if not rows:
+        return 0
+
+    dialect = db.get_bind().dialect.name if isinstance(
+        db, Session) else db.dialect.name
+    if dialect == "postgresql":
+        insert = postgresql.insert
+    elif dialect == "sqlite":
+        insert = sqlite.insert
+    else:
+        raise ValueError(f"Upserts are not supported for {dialect}.")
+
+    now = datetime.now()
+    rows = [{"created_at": now, "updated_at": now, **row} for row in rows]
+
+    columns = set().union(*(row.keys() for row in rows))
+    # executemany needs every row to bind the same parameters
+    rows = [{column: row.get(column) for column in columns} for row in rows]
+
+    stmt = insert(CityMetrics.__table__)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["search_id"],
+        set_={
+            column: stmt.excluded[column]
+            for column in columns - _INSERT_ONLY_COLUMNS
+        },
+    )
+    db.execute(stmt, rows)
+    return len(rows)
@@ -49,4 +49,6 @@ class CityMetrics(Base):
     # Define composite index for optimized search
     __table_args__ = (
         Index("idx_city_state", "city", "state_name"),
+        # One metrics row per city list entry; bulk upserts conflict on it
+        Index("uq_city_metrics_search_id", "search_id", unique=True),
     )
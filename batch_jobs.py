@@ -0,0 +1,287 @@
+"""
+Whole-table LLM jobs through the OpenAI Batch API, at half the price of
+synchronous calls and without their rate limits:
+
+    python batch_jobs.py city-metrics --name backfill-2026-10
+    python batch_jobs.py rag --hot 500 --name rag-hot
+
+city-metrics runs Perplexity's research for every city enrich_city_data.py
+would enrich (Perplexity has no batch API), then parses the research with
+gpt-4o-mini in batches and upserts the rows. rag pre-generates query_rag
+results for city pairs into the shared cache.
+
+Each job keeps its files under BATCH_DIR/<name>. Running the same command
+again resumes it: research already done, batches already submitted and
+results already ingested are not repeated.
+"""
+import argparse
+import asyncio
+import csv
+import json
+import os
+import time
+from datetime import datetime
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from Database.get_verified_db import SessionLocal, init_db
+from Database.readonly import city_list_db, get_city
+from Database.upsert_city_metrics import upsert_city_metrics
+from enrich_city_data import DEFAULT_CHECKPOINT, find_targets, load_checkpoint
+from utils.batch import BatchJob, chat_request, parse_result
+from utils.cache import cache, call_parts, unpack
+from utils.City_Data.get_city_data import aresearch_city, city_parse_messages
+from utils.City_Data.schemas import CityDetails, CityMetricsSchema
+from utils.metrics import record_llm_usage
+from utils.query_data import RAG_MODEL, ResourceResponse, rag_prompt, rag_result
+from utils.rate_limit import AsyncRateLimiter
+from utils.warmer import COUNTS_KEY
+
+CITY_PARSE_MODEL = "gpt-4o-mini"
+# Rows per upsert while ingesting
+UPSERT_BATCH_SIZE = 500
+
+
+def read_jsonl(path: str) -> list[dict]:
+    if not os.path.exists(path):
+        return []
+    with open(path) as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+async def research_cities(cities: list[CityDetails], path: str,
+                          concurrency: int, rate_per_minute: float) -> int:
+    """
+    Append Perplexity's research for each city to path, skipping cities
+    already there. Returns how many cities failed.
+    """
+    done = {entry["search_id"] for entry in read_jsonl(path)}
+    cities = [city for city in cities if city.id not in done]
+    print(f"Researching {len(cities)} cities ({len(done)} already done).")
+    semaphore = asyncio.Semaphore(concurrency)
+    limiter = AsyncRateLimiter(rate_per_minute / 60.0, capacity=concurrency)
+    failed = 0
+
+    async def research(city: CityDetails):
+        nonlocal failed
+        async with semaphore:
+            await limiter.acquire()
+            try:
+                content = await aresearch_city(city)
+            except Exception as e:
+                failed += 1
+                print(f"Failed {city.city}, {city.state_code}: {e}")
+                return
+        with open(path, "a") as file:
+            file.write(json.dumps({**city.model_dump(), "search_id": city.id,
+                                   "content": content}) + "\n")
+
+    await asyncio.gather(*(research(city) for city in cities))
+    return failed
+
+
+def city_metrics_job(args):
+    if not init_db():
+        raise SystemExit("Could not connect to the city metrics database.")
+    job = BatchJob(args.name)
+    research_path = job.file("research.jsonl")
+
+    if not job.prepared:
+        targets = find_targets(args.max_age_days)
+        checkpoint = load_checkpoint(args.checkpoint, args.max_age_days)
+        targets = [city for city in targets if checkpoint.get(city.id) != "ok"]
+        if args.limit:
+            targets = targets[:args.limit]
+        print(f"{len(targets)} cities need enrichment.")
+        if not targets:
+            return
+        os.makedirs(job.path, exist_ok=True)
+        failed = asyncio.run(research_cities(targets, research_path,
+                                             args.concurrency, args.rate))
+        # Once prepared, the job never researches again, so the failed
+        # cities would only be picked up by a job with a new name
+        if failed and not args.allow_failed:
+            raise SystemExit(
+                f"{failed} cities failed; run the job again with the same --name "
+                "to retry them, or add --allow-failed to submit without them.")
+        count = job.prepare(
+            chat_request(f"city-{entry['search_id']}", CITY_PARSE_MODEL,
+                         city_parse_messages(entry["content"], CityDetails(**entry)),
+                         response_format=CityMetricsSchema)
+            for entry in read_jsonl(research_path)
+        )
+        print(f"Wrote {count} parse requests to {job.path}.")
+    if args.dry_run:
+        return
+
+    cities = {entry["search_id"]: entry for entry in read_jsonl(research_path)}
+
+    def ingest(results):
+        rows, checkpoint, failed = [], [], 0
+        for result in results:
+            search_id = int(result["custom_id"].removeprefix("city-"))
+            try:
+                metrics, usage = parse_result(result, CityMetricsSchema)
+            except ValueError as e:
+                failed += 1
+                print(f"Failed to parse city {search_id}: {e}")
+                continue
+            record_llm_usage("city_parse_batch", CITY_PARSE_MODEL, usage)
+            city = cities[search_id]
+            rows.append({
+                "search_id": search_id,
+                "city": city["city"],
+                "state_name": city["state_name"],
+                "state_code": city["state_code"],
+                **metrics.model_dump(),
+            })
+        db = SessionLocal()
+        try:
+            for i in range(0, len(rows), UPSERT_BATCH_SIZE):
+                upsert_city_metrics(db, rows[i:i + UPSERT_BATCH_SIZE])
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+        cache.invalidate("city_data")
+        # So enrich_city_data.py does not redo these cities
+        now = datetime.now().isoformat()
+        os.makedirs(os.path.dirname(args.checkpoint) or ".", exist_ok=True)
+        with open(args.checkpoint, "a") as file:
+            for row in rows:
+                file.write(json.dumps({"search_id": row["search_id"],
+                                       "status": "ok", "at": now}) + "\n")
+        print(f"Upserted {len(rows)} cities, {failed} failed.")
+
+    job.run(ingest, args.poll_interval, args.timeout)
+
+
+def rag_pairs(args) -> list[tuple[int, int]]:
+    pairs = []
+    if args.pairs_file:
+        with open(args.pairs_file) as file:
+            pairs += [(int(row[0]), int(row[1])) for row in csv.reader(file)
+                      if row and row[0].strip().isdigit()]
+    if args.hot:
+        data = cache.backend.get(COUNTS_KEY)
+        counts = unpack(data)["counts"] if data else {}
+        hot = [key for key in sorted(counts, key=counts.get, reverse=True)
+               if key.startswith("comparison:")][:args.hot]
+        pairs += [tuple(int(id) for id in key.split(":")[1:]) for key in hot]
+    if args.from_id is not None:
+        pairs += [(args.from_id, id) for (id,) in city_list_db.fetchall(
+            "SELECT id FROM city_metrics ORDER BY id") if id != args.from_id]
+    return list(dict.fromkeys(pairs))
+
+
+def rag_job(args):
+    job = BatchJob(args.name)
+    prompts_path = job.file("prompts.jsonl")
+
+    if not job.prepared:
+        requests, prompts, skipped = [], [], 0
+        for from_id, to_id in rag_pairs(args)[:args.limit]:
+            cities = get_city(from_id), get_city(to_id)
+            if None in cities:
+                continue
+            # query_rag's arguments, which key its cache entry
+            names = (cities[0].city, cities[1].city, cities[1].state_code)
+            if not args.force and cache.get("rag", call_parts(names, {})) is not None:
+                skipped += 1
+                continue
+            request = rag_prompt(*names)
+            if request is None:
+                raise SystemExit("The blog collection is empty.")
+            custom_id = f"rag-{from_id}-{to_id}"
+            prompts.append({"custom_id": custom_id, "cities": names,
+                            "sources": request["sources"],
+                            "context_tokens": request["context_tokens"],
+                            "prompt": request["prompt"]})
+            requests.append(chat_request(
+                custom_id, RAG_MODEL, [{"role": "user", "content": request["prompt"]}],
+                response_format=ResourceResponse, temperature=request["temperature"]))
+        print(f"{len(requests)} pairs to generate, {skipped} already cached.")
+        if not requests:
+            return
+        os.makedirs(job.path, exist_ok=True)
+        with open(prompts_path, "w") as file:
+            for prompt in prompts:
+                file.write(json.dumps(prompt) + "\n")
+        job.prepare(requests)
+    if args.dry_run:
+        return
+
+    prompts = {prompt["custom_id"]: prompt for prompt in read_jsonl(prompts_path)}
+
+    def ingest(results):
+        stored, failed = 0, 0
+        for result in results:
+            prompt = prompts[result["custom_id"]]
+            try:
+                parsed, usage = parse_result(result, ResourceResponse)
+            except ValueError as e:
+                failed += 1
+                print(f"Failed {result['custom_id']}: {e}")
+                continue
+            record_llm_usage("query_rag_batch", RAG_MODEL, usage)
+            # Stored under the key query_rag itself uses
+            cache.set("rag", call_parts(tuple(prompt["cities"]), {}),
+                      rag_result(prompt, parsed, usage))
+            stored += 1
+        print(f"Cached {stored} query_rag results, {failed} failed.")
+
+    job.run(ingest, args.poll_interval, args.timeout)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="job", required=True)
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--name", type=str,
+                        help="Job directory under BATCH_DIR; reuse it to resume.")
+    common.add_argument("--limit", type=int)
+    common.add_argument("--poll-interval", type=float, default=30)
+    common.add_argument("--timeout", type=float,
+                        help="Stop polling after this many seconds.")
+    common.add_argument("--dry-run", action="store_true",
+                        help="Only write the batch input files.")
+
+    city = subparsers.add_parser("city-metrics", parents=[common])
+    city.add_argument("--max-age-days", type=int, default=365)
+    city.add_argument("--checkpoint", type=str, default=DEFAULT_CHECKPOINT)
+    city.add_argument("--concurrency", type=int, default=8,
+                      help="Concurrent Perplexity research calls.")
+    city.add_argument("--rate", type=float, default=60,
+                      help="Maximum Perplexity calls started per minute.")
+    city.add_argument("--allow-failed", action="store_true",
+                      help="Submit the parse batches even if some research "
+                           "failed; a later job retries those cities.")
+
+    rag = subparsers.add_parser("rag", parents=[common])
+    rag.add_argument("--pairs-file", type=str,
+                     help="CSV of from_id,to_id city pairs.")
+    rag.add_argument("--hot", type=int,
+                     help="The most requested comparisons, from the cache warmer.")
+    rag.add_argument("--from-id", type=int,
+                     help="Every city as a destination from this one.")
+    rag.add_argument("--force", action="store_true",
+                     help="Regenerate pairs that are already cached.")
+    args = parser.parse_args()
+    args.name = args.name or f"{args.job}-{datetime.now():%Y%m%d-%H%M%S}"
+
+    start = time.time()
+    if args.job == "city-metrics":
+        city_metrics_job(args)
+    else:
+        if not (args.pairs_file or args.hot or args.from_id is not None):
+            parser.error("rag needs --pairs-file, --hot or --from-id.")
+        rag_job(args)
+    print(f"Job {args.name} done in {time.time() - start:.0f}s.")
+
+
+if __name__ == "__main__":
+    main()
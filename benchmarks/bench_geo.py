@@ -0,0 +1,76 @@
+"""
+Latency of /nearby-cities lookups in the city KD-tree against a brute-force
+haversine scan over every row of CityList.db, checking both return the same
+cities.
+
+Uses the imported coordinates, or random points across the contiguous US
+for cities without any:
+
+    python -m benchmarks.bench_geo --queries 2000 --k 10 --radius-miles 50
+"""
+import argparse
+import time
+
+import numpy as np
+
+from Database.readonly import city_list_db
+from utils.geo import EARTH_RADIUS_MILES, CityIndex, city_index
+
+
+def load_rows(seed: int = 0) -> list[tuple]:
+    index = city_index()
+    if len(index):
+        return [(city.id, city.city, city.state_name, city.state_code, *index.location(city.id))
+                for city in index.cities]
+    rng = np.random.default_rng(seed)
+    rows = city_list_db.fetchall("SELECT id, city, state_name, state_code FROM city_metrics")
+    return [(*row, rng.uniform(25, 49), rng.uniform(-124, -67)) for row in rows]
+
+
+def brute_force(coordinates: np.ndarray, lat: float, lon: float, k: int,
+                radius_miles: float = None) -> np.ndarray:
+    lats, lons = np.radians(coordinates[:, 0]), np.radians(coordinates[:, 1])
+    lat, lon = np.radians(lat), np.radians(lon)
+    a = (np.sin((lats - lat) / 2) ** 2
+         + np.cos(lat) * np.cos(lats) * np.sin((lons - lon) / 2) ** 2)
+    miles = 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(a))
+    nearest = np.argsort(miles)[:k]
+    if radius_miles is not None:
+        nearest = nearest[miles[nearest] <= radius_miles]
+    return nearest
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--radius-miles", type=float)
+    args = parser.parse_args()
+
+    rows = load_rows()
+    start = time.perf_counter()
+    index = CityIndex(rows)
+    print(f"Indexed {len(index)} cities in {(time.perf_counter() - start) * 1000:.0f}ms")
+
+    rng = np.random.default_rng(1)
+    points = index.coordinates[rng.integers(0, len(index), args.queries)]
+
+    start = time.perf_counter()
+    tree_results = [index.nearest(lat, lon, args.k, args.radius_miles) for lat, lon in points]
+    tree_us = (time.perf_counter() - start) / args.queries * 1e6
+
+    start = time.perf_counter()
+    brute_results = [brute_force(index.coordinates, lat, lon, args.k, args.radius_miles)
+                     for lat, lon in points]
+    brute_us = (time.perf_counter() - start) / args.queries * 1e6
+
+    mismatches = sum(
+        [city.id for city, _ in tree] != [index.cities[i].id for i in brute]
+        for tree, brute in zip(tree_results, brute_results))
+    print(f"KD-tree:     {tree_us:8.1f}us per query")
+    print(f"Brute force: {brute_us:8.1f}us per query")
+    print(f"Mismatched results: {mismatches} of {args.queries}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""
+Recall@k, query latency and index size of HNSW settings for the blog
+collection, measured against exact brute-force search.
+
+The index is built with hnswlib, the library and parameters (M,
+construction_ef, search_ef) Chroma uses for its collections. Vectors come
+either from an existing blog collection (`--source chroma`, using the
+query_rag query templates over the city list, embedded with the configured
+embedding model) or from a synthetic corpus shaped like ada-002 vectors
+(`--source synthetic`, offline):
+
+    python -m benchmarks.bench_hnsw --m 8 16 32 --search-ef 10 50 100
+    python -m benchmarks.bench_hnsw --source chroma --dimensions 0 256
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import hnswlib
+import numpy as np
+
+from utils.get_embedding_function import project
+
+ADA_DIMENSIONS = 1536
+
+
+def synthetic_corpus(n: int, queries: int, clusters: int = 200,
+                     dimensions: int = ADA_DIMENSIONS, seed: int = 0):
+    """
+    Clustered unit vectors sharing a common direction, like ada-002
+    embeddings (whose pairwise cosine similarities are mostly above 0.7).
+    Queries are perturbed cluster centers, like city queries landing near
+    that city's blog titles.
+    """
+    rng = np.random.default_rng(seed)
+    common = rng.standard_normal(dimensions)
+    common /= np.linalg.norm(common)
+    centers = rng.standard_normal((clusters, dimensions))
+    centers /= np.linalg.norm(centers, axis=1, keepdims=True)
+    centers = 0.8 * common + 0.6 * centers
+
+    def sample(count: int, spread: float):
+        vectors = (centers[rng.integers(0, clusters, count)]
+                   + spread * rng.standard_normal((count, dimensions)) / np.sqrt(dimensions))
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    return sample(n, 0.5).astype(np.float32), sample(queries, 0.4).astype(np.float32)
+
+
+def chroma_corpus(queries: int):
+    """
+    Embeddings from the blog collection at CHROMA_PATH, and the two query_rag
+    query templates for the first cities in the city list.
+    """
+    from langchain_chroma import Chroma
+    from Database.readonly import city_list_db
+    from utils.constants import BLOGS_COLLECTION, CHROMA_PATH
+    from utils.get_embedding_function import get_embedding_function
+
+    embeddings = get_embedding_function(dimensions=0)
+    db = Chroma(persist_directory=CHROMA_PATH, embedding_function=embeddings,
+                collection_name=BLOGS_COLLECTION)
+    corpus = np.array(db.get(include=["embeddings"])["embeddings"], dtype=np.float32)
+    if len(corpus) == 0:
+        raise SystemExit(f"No embeddings in {BLOGS_COLLECTION} at {CHROMA_PATH}.")
+
+    cities = [city for city, in city_list_db.fetchall(
+        "SELECT city FROM city_metrics ORDER BY id LIMIT ?", (queries,))]
+    texts = ["Resources for the LGBTQ+ Community in" + city for city in cities]
+    texts += [f"From {a} to {b}: LGBTQ+ Cities"
+              for a, b in zip(cities, cities[1:] + cities[:1])]
+    return corpus, np.array(embeddings.embed_documents(texts), dtype=np.float32)
+
+
+def exact_top_k(corpus: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    scores = queries @ corpus.T
+    return np.argsort(-scores, axis=1)[:, :k]
+
+
+def recall(found: np.ndarray, truth: np.ndarray) -> float:
+    hits = sum(len(set(f) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+
+def time_queries(search, queries: np.ndarray) -> tuple[np.ndarray, float]:
+    # One query at a time, as query_rag issues them
+    start = time.perf_counter()
+    results = np.array([search(query) for query in queries])
+    return results, (time.perf_counter() - start) / len(queries) * 1000
+
+
+def build_index(corpus: np.ndarray, space: str, m: int, construction_ef: int):
+    index = hnswlib.Index(space=space, dim=corpus.shape[1])
+    index.init_index(max_elements=len(corpus), ef_construction=construction_ef, M=m)
+    index.add_items(corpus, np.arange(len(corpus)))
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "index.bin")
+        index.save_index(path)
+        size = os.path.getsize(path)
+    return index, size
+
+
+def run(args) -> list[dict]:
+    if args.source == "chroma":
+        corpus, queries = chroma_corpus(args.queries)
+    else:
+        corpus, queries = synthetic_corpus(args.n, args.queries)
+    print(f"{len(corpus)} vectors of {corpus.shape[1]} dimensions, "
+          f"{len(queries)} queries, k={args.k}")
+
+    # Ground truth is exact search over the full vectors
+    truth = exact_top_k(corpus, queries, args.k)
+    rows = []
+
+    for dimensions in args.dimensions:
+        if dimensions:
+            data, probes = project(corpus, dimensions), project(queries, dimensions)
+        else:
+            data, probes = corpus, queries
+        label = dimensions or corpus.shape[1]
+
+        found, latency = time_queries(
+            lambda q: np.argsort(-(data @ q))[:args.k], probes)
+        rows.append({"index": "exact", "dimensions": label,
+                     "recall": recall(found, truth), "latency_ms": latency,
+                     "size_mb": data.nbytes / 2**20})
+
+        # int8 scalar quantization, as a reference: Chroma stores float32
+        scale = np.abs(data).max() / 127
+        quantized = np.round(data / scale).astype(np.int8)
+        found, latency = time_queries(
+            lambda q: np.argsort(-(quantized @ np.round(q / scale).astype(np.int32)))[:args.k],
+            probes)
+        rows.append({"index": "exact int8", "dimensions": label,
+                     "recall": recall(found, truth), "latency_ms": latency,
+                     "size_mb": quantized.nbytes / 2**20})
+
+        for m in args.m:
+            for construction_ef in args.construction_ef:
+                start = time.perf_counter()
+                index, size = build_index(data, args.space, m, construction_ef)
+                build_seconds = time.perf_counter() - start
+                for search_ef in args.search_ef:
+                    index.set_ef(max(search_ef, args.k))
+                    found, latency = time_queries(
+                        lambda q: index.knn_query(q, k=args.k)[0][0], probes)
+                    rows.append({
+                        "index": f"hnsw M={m} cef={construction_ef} ef={search_ef}",
+                        "dimensions": label, "recall": recall(found, truth),
+                        "latency_ms": latency, "size_mb": size / 2**20,
+                        "build_s": build_seconds,
+                    })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--source", type=str, default="synthetic",
+                        choices=["synthetic", "chroma"])
+    parser.add_argument("--n", type=int, default=20000,
+                        help="Synthetic corpus size.")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--space", type=str, default="l2",
+                        choices=["l2", "cosine", "ip"])
+    parser.add_argument("--m", type=int, nargs="+", default=[16])
+    parser.add_argument("--construction-ef", type=int, nargs="+", default=[100])
+    parser.add_argument("--search-ef", type=int, nargs="+", default=[10, 50, 100])
+    parser.add_argument("--dimensions", type=int, nargs="+", default=[0, 256],
+                        help="0 for the full vectors, else a projected size.")
+    parser.add_argument("--json", type=str,
+                        help="Write the results to this JSON file.")
+    args = parser.parse_args()
+
+    rows = run(args)
+    print(f"{'index':<30}{'dims':>6}{'recall@' + str(args.k):>10}"
+          f"{'query ms':>10}{'size MB':>10}{'build s':>9}")
+    for row in rows:
+        build = f"{row['build_s']:.1f}" if "build_s" in row else ""
+        print(f"{row['index']:<30}{row['dimensions']:>6}{row['recall']:>10.3f}"
+              f"{row['latency_ms']:>10.3f}{row['size_mb']:>10.1f}{build:>9}")
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(rows, file, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Memory of the app served by `uvicorn --workers N`, where every worker
+imports the app and loads its datasets itself, against `serve.py`, which
+loads them once and forks the workers.
+
+For each server the app is booted against the fake services, every route
+is warmed up so the lazily loaded modules are imported, and the RSS and PSS
+of the whole process tree are reported:
+
+    python -m benchmarks.bench_memory --workers 4
+"""
+import argparse
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.fakes import load_fixture
+from benchmarks.run_benchmarks import (
+    REPO_ROOT, ROUTES, benchmark_env, build_requests, free_port, run_route,
+    seed, wait_until_ready,
+)
+from utils.memory import memory_report, process_memory
+
+SERVERS = {
+    "uvicorn": [sys.executable, "-m", "uvicorn", "main:app", "--log-level", "warning"],
+    "serve.py": [sys.executable, "serve.py", "--log-level", "warning"],
+}
+
+
+def descendants(pid: int) -> list[int]:
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as file:
+            children = [int(child) for child in file.read().split()]
+    except OSError:
+        return []
+    return children + [pid for child in children for pid in descendants(child)]
+
+
+def run_server(args, name: str) -> dict:
+    workdir = tempfile.mkdtemp(prefix="relocation-memory-")
+    fake_port, app_port = free_port(), free_port()
+    fake_url = f"http://127.0.0.1:{fake_port}"
+    app_url = f"http://127.0.0.1:{app_port}"
+    processes = []
+    try:
+        fake = subprocess.Popen([sys.executable, "-m", "benchmarks.fakes",
+                                 "--port", str(fake_port)], cwd=REPO_ROOT)
+        processes.append(fake)
+        wait_until_ready(f"{fake_url}/healthz", fake)
+
+        env = benchmark_env(workdir, fake_url)
+        env["WARMER_ENABLED"] = "0"
+        seed(env)
+
+        app = subprocess.Popen(SERVERS[name] + [
+            "--port", str(app_port), "--workers", str(args.workers),
+        ], cwd=REPO_ROOT, env=env)
+        processes.append(app)
+        wait_until_ready(f"{app_url}/get-cities-list?q=Austin", app)
+
+        # Requests are spread over the workers by the kernel, so enough of
+        # them reach every worker
+        cities = load_fixture("cities.json")
+        for route in ROUTES:
+            run_route(app_url, build_requests(route, cities, args.requests), 8)
+        time.sleep(1)
+
+        pids = [app.pid] + descendants(app.pid)
+        print(f"\n{name}, {args.workers} workers:")
+        print(memory_report({f"process {i}": pid for i, pid in enumerate(pids)}))
+        usage = [process_memory(pid) or {} for pid in pids]
+        return {column: sum(process.get(column, 0) for process in usage)
+                for column in ("rss", "pss")}
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            process.wait(timeout=60)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=40,
+                        help="Warm-up requests per route.")
+    args = parser.parse_args()
+
+    totals = {name: run_server(args, name) for name in SERVERS}
+    print(f"\n{'server':<12}{'rss MB':>10}{'pss MB':>10}")
+    for name, total in totals.items():
+        print(f"{name:<12}{total['rss'] / 2**20:>10.1f}{total['pss'] / 2**20:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Tail latency of a cheap route while an expensive route is overloaded, with
+and without admission control.
+
+For each mode the app is booted against the fake services. /get-cities-list
+is measured alone and then again while many clients (spread over fake IPs
+through X-Forwarded-For) flood /comparison:
+
+    python -m benchmarks.bench_overload --flood-concurrency 64
+"""
+import argparse
+import itertools
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from benchmarks.fakes import load_fixture
+from benchmarks.run_benchmarks import (
+    REPO_ROOT, benchmark_env, build_requests, free_port, print_report,
+    run_route, seed, wait_until_ready,
+)
+
+
+def flood(base_url: str, calls: list[tuple], concurrency: int,
+          stop: threading.Event, honor_retry_after: bool) -> Counter:
+    """
+    Send the calls round-robin from `concurrency` threads until stopped,
+    counting response statuses.
+    """
+    statuses = Counter()
+    lock = threading.Lock()
+
+    def worker(offset: int):
+        session = requests.Session()
+        specs = itertools.islice(itertools.cycle(calls), offset, None)
+        for n, (method, path, params, body) in enumerate(specs):
+            if stop.is_set():
+                return
+            # A new client address per request, so the per-client limits
+            # do not hide the pool behaviour
+            client_ip = f"10.{offset % 250}.{n // 250 % 250}.{n % 250 + 1}"
+            try:
+                response = session.request(
+                    method, base_url + path, params=params, json=body,
+                    headers={"X-Forwarded-For": client_ip}, timeout=120)
+                status = response.status_code
+            except requests.RequestException:
+                status, response = "error", None
+            with lock:
+                statuses[status] += 1
+            if honor_retry_after and status == 429:
+                stop.wait(int(response.headers.get("Retry-After", 1)))
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for offset in range(concurrency):
+            pool.submit(worker, offset)
+        stop.wait()
+    return statuses
+
+
+def run_mode(args, admission: bool) -> dict:
+    workdir = tempfile.mkdtemp(prefix="relocation-overload-")
+    fake_port, app_port = free_port(), free_port()
+    fake_url = f"http://127.0.0.1:{fake_port}"
+    app_url = f"http://127.0.0.1:{app_port}"
+    processes = []
+    try:
+        fake = subprocess.Popen([
+            sys.executable, "-m", "benchmarks.fakes", "--port", str(fake_port),
+            "--llm-latency", str(args.llm_latency),
+        ], cwd=REPO_ROOT)
+        processes.append(fake)
+        wait_until_ready(f"{fake_url}/healthz", fake)
+
+        # The flood should exercise the pools, not the result cache
+        env = benchmark_env(workdir, fake_url, "none")
+        env["ADMISSION_CONTROL"] = "1" if admission else "0"
+        seed(env)
+
+        app = subprocess.Popen([
+            sys.executable, "-m", "uvicorn", "main:app",
+            "--port", str(app_port), "--log-level", "warning",
+            "--proxy-headers", "--forwarded-allow-ips", "127.0.0.1",
+        ], cwd=REPO_ROOT, env=env)
+        processes.append(app)
+        wait_until_ready(f"{app_url}/get-cities-list?q=Austin", app)
+
+        cities = load_fixture("cities.json")
+        cheap = build_requests("/get-cities-list", cities, args.requests)
+        report = {"idle": run_route(app_url, cheap, args.concurrency)}
+
+        stop = threading.Event()
+        result = {}
+        flooder = threading.Thread(target=lambda: result.update(flood(
+            app_url, build_requests("/comparison", cities, 200),
+            args.flood_concurrency, stop, not args.ignore_retry_after)))
+        flooder.start()
+        time.sleep(args.ramp_up)
+        report["overloaded"] = run_route(app_url, cheap, args.concurrency)
+        stop.set()
+        flooder.join()
+        return {"report": report, "flood": dict(result)}
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait(timeout=30)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200,
+                        help="Measured /get-cities-list requests per phase.")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--flood-concurrency", type=int, default=64)
+    parser.add_argument("--ramp-up", type=float, default=3,
+                        help="Seconds of flood before measuring.")
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--ignore-retry-after", action="store_true",
+                        help="Flood clients retry 429s immediately.")
+    args = parser.parse_args()
+
+    for admission in (False, True):
+        result = run_mode(args, admission)
+        print(f"\nAdmission control {'on' if admission else 'off'}:")
+        print_report({f"/get-cities-list {phase}": stats
+                      for phase, stats in result["report"].items()})
+        statuses = ", ".join(f"{status}: {count}"
+                             for status, count in sorted(result["flood"].items(), key=str))
+        print(f"/comparison flood responses: {statuses}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+CPU cost of building and serializing a /comparison payload from two rows
+read from the shared city_data cache, comparing the original path (column
+reflection, add_units per request, jsonable_encoder and json.dumps) with
+the current one (formatted blocks stored in the cache entries, rendered by
+orjson). Both paths start from the cached bytes and decode them.
+
+    python -m benchmarks.bench_serialization --iterations 5000
+"""
+import argparse
+import time
+
+from fastapi.encoders import jsonable_encoder
+from starlette.responses import JSONResponse
+
+from benchmarks.fakes import fake_city_metrics, load_fixture
+from Models.models import CityMetrics
+from utils.cache import pack, unpack
+from utils.City_Data.formatting import (
+    add_units, city_cache_entry, city_from_cache_entry, city_metrics_dict,
+    get_city_blocks,
+)
+from utils.city_score import get_city_score
+from utils.query_data import Resource
+from utils.responses import FastJSONResponse
+
+
+def build_cities() -> list[CityMetrics]:
+    return [
+        CityMetrics(
+            id=city["id"],
+            search_id=city["id"],
+            city=city["city"],
+            state_code=city["state_code"],
+            state_name=city["state_name"],
+            **fake_city_metrics(city["city"]),
+        )
+        for city in load_fixture("cities.json")
+    ]
+
+
+def build_rag_result() -> dict:
+    return {
+        "lgbtq_resources": [
+            Resource(
+                title=f"Resource {i}",
+                description="A short description of a useful local resource.",
+                strings=[f"Option {j}" for j in range(4)],
+            )
+            for i in range(6)
+        ],
+        "sources": [
+            {"id": 1000 + i, "score": 0.93, "content": "Blog title"}
+            for i in range(3)
+        ],
+        "heading": {"title": "BIG MOVE!", "description": "A move."},
+    }
+
+
+def original_path(entry_1, entry_2, result) -> bytes:
+    def model_to_dict(instance):
+        return {c.name: getattr(instance, c.name) for c in instance.__table__.columns}
+
+    city_1 = CityMetrics(**unpack(entry_1))
+    city_2 = CityMetrics(**unpack(entry_2))
+    city_1_data = model_to_dict(city_1)
+    city_2_data = model_to_dict(city_2)
+    content = {
+        **result,
+        "city_1": add_units(city_1_data),
+        "city_2": add_units(city_2_data),
+        "comparison": get_city_score(city_1_data, city_2_data),
+        "success": True,
+    }
+    return JSONResponse(jsonable_encoder(content)).body
+
+
+def fast_path(entry_1, entry_2, result) -> bytes:
+    city_1 = city_from_cache_entry(unpack(entry_1))
+    city_2 = city_from_cache_entry(unpack(entry_2))
+    city_1_data, city_1_str = get_city_blocks(city_1)
+    city_2_data, city_2_str = get_city_blocks(city_2)
+    return FastJSONResponse({
+        **result,
+        "city_1": city_1_str,
+        "city_2": city_2_str,
+        "comparison": get_city_score(city_1_data, city_2_data),
+        "success": True,
+    }).body
+
+
+def measure(func, entries, result, iterations: int) -> float:
+    start = time.perf_counter()
+    for i in range(iterations):
+        func(entries[i % len(entries)], entries[(i + 1) % len(entries)], result)
+    return (time.perf_counter() - start) / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=5000)
+    args = parser.parse_args()
+
+    cities = build_cities()
+    result = build_rag_result()
+    # The cache entries each path reads: plain column values before, and
+    # values with the formatted block now
+    original_entries = [pack(city_metrics_dict(city)) for city in cities]
+    fast_entries = [pack(city_cache_entry(city)) for city in cities]
+
+    measure(original_path, original_entries, result, 200)
+    measure(fast_path, fast_entries, result, 200)
+    original = measure(original_path, original_entries, result, args.iterations)
+    fast = measure(fast_path, fast_entries, result, args.iterations)
+
+    print(f"original path: {original * 1e6:8.1f} us/request")
+    print(f"fast path:     {fast * 1e6:8.1f} us/request")
+    print(f"saving:        {(original - fast) * 1e6:8.1f} us/request "
+          f"({(1 - fast / original) * 100:.0f}%)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Lookup cost of the read-only SQLite layer against the per-request
+SQLAlchemy session path it replaced, for the /get-cities-list search and
+the /similar_posts news lookup. Both paths run against the bundled
+CityList.db and news.db, and results are checked to match:
+
+    python -m benchmarks.bench_sqlite --iterations 2000
+"""
+import argparse
+import time
+
+from sqlalchemy import case, or_, select
+
+from benchmarks.fakes import load_fixture
+from Database.get_city_list_db import SessionLocal as CityListSession, CityMetricsQuery
+from Database.get_news_db import SessionLocal as NewsSession, News
+from Database.readonly import find_news, search_cities
+
+
+def session_search_cities(q: str) -> list[tuple]:
+    db = CityListSession()
+    try:
+        search_query = f"%{q}%"
+        cities = db.query(CityMetricsQuery).filter(
+            or_(
+                CityMetricsQuery.city.ilike(search_query),
+                CityMetricsQuery.state_name.ilike(search_query),
+                CityMetricsQuery.state_code.ilike(search_query)
+            )
+        ).order_by(
+            case(
+                (CityMetricsQuery.city.ilike(search_query), 1),
+                else_=2
+            )
+        ).limit(20).all()
+        return [(c.id, c.city, c.state_name, c.state_code) for c in cities]
+    finally:
+        db.close()
+
+
+def session_find_news(name: str) -> tuple | None:
+    db = NewsSession()
+    try:
+        news = db.execute(select(News).filter(
+            News.name.ilike(f"%{name}%"))).scalars().first()
+        return (news.id, news.name, news.url) if news else None
+    finally:
+        db.close()
+
+
+def readonly_search_cities(q: str) -> list[tuple]:
+    return [(c.id, c.city, c.state_name, c.state_code) for c in search_cities(q)]
+
+
+def readonly_find_news(name: str) -> tuple | None:
+    news = find_news(name)
+    return (news.id, news.name, news.url) if news else None
+
+
+def measure(fn, queries: list[str], iterations: int) -> float:
+    start = time.perf_counter()
+    for i in range(iterations):
+        fn(queries[i % len(queries)])
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    cities = load_fixture("cities.json")
+    city_queries = [city["city"][:4] for city in cities] + ["TX", "New"]
+    news_queries = [city["city"] for city in cities]
+
+    benchmarks = [
+        ("city search", city_queries,
+         session_search_cities, readonly_search_cities),
+        ("news lookup", news_queries, session_find_news, readonly_find_news),
+    ]
+    print(f"{'lookup':<14} {'session us':>12} {'readonly us':>12} {'speedup':>8}")
+    for name, queries, session_fn, readonly_fn in benchmarks:
+        for q in queries:
+            if session_fn(q) != readonly_fn(q):
+                raise SystemExit(f"{name}: results differ for {q!r}")
+        session_us = measure(session_fn, queries, args.iterations)
+        readonly_us = measure(readonly_fn, queries, args.iterations)
+        print(f"{name:<14} {session_us:>12.1f} {readonly_us:>12.1f} "
+              f"{session_us / readonly_us:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
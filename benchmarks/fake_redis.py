@@ -0,0 +1,112 @@
+"""
+Minimal in-memory server speaking the Redis protocol, standing in for Redis
+when running the app or benchmarks with CACHE_BACKEND=redis offline. It
+supports the commands the cache backend uses (GET, SET with EX/PX/NX, DEL,
+FLUSHDB, PING):
+
+    python -m benchmarks.fake_redis --port 6390
+    CACHE_BACKEND=redis REDIS_URL=redis://127.0.0.1:6390/0 uvicorn main:app
+"""
+import argparse
+import asyncio
+import time
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+
+    def lookup(self, key: bytes) -> bytes | None:
+        entry = self.data.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self.data[key]
+            return None
+        return value
+
+    def execute(self, args: list[bytes]):
+        command = args[0].upper()
+        if command == b"PING":
+            return "PONG"
+        if command in (b"CLIENT", b"SELECT"):
+            return "OK"
+        if command == b"GET":
+            return self.lookup(args[1])
+        if command == b"SET":
+            key, value, options = args[1], args[2], [a.upper() for a in args[3:]]
+            expires_at = None
+            if b"EX" in options:
+                expires_at = time.monotonic() + int(args[3 + options.index(b"EX") + 1])
+            if b"PX" in options:
+                expires_at = time.monotonic() + int(args[3 + options.index(b"PX") + 1]) / 1000
+            if b"NX" in options and self.lookup(key) is not None:
+                return None
+            self.data[key] = (value, expires_at)
+            return "OK"
+        if command == b"DEL":
+            return sum(self.data.pop(key, None) is not None for key in args[1:])
+        if command in (b"FLUSHDB", b"FLUSHALL"):
+            self.data.clear()
+            return "OK"
+        return Exception(f"ERR unknown command '{command.decode()}'")
+
+
+def encode(reply) -> bytes:
+    if reply is None:
+        return b"$-1\r\n"
+    if isinstance(reply, Exception):
+        return f"-{reply}\r\n".encode()
+    if isinstance(reply, str):
+        return f"+{reply}\r\n".encode()
+    if isinstance(reply, int):
+        return f":{reply}\r\n".encode()
+    return b"$%d\r\n%s\r\n" % (len(reply), reply)
+
+
+async def read_command(reader: asyncio.StreamReader) -> list[bytes] | None:
+    line = await reader.readline()
+    if not line:
+        return None
+    if not line.startswith(b"*"):
+        # Inline command, as sent by redis-cli or telnet
+        return line.split()
+    args = []
+    for _ in range(int(line[1:])):
+        size = int((await reader.readline())[1:])
+        args.append((await reader.readexactly(size + 2))[:-2])
+    return args
+
+
+def create_server(store: FakeRedis):
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while (args := await read_command(reader)) is not None:
+                if args:
+                    writer.write(encode(store.execute(args)))
+                    await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    return handle
+
+
+async def serve(host: str, port: int):
+    server = await asyncio.start_server(create_server(FakeRedis()), host, port)
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6390)
+    args = parser.parse_args()
+    asyncio.run(serve(args.host, args.port))
+
+
+if __name__ == "__main__":
+    main()
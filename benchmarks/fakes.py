@@ -0,0 +1,341 @@
+"""
+Local stand-ins for every external service the API talks to: the OpenAI
+and Perplexity chat/embedding endpoints, OpenAI's Files and Batch APIs, the
+WordPress blog API and the gayrealestate.com city pages. Run it as a module:
+
+    python -m benchmarks.fakes --port 8900 --llm-latency 0.5
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import HTMLResponse, JSONResponse, Response
+from starlette.routing import Route
+
+
+FIXTURES_PATH = os.path.join(os.path.dirname(__file__), "fixtures")
+EMBEDDING_DIMENSIONS = 1536
+
+METRIC_FIELDS = [
+    "home_price", "property_tax", "home_appreciation_rate",
+    "price_per_square_foot", "education", "healthcare_fitness",
+    "weather_grade", "air_quality_index", "commute_transit_score",
+    "accessibility", "culture_entertainment", "unemployment_rate",
+    "recent_job_growth", "future_job_growth_index",
+    "median_household_income", "state_income_tax", "utilities",
+    "food_groceries", "sales_tax", "transportation_cost",
+]
+
+
+def load_fixture(name: str):
+    with open(os.path.join(FIXTURES_PATH, name), "r") as file:
+        if name.endswith(".json"):
+            return json.load(file)
+        return file.read()
+
+
+def _seeded_vector(seed_text: str) -> np.ndarray:
+    seed = int.from_bytes(hashlib.sha256(
+        seed_text.encode()).digest()[:8], "little")
+    return np.random.default_rng(seed).standard_normal(EMBEDDING_DIMENSIONS)
+
+
+class FakeEmbeddings:
+    """
+    Deterministic embeddings keyed on the fixture city named in the text, so
+    a query about a city lands close to that city's blog titles the same way
+    the real ada-002 vectors do.
+    """
+
+    def __init__(self, cities: list[str]):
+        # Longest names first so "San Francisco" wins over "Francisco"
+        self.cities = sorted(cities, key=len, reverse=True)
+        self.generic = _seeded_vector("generic")
+
+    def embed(self, text: str) -> list[float]:
+        lowered = text.lower()
+        vector = self.generic + 0.01 * _seeded_vector(lowered)
+        for city in self.cities:
+            if city.lower() in lowered:
+                vector = vector + _seeded_vector(city)
+                break
+        else:
+            vector = vector + 0.5 * _seeded_vector(lowered)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+
+def fake_city_metrics(seed: str) -> dict:
+    rng = np.random.default_rng(
+        int.from_bytes(hashlib.sha256(seed.encode()).digest()[:8], "little"))
+    metrics = {field: round(float(rng.uniform(1, 100)), 1)
+               for field in METRIC_FIELDS}
+    metrics["home_price"] = float(int(rng.uniform(150, 1500)) * 1000)
+    metrics["median_household_income"] = float(
+        int(rng.uniform(40, 160)) * 1000)
+    metrics["property_tax"] = float(int(rng.uniform(1, 15)) * 1000)
+    metrics["price_per_square_foot"] = float(int(rng.uniform(100, 1200)))
+    return metrics
+
+
+def fake_resources(question: str) -> dict:
+    return {
+        "response": [
+            {
+                "title": title,
+                "description": f"{title} for {question[-40:]}",
+                "strings": [f"{title} option {i}" for i in range(1, 5)],
+            }
+            for title in (
+                "LGBTQ+ Health Services",
+                "LGBTQ+ Community Centers",
+                "Legal Support & Advocacy",
+                "Support & Social Groups",
+            )
+        ]
+    }
+
+
+def _usage(prompt: str, completion: str) -> dict:
+    prompt_tokens = max(1, len(prompt) // 4)
+    completion_tokens = max(1, len(completion) // 4)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+
+def chat_completion_body(body: dict) -> dict:
+    """
+    Build a chat completion for a request body, honouring structured-output
+    schemas the application asks for.
+    """
+    prompt = "\n".join(str(message.get("content", ""))
+                       for message in body.get("messages", []))
+    response_format = body.get("response_format") or {}
+    schema_name = (response_format.get("json_schema") or {}).get("name")
+
+    if schema_name == "ResourceResponse":
+        content = json.dumps(fake_resources(prompt))
+    elif schema_name == "CityMetricsSchema":
+        content = json.dumps(fake_city_metrics(prompt))
+    else:
+        content = "Here are a few friendly LGBTQ+ spots and resources nearby."
+
+    return {
+        "id": "chatcmpl-fake",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "fake"),
+        "choices": [{
+            "index": 0,
+            "finish_reason": "stop",
+            "message": {"role": "assistant", "content": content,
+                        "refusal": None},
+        }],
+        "usage": _usage(prompt, content),
+    }
+
+
+class FakeBatches:
+    """
+    In-memory Files and Batch APIs. A batch runs every request of its input
+    file through chat_completion_body after batch_latency seconds.
+    """
+
+    def __init__(self, batch_latency: float = 0.0):
+        self.batch_latency = batch_latency
+        self.files = {}
+        self.batches = {}
+        # Keeps the running batches' tasks alive
+        self.tasks = set()
+
+    def add_file(self, content: bytes, filename: str, purpose: str) -> dict:
+        file_id = f"file-{len(self.files) + 1}"
+        self.files[file_id] = {
+            "meta": {
+                "id": file_id, "object": "file", "bytes": len(content),
+                "created_at": int(time.time()), "filename": filename,
+                "purpose": purpose, "status": "processed",
+            },
+            "content": content,
+        }
+        return self.files[file_id]["meta"]
+
+    async def run(self, batch: dict):
+        await asyncio.sleep(self.batch_latency)
+        batch["status"] = "in_progress"
+        batch["in_progress_at"] = int(time.time())
+        lines = self.files[batch["input_file_id"]]["content"].decode().splitlines()
+        outputs, errors = [], []
+        for i, line in enumerate(filter(None, lines)):
+            request = json.loads(line)
+            if request.get("url") != batch["endpoint"]:
+                errors.append({
+                    "id": f"batch_req_{i}", "custom_id": request.get("custom_id"),
+                    "response": None,
+                    "error": {"code": "invalid_url",
+                              "message": f"Expected {batch['endpoint']}."},
+                })
+                continue
+            outputs.append({
+                "id": f"batch_req_{i}", "custom_id": request["custom_id"],
+                "response": {"status_code": 200, "request_id": f"req_{i}",
+                             "body": chat_completion_body(request["body"])},
+                "error": None,
+            })
+        batch["request_counts"] = {"total": len(outputs) + len(errors),
+                                   "completed": len(outputs), "failed": len(errors)}
+        for key, results in (("output_file_id", outputs), ("error_file_id", errors)):
+            if results:
+                content = "".join(json.dumps(result) + "\n" for result in results)
+                batch[key] = self.add_file(content.encode(), f"{batch['id']}_{key}.jsonl",
+                                           "batch_output")["id"]
+        batch["status"] = "completed"
+        batch["completed_at"] = int(time.time())
+
+    def create_batch(self, body: dict) -> dict:
+        batch_id = f"batch_{len(self.batches) + 1}"
+        batch = self.batches[batch_id] = {
+            "id": batch_id, "object": "batch", "endpoint": body["endpoint"],
+            "input_file_id": body["input_file_id"],
+            "completion_window": body["completion_window"],
+            "created_at": int(time.time()), "status": "validating",
+            "metadata": body.get("metadata"),
+            "request_counts": {"total": 0, "completed": 0, "failed": 0},
+            "output_file_id": None, "error_file_id": None,
+        }
+        task = asyncio.create_task(self.run(batch))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return batch
+
+
+def create_app(llm_latency: float = 0.0, embedding_latency: float = 0.0,
+               http_latency: float = 0.0, batch_latency: float = 0.0) -> Starlette:
+    cities = load_fixture("cities.json")
+    posts = {str(post["id"]): post for post in load_fixture(
+        "wordpress_posts.json")}
+    city_page = load_fixture("city_page.html")
+    embeddings = FakeEmbeddings([city["city"] for city in cities])
+    city_by_slug = {
+        city["city"].lower().replace(" ", "-"): city["city"] for city in cities
+    }
+    batches = FakeBatches(batch_latency)
+
+    async def chat_completions(request: Request):
+        body = await request.json()
+        await asyncio.sleep(llm_latency)
+        return JSONResponse(chat_completion_body(body))
+
+    async def create_embeddings(request: Request):
+        body = await request.json()
+        inputs = body["input"]
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        await asyncio.sleep(embedding_latency)
+        data = [
+            {"object": "embedding", "index": i,
+             "embedding": embeddings.embed(text)}
+            for i, text in enumerate(inputs)
+        ]
+        return JSONResponse({
+            "object": "list",
+            "data": data,
+            "model": body.get("model"),
+            "usage": {"prompt_tokens": len(inputs), "total_tokens": len(inputs)},
+        })
+
+    async def wordpress_post(request: Request):
+        await asyncio.sleep(http_latency)
+        post = posts.get(request.path_params["post_id"])
+        if post is None:
+            return JSONResponse({"code": "rest_post_invalid_id"},
+                                status_code=404)
+        return JSONResponse(post)
+
+    async def site_page(request: Request):
+        await asyncio.sleep(http_latency)
+        path = request.path_params["path"]
+        slug = os.path.basename(path).replace("-gay-realtors.html", "")
+        city = city_by_slug.get(slug, slug.replace("-", " ").title())
+        html = city_page.replace("{{city}}", city).replace("{{slug}}", slug)
+        return HTMLResponse(html)
+
+    async def upload_file(request: Request):
+        form = await request.form()
+        upload = form["file"]
+        return JSONResponse(batches.add_file(
+            await upload.read(), upload.filename, form["purpose"]))
+
+    async def retrieve_file(request: Request):
+        file = batches.files.get(request.path_params["file_id"])
+        if file is None:
+            return JSONResponse({"error": {"message": "No such file."}}, status_code=404)
+        return JSONResponse(file["meta"])
+
+    async def file_content(request: Request):
+        file = batches.files.get(request.path_params["file_id"])
+        if file is None:
+            return JSONResponse({"error": {"message": "No such file."}}, status_code=404)
+        return Response(file["content"], media_type="application/octet-stream")
+
+    async def create_batch(request: Request):
+        body = await request.json()
+        if body.get("input_file_id") not in batches.files:
+            return JSONResponse({"error": {"message": "No such file."}}, status_code=400)
+        return JSONResponse(batches.create_batch(body))
+
+    async def retrieve_batch(request: Request):
+        batch = batches.batches.get(request.path_params["batch_id"])
+        if batch is None:
+            return JSONResponse({"error": {"message": "No such batch."}}, status_code=404)
+        return JSONResponse(batch)
+
+    async def healthz(request: Request):
+        return JSONResponse({"ok": True})
+
+    return Starlette(routes=[
+        Route("/healthz", healthz),
+        Route("/v1/chat/completions", chat_completions, methods=["POST"]),
+        # Perplexity's base URL has no /v1 prefix
+        Route("/chat/completions", chat_completions, methods=["POST"]),
+        Route("/v1/embeddings", create_embeddings, methods=["POST"]),
+        Route("/v1/files", upload_file, methods=["POST"]),
+        Route("/v1/files/{file_id}", retrieve_file),
+        Route("/v1/files/{file_id}/content", file_content),
+        Route("/v1/batches", create_batch, methods=["POST"]),
+        Route("/v1/batches/{batch_id}", retrieve_batch),
+        Route("/blog/wp-json/wp/v2/posts/{post_id}", wordpress_post),
+        Route("/{path:path}", site_page),
+    ])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--llm-latency", type=float, default=0.0,
+                        help="Seconds added to every chat completion.")
+    parser.add_argument("--embedding-latency", type=float, default=0.0,
+                        help="Seconds added to every embeddings call.")
+    parser.add_argument("--http-latency", type=float, default=0.0,
+                        help="Seconds added to WordPress and site pages.")
+    parser.add_argument("--batch-latency", type=float, default=0.0,
+                        help="Seconds before a batch starts running.")
+    args = parser.parse_args()
+
+    app = create_app(args.llm_latency, args.embedding_latency,
+                     args.http_latency, args.batch_latency)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Import-time profile of the app, for tracking cold-start regressions.
+
+Runs `python -X importtime -c "import main"` in a fresh interpreter and
+reports the total import time, the slowest modules and any heavy module
+that is imported eagerly instead of on first use:
+
+    python -m benchmarks.import_profile --top 20
+    python -m benchmarks.import_profile --json out.json --baseline base.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# Modules that should only be imported when a request needs them
+HEAVY_MODULES = [
+    "selenium", "webdriver_manager", "langchain", "langchain_openai",
+    "langchain_chroma", "chromadb", "bs4", "openai",
+]
+
+
+def profile_imports(module: str = "main", runs: int = 3) -> dict:
+    """
+    Import `module` in `runs` fresh interpreters and keep the fastest run.
+    Times are cumulative microseconds per top-level import.
+    """
+    env = dict(os.environ)
+    env.setdefault("SUPABASE_DB_URL", "sqlite://")
+    env.setdefault("OPENAI_API_KEY", "benchmark")
+    env["PYTHONPATH"] = REPO_ROOT
+
+    best = None
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=REPO_ROOT, env=env, capture_output=True, text=True,
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"Importing {module} failed:\n{result.stderr}")
+
+        modules = {}
+        for line in result.stderr.splitlines():
+            if not line.startswith("import time:") or "|" not in line:
+                continue
+            _, cumulative, name = line[len("import time:"):].split("|")
+            if not cumulative.strip().isdigit():
+                continue  # header line
+            # Modules imported more than once keep their first entry
+            modules.setdefault(name.strip(), int(cumulative))
+
+        if best is None or modules.get(module, 0) < best.get(module, 0):
+            best = modules
+    return best
+
+
+def build_report(modules: dict, module: str, top: int) -> dict:
+    slowest = sorted(
+        ((name, us) for name, us in modules.items() if name != module),
+        key=lambda item: item[1], reverse=True,
+    )[:top]
+    return {
+        "total_ms": round(modules.get(module, 0) / 1000, 1),
+        "slowest": [{"module": name, "ms": round(us / 1000, 1)}
+                    for name, us in slowest],
+        "eager_heavy": sorted(
+            name for name in modules
+            if name.split(".")[0] in HEAVY_MODULES and "." not in name
+        ),
+    }
+
+
+def print_report(report: dict):
+    print(f"Total import time: {report['total_ms']}ms")
+    print(f"{'module':<50} {'ms':>8}")
+    for entry in report["slowest"]:
+        print(f"{entry['module']:<50} {entry['ms']:>8}")
+    if report["eager_heavy"]:
+        print(f"Heavy modules imported eagerly: {', '.join(report['eager_heavy'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--module", type=str, default="main",
+                        help="Module to import.")
+    parser.add_argument("--runs", type=int, default=3,
+                        help="Fresh interpreters to run; the fastest is kept.")
+    parser.add_argument("--top", type=int, default=15,
+                        help="Number of slowest modules to show.")
+    parser.add_argument("--json", type=str,
+                        help="Write the report to this JSON file.")
+    parser.add_argument("--baseline", type=str,
+                        help="Fail if the import time regresses against this report.")
+    parser.add_argument("--max-regression", type=float, default=0.25,
+                        help="Allowed fractional regression against baseline.")
+    args = parser.parse_args()
+
+    modules = profile_imports(args.module, args.runs)
+    report = build_report(modules, args.module, args.top)
+    print_report(report)
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(report, file, indent=4)
+
+    failures = [f"{name} is imported at startup" for name in report["eager_heavy"]]
+    if args.baseline:
+        with open(args.baseline, "r") as file:
+            baseline = json.load(file)
+        if report["total_ms"] > baseline["total_ms"] * (1 + args.max_regression):
+            failures.append(f"import time {report['total_ms']}ms vs baseline "
+                            f"{baseline['total_ms']}ms")
+    if failures:
+        print("Startup regressions:")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
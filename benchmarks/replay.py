@@ -0,0 +1,291 @@
+"""
+Replay captured production traffic (see TRAFFIC_CAPTURE_PATH) against the
+app and report latency per route, to compare builds on a realistic mix of
+autocomplete bursts, comparisons and chat sessions.
+
+Unless --url points at a running server, the fake external services are
+started, a temporary database is seeded with fake metrics for every city
+in the traces, and `main:app` is booted under uvicorn. Requests are sent
+at their recorded times, compressed by --speedup, and each recorded client
+keeps its own address:
+
+    python -m benchmarks.replay traffic.msgpack --speedup 10
+    python -m benchmarks.replay traffic.msgpack --json build.json --baseline main.json
+"""
+import argparse
+import json
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from benchmarks.run_benchmarks import (
+    REPO_ROOT, benchmark_env, compare_to_baseline, free_port, percentile,
+    print_report, seed, wait_until_ready,
+)
+from utils.traffic import read_traces
+
+# Recorded requests never replayed: /contact-us drives a real browser
+# against the live site
+SKIPPED_ROUTES = {"/contact-us"}
+
+CITY_PATH = re.compile(r"^/(?:city|bundle/cities)/(\d+)")
+
+SEED_CITIES_SCRIPT = """
+import sys
+from benchmarks.fakes import fake_city_metrics
+from Database.get_verified_db import SessionLocal, init_db
+from Database.readonly import get_cities
+from Models.models import CityMetrics
+
+init_db()
+db = SessionLocal()
+seeded = {id for id, in db.query(CityMetrics.search_id)}
+cities = get_cities([int(id) for id in sys.argv[1:]])
+for city in cities.values():
+    if city.id not in seeded:
+        db.add(CityMetrics(
+            search_id=city.id, city=city.city, state_code=city.state_code,
+            state_name=city.state_name, **fake_city_metrics(city.city),
+        ))
+db.commit()
+db.close()
+print(f"Seeded metrics for {len(cities.keys() - seeded)} traced cities.")
+"""
+
+
+def load_traces(args) -> list[dict]:
+    traces = [trace for path in args.traces for trace in read_traces(path)
+              if trace.get("route") not in SKIPPED_ROUTES
+              and "body_bytes" not in trace]
+    if args.routes:
+        traces = [trace for trace in traces if trace.get("route") in args.routes]
+    traces.sort(key=lambda trace: trace["ts"])
+    return traces[:args.limit] if args.limit else traces
+
+
+def traced_city_ids(traces: list[dict]) -> set[int]:
+    """
+    The city IDs the traces ask about, in /comparison bodies, batch pairs,
+    /nearby-cities and city paths.
+    """
+    ids = set()
+    for trace in traces:
+        body = trace.get("body") if isinstance(trace.get("body"), dict) else {}
+        for key in ("from_city", "to_city"):
+            if isinstance(body.get(key), dict) and isinstance(body[key].get("id"), int):
+                ids.add(body[key]["id"])
+        for pair in body.get("pairs") or []:
+            if isinstance(pair, dict):
+                ids.update(value for value in (pair.get("from_id"), pair.get("to_id"))
+                           if isinstance(value, int))
+        match = CITY_PATH.match(trace["path"])
+        if match:
+            ids.add(int(match.group(1)))
+        match = re.search(r"(?:^|&)id=(\d+)", trace.get("query", ""))
+        if match:
+            ids.add(int(match.group(1)))
+    return ids
+
+
+FILLER = "moving there next year and would like to know more about it "
+
+
+def chat_body(body: dict) -> dict:
+    """
+    A /chat request shaped like a captured one: the same roles and message
+    lengths, with the opening question written from its hash so questions
+    clients repeated are repeated here too.
+    """
+    messages, asked = [], False
+    for message in body["messages"]:
+        prefix = ""
+        if message["role"] == "user" and not asked:
+            prefix, asked = f"Question {body['question_hash']}: ", True
+        length = max(message["length"], len(prefix), 1)
+        text = (prefix + FILLER * (length // len(FILLER) + 1))[:length]
+        messages.append({"role": message["role"], "content": text})
+    return {"city": body.get("city"), "messages": messages}
+
+
+def client_address(pseudonym: str, addresses: dict) -> str:
+    if pseudonym not in addresses:
+        n = len(addresses) + 1
+        addresses[pseudonym] = f"10.{n // 65536 % 256}.{n // 256 % 256}.{n % 256}"
+    return addresses[pseudonym]
+
+
+def replay(base_url: str, traces: list[dict], speedup: float,
+           concurrency: int) -> tuple[dict, dict]:
+    """
+    Send the traces at their recorded offsets divided by speedup (0 sends
+    them back to back), with at most `concurrency` in flight. Returns the
+    per-route results and the replay's own statistics.
+    """
+    session = requests.Session()
+    session.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=concurrency))
+    results = defaultdict(list)
+    lags = []
+    mismatches = 0
+    lock = threading.Lock()
+    slots = threading.Semaphore(concurrency)
+    addresses = {}
+
+    def send(trace: dict, address: str):
+        nonlocal mismatches
+        url = base_url + trace["path"] + (f"?{trace['query']}" if trace.get("query") else "")
+        body = trace.get("body")
+        if trace.get("route") == "/chat" and isinstance(body, dict) and "question_hash" in body:
+            body = chat_body(body)
+        headers = {"X-Forwarded-For": address}
+        start = time.perf_counter()
+        try:
+            response = session.request(trace["method"], url, json=body,
+                                       headers=headers, timeout=120)
+            status = response.status_code
+        except requests.RequestException:
+            status = None
+        latency = time.perf_counter() - start
+        slots.release()
+        with lock:
+            ok = status is not None and status < 500
+            results[trace.get("route", "unmatched")].append((latency, ok))
+            if status != trace.get("status"):
+                mismatches += 1
+
+    first = traces[0]["ts"] if traces else 0
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for trace in traces:
+            due = wall_start + ((trace["ts"] - first) / speedup if speedup else 0)
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            slots.acquire()
+            lags.append(max(0.0, time.perf_counter() - due))
+            pool.submit(send, trace, client_address(trace.get("client", ""), addresses))
+    wall = time.perf_counter() - wall_start
+
+    report = {}
+    for route, route_results in sorted(results.items()):
+        latencies = sorted(latency for latency, _ in route_results)
+        report[route] = {
+            "requests": len(route_results),
+            "errors": sum(1 for _, ok in route_results if not ok),
+            "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+            "throughput_rps": round(len(route_results) / wall, 2) if wall else 0.0,
+        }
+    lags.sort()
+    stats = {
+        "requests": len(traces),
+        "seconds": round(wall, 1),
+        "recorded_seconds": round(traces[-1]["ts"] - first, 1) if traces else 0,
+        "lag_p99_ms": round(percentile(lags, 99) * 1000, 2),
+        "status_mismatches": mismatches,
+        "clients": len(addresses),
+    }
+    return report, stats
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("traces", nargs="+", help="Trace logs to replay.")
+    parser.add_argument("--speedup", type=float, default=1,
+                        help="Replay this many times faster than recorded; 0 sends "
+                             "every request as soon as a slot is free.")
+    parser.add_argument("--concurrency", type=int, default=64,
+                        help="Most requests in flight at once.")
+    parser.add_argument("--limit", type=int, help="Replay only the first N traces.")
+    parser.add_argument("--routes", nargs="+", help="Replay only these route templates.")
+    parser.add_argument("--url", type=str,
+                        help="Replay against this running server instead of booting one.")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--admission", action="store_true",
+                        help="Boot the app with admission control on.")
+    parser.add_argument("--cache", type=str, default="sqlite", choices=["sqlite", "none"])
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--embedding-latency", type=float, default=0.05)
+    parser.add_argument("--http-latency", type=float, default=0.05)
+    parser.add_argument("--json", type=str, help="Write the report to this file.")
+    parser.add_argument("--baseline", type=str,
+                        help="Fail when a route regresses against this report.")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    args = parser.parse_args()
+
+    traces = load_traces(args)
+    if not traces:
+        raise SystemExit("No traces to replay.")
+
+    workdir, processes = None, []
+    try:
+        base_url = args.url
+        if base_url is None:
+            workdir = tempfile.mkdtemp(prefix="relocation-replay-")
+            fake_port, app_port = free_port(), free_port()
+            fake_url = f"http://127.0.0.1:{fake_port}"
+            fake = subprocess.Popen([
+                sys.executable, "-m", "benchmarks.fakes", "--port", str(fake_port),
+                "--llm-latency", str(args.llm_latency),
+                "--embedding-latency", str(args.embedding_latency),
+                "--http-latency", str(args.http_latency),
+            ], cwd=REPO_ROOT)
+            processes.append(fake)
+            wait_until_ready(f"{fake_url}/healthz", fake)
+
+            env = benchmark_env(workdir, fake_url, args.cache)
+            env["ADMISSION_CONTROL"] = "1" if args.admission else "0"
+            env["WARMER_ENABLED"] = "0"
+            seed(env)
+            city_ids = traced_city_ids(traces)
+            if city_ids:
+                subprocess.run([sys.executable, "-c", SEED_CITIES_SCRIPT,
+                                *map(str, sorted(city_ids))],
+                               env=env, cwd=REPO_ROOT, check=True)
+
+            base_url = f"http://127.0.0.1:{app_port}"
+            app = subprocess.Popen([
+                sys.executable, "-m", "uvicorn", "main:app",
+                "--port", str(app_port), "--workers", str(args.workers),
+                "--log-level", "warning",
+                "--proxy-headers", "--forwarded-allow-ips", "127.0.0.1",
+            ], cwd=REPO_ROOT, env=env)
+            processes.append(app)
+            wait_until_ready(f"{base_url}/get-cities-list?q=Austin", app)
+
+        report, stats = replay(base_url, traces, args.speedup, args.concurrency)
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            process.wait(timeout=30)
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print_report(report)
+    print(f"Replayed {stats['requests']} requests from {stats['clients']} clients "
+          f"in {stats['seconds']}s (recorded over {stats['recorded_seconds']}s); "
+          f"dispatch lag p99 {stats['lag_p99_ms']}ms, "
+          f"{stats['status_mismatches']} statuses differ from the recording.")
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(report, file, indent=2)
+    if args.baseline:
+        with open(args.baseline) as file:
+            failures = compare_to_baseline(report, json.load(file), args.max_regression)
+        for failure in failures:
+            print(f"REGRESSION {failure}")
+        if failures:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+"""
+Offline latency/throughput benchmark for the public API.
+
+Boots the fake external services, seeds a temporary SQLite stand-in for
+Supabase and a temporary Chroma collection, starts `main:app` under uvicorn
+and drives the hot routes with concurrent clients:
+
+    python -m benchmarks.run_benchmarks --requests 200 --concurrency 8
+    python -m benchmarks.run_benchmarks --json out.json --baseline base.json
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from benchmarks.fakes import load_fixture
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ROUTES = ["/get-cities-list", "/comparison", "/similar_posts", "/chat"]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_ready(url: str, process: subprocess.Popen, timeout: float = 60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Process exited early while waiting for {url}")
+        try:
+            if requests.get(url, timeout=1).status_code < 500:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Timed out waiting for {url}")
+
+
+def benchmark_env(workdir: str, fake_url: str, cache_backend: str = "sqlite") -> dict:
+    env = dict(os.environ)
+    env.update({
+        "OPENAI_API_KEY": "bench",
+        "OPENAI_BASE_URL": f"{fake_url}/v1",
+        "PERPLEXITY_API_KEY": "bench",
+        "PERPLEXITY_BASE_URL": fake_url,
+        "MAIN_URL": fake_url,
+        "SUPABASE_DB_URL": f"sqlite:///{os.path.join(workdir, 'verified.db')}",
+        "CHROMA_PATH": os.path.join(workdir, "chroma"),
+        "CACHE_BACKEND": cache_backend,
+        "CACHE_PATH": os.path.join(workdir, "cache.db"),
+        # Every benchmark request comes from one address, which the
+        # per-client limits would shed; bench_overload measures them
+        "ADMISSION_CONTROL": "0",
+        # tiktoken cannot download the embedding model's encoding offline
+        "EMBEDDING_CHECK_CTX_LENGTH": "0",
+        "PYTHONPATH": REPO_ROOT,
+    })
+    return env
+
+
+SEED_SCRIPT = """
+from langchain.schema.document import Document
+from benchmarks.fakes import load_fixture, fake_city_metrics
+from populate_database import add_to_chroma
+from Database.get_verified_db import SessionLocal, init_db
+from Models.models import CityMetrics
+
+posts = load_fixture("wordpress_posts.json")
+add_to_chroma([
+    Document(page_content=post["title"]["rendered"],
+             metadata={"id": post["id"]})
+    for post in posts
+])
+
+init_db()
+db = SessionLocal()
+for city in load_fixture("cities.json"):
+    db.add(CityMetrics(
+        search_id=city["id"],
+        city=city["city"],
+        state_code=city["state_code"],
+        state_name=city["state_name"],
+        **fake_city_metrics(city["city"]),
+    ))
+db.commit()
+db.close()
+"""
+
+
+def seed(env: dict):
+    """
+    Seed the temporary Chroma collection and city metrics database. This
+    runs in a subprocess because the application modules read their
+    configuration from the environment at import time.
+    """
+    subprocess.run([sys.executable, "-c", SEED_SCRIPT],
+                   env=env, cwd=REPO_ROOT, check=True)
+
+
+def build_requests(route: str, cities: list[dict], count: int) -> list[tuple]:
+    """
+    Build (method, path, params, json) tuples for one route.
+    """
+    rng = random.Random(route)
+    calls = []
+    for _ in range(count):
+        city = rng.choice(cities)
+        if route == "/get-cities-list":
+            prefix = city["city"][:rng.randint(2, len(city["city"]))]
+            calls.append(("GET", route, {"q": prefix}, None))
+        elif route == "/comparison":
+            from_city, to_city = rng.sample(cities, 2)
+            calls.append(("POST", route, None, {
+                "from_city": {k: from_city[k] for k in
+                              ("id", "city", "state_code", "state_name")},
+                "to_city": {k: to_city[k] for k in
+                            ("id", "city", "state_code", "state_name")},
+            }))
+        elif route == "/similar_posts":
+            calls.append(("GET", route, {"city": city["news"]}, None))
+        elif route == "/chat":
+            calls.append(("POST", route, None, {
+                "messages": [{"role": "user", "content":
+                              f"Best LGBTQ+ friendly neighborhoods in {city['city']}?"}],
+                "city": city["city"],
+            }))
+    return calls
+
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1,
+                max(0, int(round(pct / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def run_route(base_url: str, calls: list[tuple], concurrency: int) -> dict:
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=concurrency)
+    session.mount("http://", adapter)
+
+    def call(spec):
+        method, path, params, body = spec
+        start = time.perf_counter()
+        try:
+            response = session.request(method, base_url + path, params=params,
+                                       json=body, timeout=120)
+            ok = response.status_code < 400
+        except requests.RequestException:
+            ok = False
+        return time.perf_counter() - start, ok
+
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(call, calls))
+    wall = time.perf_counter() - wall_start
+
+    latencies = sorted(latency for latency, _ in results)
+    errors = sum(1 for _, ok in results if not ok)
+    return {
+        "requests": len(results),
+        "errors": errors,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "throughput_rps": round(len(results) / wall, 2) if wall else 0.0,
+    }
+
+
+def print_report(report: dict):
+    print(f"{'route':<20}{'n':>6}{'err':>6}{'p50 ms':>10}{'p95 ms':>10}"
+          f"{'p99 ms':>10}{'req/s':>10}")
+    for route, stats in report.items():
+        print(f"{route:<20}{stats['requests']:>6}{stats['errors']:>6}"
+              f"{stats['p50_ms']:>10}{stats['p95_ms']:>10}"
+              f"{stats['p99_ms']:>10}{stats['throughput_rps']:>10}")
+
+
+def compare_to_baseline(report: dict, baseline: dict,
+                        max_regression: float) -> list[str]:
+    """
+    Return a message for every route whose p95 regressed past the allowed
+    fraction of the baseline, or whose throughput dropped by the same amount.
+    """
+    failures = []
+    for route, stats in report.items():
+        base = baseline.get(route)
+        if not base:
+            continue
+        if stats["p95_ms"] > base["p95_ms"] * (1 + max_regression):
+            failures.append(
+                f"{route}: p95 {stats['p95_ms']}ms vs baseline {base['p95_ms']}ms")
+        if stats["throughput_rps"] < base["throughput_rps"] * (1 - max_regression):
+            failures.append(
+                f"{route}: {stats['throughput_rps']} req/s vs baseline "
+                f"{base['throughput_rps']} req/s")
+        if stats["errors"] > base.get("errors", 0):
+            failures.append(f"{route}: {stats['errors']} errors")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=100,
+                        help="Measured requests per route.")
+    parser.add_argument("--warmup", type=int, default=5,
+                        help="Unmeasured requests per route before timing.")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--routes", nargs="+", default=ROUTES, choices=ROUTES)
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of uvicorn workers for the app.")
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--embedding-latency", type=float, default=0.05)
+    parser.add_argument("--http-latency", type=float, default=0.05)
+    parser.add_argument("--cache", type=str, default="sqlite",
+                        choices=["sqlite", "none"],
+                        help="Shared result cache backend for the app.")
+    parser.add_argument("--json", type=str,
+                        help="Write the report to this JSON file.")
+    parser.add_argument("--baseline", type=str,
+                        help="Fail if results regress against this report.")
+    parser.add_argument("--max-regression", type=float, default=0.25,
+                        help="Allowed fractional regression against baseline.")
+    parser.add_argument("--keep-workdir", action="store_true")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="relocation-bench-")
+    fake_port, app_port = free_port(), free_port()
+    fake_url = f"http://127.0.0.1:{fake_port}"
+    app_url = f"http://127.0.0.1:{app_port}"
+    processes = []
+
+    try:
+        fake = subprocess.Popen([
+            sys.executable, "-m", "benchmarks.fakes", "--port", str(fake_port),
+            "--llm-latency", str(args.llm_latency),
+            "--embedding-latency", str(args.embedding_latency),
+            "--http-latency", str(args.http_latency),
+        ], cwd=REPO_ROOT)
+        processes.append(fake)
+        wait_until_ready(f"{fake_url}/healthz", fake)
+
+        env = benchmark_env(workdir, fake_url, args.cache)
+        seed(env)
+
+        app = subprocess.Popen([
+            sys.executable, "-m", "uvicorn", "main:app",
+            "--port", str(app_port), "--workers", str(args.workers),
+            "--log-level", "warning",
+        ], cwd=REPO_ROOT, env=env)
+        processes.append(app)
+        wait_until_ready(f"{app_url}/get-cities-list?q=Austin", app)
+
+        cities = load_fixture("cities.json")
+        report = {}
+        for route in args.routes:
+            run_route(app_url, build_requests(route, cities, args.warmup),
+                      args.concurrency)
+            report[route] = run_route(
+                app_url, build_requests(route, cities, args.requests),
+                args.concurrency)
+
+        print_report(report)
+
+        if args.json:
+            with open(args.json, "w") as file:
+                json.dump(report, file, indent=4)
+
+        if args.baseline:
+            with open(args.baseline, "r") as file:
+                failures = compare_to_baseline(
+                    report, json.load(file), args.max_regression)
+            if failures:
+                print("Performance regressions:")
+                for failure in failures:
+                    print(f"  {failure}")
+                sys.exit(1)
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait(timeout=10)
+        if not args.keep_workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -21,4 +21,8 @@ fi
 
 # add your own build commands...
 
-pip install -r requirements.txt
\ No newline at end of file
+pip install -r requirements.txt
+
+# Fetch the tokenizer into TIKTOKEN_CACHE_DIR (Data/tiktoken), so the app
+# loads it from disk instead of downloading it at startup
+python -c "from utils.context_builder import get_encoding; assert get_encoding()"
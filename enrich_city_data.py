@@ -0,0 +1,205 @@
+"""
+Offline backfill of CityMetrics from Perplexity + gpt-4o-mini.
+
+Finds every CityList.db city that has no CityMetrics row, or whose row is
+older than --max-age-days, and runs the Perplexity research + parse
+pipeline for them concurrently, upserting results in batches. Progress is
+checkpointed so an interrupted run picks up where it stopped:
+
+    python enrich_city_data.py --concurrency 16 --rate 120 --batch-size 100
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from Database.get_city_list_db import SessionLocal as CityListSession, CityMetricsQuery
+from Database.get_verified_db import SessionLocal, init_db
+from Database.upsert_city_metrics import upsert_city_metrics
+from Models.models import CityMetrics
+from utils.City_Data.get_city_data import aget_city_data_from_perplexity
+from utils.City_Data.schemas import CityDetails
+from utils.rate_limit import AsyncRateLimiter
+from utils.cache import cache
+
+
+DEFAULT_CHECKPOINT = "Data/enrichment_checkpoint.jsonl"
+
+
+def find_targets(max_age_days: int) -> list[CityDetails]:
+    """
+    Cities missing from CityMetrics or last updated before the cutoff.
+    """
+    city_list_db = CityListSession()
+    try:
+        cities = city_list_db.query(
+            CityMetricsQuery.id, CityMetricsQuery.city,
+            CityMetricsQuery.state_name, CityMetricsQuery.state_code,
+        ).all()
+    finally:
+        city_list_db.close()
+
+    db = SessionLocal()
+    try:
+        updated = dict(db.query(
+            CityMetrics.search_id, CityMetrics.updated_at).all())
+    finally:
+        db.close()
+
+    cutoff = datetime.now() - timedelta(days=max_age_days)
+    return [
+        CityDetails(id=id, city=city, state_name=state_name,
+                    state_code=state_code)
+        for id, city, state_name, state_code in cities
+        if id not in updated or updated[id] is None or updated[id] < cutoff
+    ]
+
+
+def load_checkpoint(path: str, max_age_days: int) -> dict:
+    """
+    Map search_id -> last recorded status from the checkpoint file, ignoring
+    entries old enough that the city is due for a refresh again.
+    """
+    cutoff = (datetime.now() - timedelta(days=max_age_days)).isoformat()
+    done = {}
+    if os.path.exists(path):
+        with open(path, "r") as file:
+            for line in file:
+                if line.strip():
+                    entry = json.loads(line)
+                    if entry["at"] >= cutoff:
+                        done[entry["search_id"]] = entry["status"]
+    return done
+
+
+class Enricher:
+    def __init__(self, concurrency: int, rate_per_minute: float,
+                 batch_size: int, checkpoint_path: str, retries: int):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        # Two LLM calls per city; the limit applies to cities started
+        self.limiter = AsyncRateLimiter(rate_per_minute / 60.0, capacity=concurrency)
+        self.batch_size = batch_size
+        self.checkpoint_path = checkpoint_path
+        self.retries = retries
+        self.pending = []
+        self.flush_lock = asyncio.Lock()
+        self.succeeded = 0
+        self.failed = 0
+
+    def write_checkpoint(self, entries: list[dict]):
+        os.makedirs(os.path.dirname(self.checkpoint_path) or ".", exist_ok=True)
+        with open(self.checkpoint_path, "a") as file:
+            for entry in entries:
+                file.write(json.dumps(entry) + "\n")
+
+    async def flush(self):
+        async with self.flush_lock:
+            if not self.pending:
+                return
+            rows, self.pending = self.pending, []
+            await asyncio.to_thread(self._upsert, rows)
+            # Checkpoint only after the rows are committed
+            now = datetime.now().isoformat()
+            self.write_checkpoint([
+                {"search_id": row["search_id"], "status": "ok", "at": now}
+                for row in rows
+            ])
+            self.succeeded += len(rows)
+            print(f"Upserted {len(rows)} cities ({self.succeeded} done, "
+                  f"{self.failed} failed).")
+
+    @staticmethod
+    def _upsert(rows: list[dict]):
+        db = SessionLocal()
+        try:
+            upsert_city_metrics(db, rows)
+            db.commit()
+            cache.invalidate("city_data")
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    async def enrich(self, city: CityDetails):
+        async with self.semaphore:
+            for attempt in range(self.retries + 1):
+                await self.limiter.acquire()
+                try:
+                    metrics = await aget_city_data_from_perplexity(city)
+                    break
+                except Exception as e:
+                    if attempt == self.retries:
+                        self.failed += 1
+                        self.write_checkpoint([{
+                            "search_id": city.id, "status": "error",
+                            "error": str(e), "at": datetime.now().isoformat(),
+                        }])
+                        print(f"Failed {city.city}, {city.state_code}: {e}")
+                        return
+                    await asyncio.sleep(2 ** attempt)
+
+        self.pending.append({
+            "search_id": city.id,
+            "city": city.city,
+            "state_name": city.state_name,
+            "state_code": city.state_code,
+            **metrics,
+        })
+        if len(self.pending) >= self.batch_size:
+            await self.flush()
+
+    async def run(self, cities: list[CityDetails]):
+        await asyncio.gather(*(self.enrich(city) for city in cities))
+        await self.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, default=8,
+                        help="Cities processed at the same time.")
+    parser.add_argument("--rate", type=float, default=60,
+                        help="Maximum cities started per minute.")
+    parser.add_argument("--batch-size", type=int, default=50,
+                        help="Rows per upsert batch.")
+    parser.add_argument("--max-age-days", type=int, default=365,
+                        help="Refresh rows whose updated_at is older than this.")
+    parser.add_argument("--checkpoint", type=str, default=DEFAULT_CHECKPOINT)
+    parser.add_argument("--retries", type=int, default=2)
+    parser.add_argument("--retry-failed", action="store_true",
+                        help="Also retry cities that failed in earlier runs.")
+    parser.add_argument("--limit", type=int,
+                        help="Only process this many cities.")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Only report how many cities need enrichment.")
+    args = parser.parse_args()
+
+    if not init_db():
+        raise SystemExit("Could not connect to the city metrics database.")
+
+    targets = find_targets(args.max_age_days)
+    checkpoint = load_checkpoint(args.checkpoint, args.max_age_days)
+    skip = {"ok"} if args.retry_failed else {"ok", "error"}
+    targets = [city for city in targets if checkpoint.get(city.id) not in skip]
+    if args.limit:
+        targets = targets[:args.limit]
+
+    print(f"{len(targets)} cities need enrichment.")
+    if args.dry_run or not targets:
+        return
+
+    start = time.time()
+    enricher = Enricher(args.concurrency, args.rate, args.batch_size,
+                        args.checkpoint, args.retries)
+    asyncio.run(enricher.run(targets))
+    print(f"Enriched {enricher.succeeded} cities, {enricher.failed} failed, "
+          f"in {time.time() - start:.0f}s.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Render the per-city data the frontend reads into a versioned static
+bundle: a gzipped JSON shard per city (formatted metrics, national
+percentiles and, with --news, the news and realtor listings) and a compact
+autocomplete index of every city.
+
+    python export_static_bundle.py
+    python export_static_bundle.py --news --workers 8
+
+The bundle is written to STATIC_BUNDLE_DIR/<version> and made current, so
+the API serves it from /bundle right away. A partial export (--limit) or
+one run with --no-activate is written but not made current, and older
+bundles are left alone. Upload the version directory's
+cities/ and autocomplete.json.gz with `Content-Encoding: gzip` to serve it
+from a CDN instead.
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from Database.get_verified_db import SessionLocal, init_db
+from Database.readonly import city_list_db, find_news
+from Models.models import CityMetrics
+from utils.City_Data.formatting import get_city_blocks
+from utils.City_Data.percentiles import PercentileTables
+from utils.City_Data.schemas import CityDetails
+from utils.City_Data.state_fallback import state_fallback
+from utils.constants import STATIC_BUNDLE_DIR
+from utils.fetch_news import fetch_news
+from utils.static_bundle import BundleWriter, prune_bundles
+
+
+def city_news(city: str) -> dict | None:
+    news = find_news(city)
+    if news is None:
+        return None
+    try:
+        return fetch_news(news.url) or None
+    except Exception as e:
+        print(f"Could not fetch news for {city}: {e}")
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--out", type=str, default=STATIC_BUNDLE_DIR)
+    parser.add_argument("--news", action="store_true",
+                        help="Include each city's news and realtor listings.")
+    parser.add_argument("--workers", type=int, default=4,
+                        help="Concurrent page fetches with --news.")
+    parser.add_argument("--limit", type=int,
+                        help="Only export this many cities, as a trial; the "
+                             "bundle is not made current.")
+    parser.add_argument("--no-activate", action="store_true",
+                        help="Write the bundle without making it current.")
+    parser.add_argument("--keep", type=int, default=3,
+                        help="Earlier bundles kept, including the new one.")
+    args = parser.parse_args()
+
+    if not init_db():
+        raise SystemExit("Could not connect to the city metrics database.")
+    start = time.time()
+    cities = city_list_db.fetchall(
+        "SELECT id, city, state_name, state_code FROM city_metrics ORDER BY id")
+    if args.limit:
+        cities = cities[:args.limit]
+
+    db = SessionLocal()
+    try:
+        rows = {row.search_id: row for row in db.query(CityMetrics)
+                .filter(CityMetrics.search_id.isnot(None))}
+        tables = PercentileTables()
+        tables.load(db)
+    finally:
+        db.close()
+    state_fallback.load()
+
+    news = {}
+    if args.news:
+        names = sorted({city for _, city, _, _ in cities})
+        with ThreadPoolExecutor(args.workers) as pool:
+            news = dict(zip(names, pool.map(city_news, names)))
+
+    writer = BundleWriter(args.out)
+    skipped = 0
+    for id, city, state_name, state_code in cities:
+        shard = {"id": id, "city": city, "state_name": state_name,
+                 "state_code": state_code}
+        row = rows.get(id)
+        data_source = "city"
+        if row is None:
+            row = state_fallback.city_metrics_for(CityDetails(**shard))
+            data_source = "state"
+        if row is not None:
+            try:
+                raw, formatted = get_city_blocks(row)
+            except (TypeError, ValueError):
+                # Rows with missing metrics cannot be formatted
+                skipped += 1
+                raw, formatted = None, None
+            if formatted is not None:
+                shard["metrics"] = formatted
+                shard["percentiles"] = tables.profile(raw)
+                shard["data_source"] = data_source
+        if args.news:
+            shard["news"] = news.get(city)
+        writer.add_city(id, shard)
+
+    autocomplete = sorted(([id, city, state_code, state_name]
+                           for id, city, state_name, state_code in cities),
+                          key=lambda row: (row[1].lower(), row[2]))
+    # A partial bundle must never replace the served one
+    activate = not args.no_activate and not args.limit
+    version = writer.finish(autocomplete, {"news": args.news,
+                                           "exported_at": time.time()},
+                            activate=activate)
+    print(f"Exported {len(cities)} cities ({skipped} with incomplete metrics) "
+          f"as bundle {version} in {time.time() - start:.0f}s.")
+    if not activate:
+        print("Not made current; earlier bundles were kept.")
+        return
+    for removed in prune_bundles(args.out, args.keep):
+        print(f"Removed bundle {removed}.")
+
+
+if __name__ == "__main__":
+    main()
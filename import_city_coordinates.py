@@ -0,0 +1,115 @@
+"""
+Add latitude and longitude to the city list from a CSV or tab-separated
+file, such as the Census Gazetteer places file:
+
+    python import_city_coordinates.py 2023_Gaz_place_national.txt
+    python import_city_coordinates.py coordinates.csv --dry-run
+
+The file needs a city column (city or NAME), a state code column
+(state_code or USPS) and lat/lon columns (lat, latitude or INTPTLAT; lon,
+lng, longitude or INTPTLONG). Restart the app afterwards, as it opens
+CityList.db as immutable.
+"""
+import argparse
+import csv
+import re
+import sqlite3
+import unicodedata
+from Database.readonly import CITY_LIST_PATH
+
+CITY_COLUMNS = ("city", "name")
+STATE_COLUMNS = ("state_code", "usps", "state")
+LAT_COLUMNS = ("lat", "latitude", "intptlat")
+LON_COLUMNS = ("lon", "lng", "longitude", "intptlong")
+
+# Gazetteer place names end with their legal type, e.g. "Austin city"
+PLACE_SUFFIX = re.compile(
+    r"\s+(city and borough|unified government|consolidated government"
+    r"|metropolitan government|urban county|city|town|township|village"
+    r"|borough|cdp|municipality|plantation|comunidad|zona urbana)"
+    r"(\s*\(balance\))?$")
+
+
+def normalize(name: str) -> str:
+    name = unicodedata.normalize("NFKD", name.strip().lower())
+    name = "".join(c for c in name if not unicodedata.combining(c))
+    name = PLACE_SUFFIX.sub("", name)
+    name = re.sub(r"\bst\.?\s", "saint ", name)
+    return re.sub(r"[^a-z0-9]+", " ", name).strip()
+
+
+def find_column(fieldnames: list[str], candidates: tuple) -> str:
+    by_name = {name.strip().lower(): name for name in fieldnames}
+    for candidate in candidates:
+        if candidate in by_name:
+            return by_name[candidate]
+    raise SystemExit(f"No column named any of {', '.join(candidates)}.")
+
+
+def read_coordinates(path: str) -> dict:
+    """
+    (normalized city, state code) -> (lat, lon). The first row wins when a
+    name appears twice in a state.
+    """
+    with open(path, newline="", encoding="utf-8-sig") as file:
+        dialect = csv.Sniffer().sniff(file.read(4096), delimiters=",\t")
+        file.seek(0)
+        reader = csv.DictReader(file, dialect=dialect)
+        city = find_column(reader.fieldnames, CITY_COLUMNS)
+        state = find_column(reader.fieldnames, STATE_COLUMNS)
+        lat = find_column(reader.fieldnames, LAT_COLUMNS)
+        lon = find_column(reader.fieldnames, LON_COLUMNS)
+        coordinates = {}
+        for row in reader:
+            try:
+                point = (float(row[lat]), float(row[lon]))
+            except (TypeError, ValueError):
+                continue
+            key = (normalize(row[city]), row[state].strip().upper())
+            coordinates.setdefault(key, point)
+    return coordinates
+
+
+def ensure_columns(conn: sqlite3.Connection):
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(city_metrics)")}
+    for column in ("lat", "lon"):
+        if column not in columns:
+            conn.execute(f"ALTER TABLE city_metrics ADD COLUMN {column} REAL")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("path", type=str, help="CSV or tab-separated coordinates file.")
+    parser.add_argument("--db", type=str, default=CITY_LIST_PATH)
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Report matches without writing them.")
+    args = parser.parse_args()
+
+    coordinates = read_coordinates(args.path)
+    conn = sqlite3.connect(args.db)
+    try:
+        cities = conn.execute(
+            "SELECT id, city, state_code FROM city_metrics").fetchall()
+        updates, unmatched = [], []
+        for id, city, state_code in cities:
+            point = coordinates.get((normalize(city), (state_code or "").upper()))
+            if point is None:
+                unmatched.append(f"{city}, {state_code}")
+            else:
+                updates.append((*point, id))
+
+        print(f"Matched {len(updates)} of {len(cities)} cities.")
+        for name in unmatched[:10]:
+            print(f"  no coordinates for {name}")
+
+        if not args.dry_run:
+            with conn:
+                ensure_columns(conn)
+                conn.executemany(
+                    "UPDATE city_metrics SET lat = ?, lon = ? WHERE id = ?", updates)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Bulk import of city metrics from a CSV or Parquet file:
+
+    python import_city_metrics.py merged.csv
+    python import_city_metrics.py metrics.parquet --report errors.json
+"""
+import argparse
+import json
+import os
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from Database.get_verified_db import SessionLocal, init_db
+from utils.City_Data.bulk_import import import_city_metrics
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("path", type=str, help="CSV or Parquet file to import.")
+    parser.add_argument("--format", type=str, choices=["csv", "parquet"],
+                        help="File format; defaults to the file extension.")
+    parser.add_argument("--chunk-size", type=int, default=5000,
+                        help="Rows validated and upserted per batch.")
+    parser.add_argument("--report", type=str,
+                        help="Write the per-row error report to this JSON file.")
+    args = parser.parse_args()
+
+    file_format = args.format or os.path.splitext(args.path)[1].lstrip(".").lower()
+    if not init_db():
+        raise SystemExit("Could not connect to the city metrics database.")
+
+    start = time.time()
+    db = SessionLocal()
+    try:
+        with open(args.path, "rb") as file:
+            report = import_city_metrics(db, file, file_format, args.chunk_size)
+    finally:
+        db.close()
+
+    print(f"Imported {report['imported']} of {report['rows']} rows in "
+          f"{time.time() - start:.1f}s, {report['failed']} rejected.")
+    for error in report["errors"][:10]:
+        print(f"  row {error['row']}: {'; '.join(error['errors'])}")
+
+    if args.report:
+        with open(args.report, "w") as file:
+            json.dump(report, file, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,63 @@
+from dotenv import load_dotenv
+
+# Settings in utils/constants.py are read when the project modules are
+# imported, so .env has to be loaded first
+load_dotenv()
+
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from dotenv import load_dotenv
-import os
-import openai
+from fastapi.middleware.gzip import GZipMiddleware
+import asyncio
 from routers.app import api_router
+from Database.get_verified_db import init_db
+from utils.metrics import MetricsMiddleware
+from utils.http_cache import HTTPCacheMiddleware, GZIP_LEVEL, GZIP_MINIMUM_SIZE
+from utils.admission import AdmissionControlMiddleware
+from utils.profiling import ProfilingMiddleware
+from utils.constants import ADMISSION_CONTROL, TRAFFIC_CAPTURE_PATH, WARMER_ENABLED
+from utils.traffic import TrafficCaptureMiddleware
+from utils.warmer import warmer
+from utils.responses import FastJSONResponse
+from utils.City_Data.state_fallback import state_fallback
+from utils.City_Data.percentiles import load_percentile_tables, refresh_percentile_tables
+from utils.context_builder import get_encoding
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Connect and check the schema at startup instead of at import time; if
+    # the database is down, requests that need it retry and return 503
+    if await asyncio.to_thread(init_db):
+        await asyncio.to_thread(load_percentile_tables)
+    else:
+        print("City metrics database unavailable at startup.")
+    # Already loaded when serve.py preloaded it before forking this worker
+    if state_fallback.signature is None:
+        await asyncio.to_thread(state_fallback.load)
+    # Loaded before serving, so no request waits for the tokenizer
+    await asyncio.to_thread(get_encoding)
+    warming = asyncio.create_task(warmer.run()) if WARMER_ENABLED else None
+    refreshing = asyncio.create_task(refresh_percentile_tables())
+    yield
+    refreshing.cancel()
+    if warming is not None:
+        warming.cancel()
+        # Keep this worker's request counts for the next start
+        await asyncio.to_thread(warmer.flush)
 
-load_dotenv()
 
-openai.api_key = os.getenv("OPENAI_API_KEY")
+app = FastAPI(default_response_class=FastJSONResponse, lifespan=lifespan)
 
-app = FastAPI()
+# Innermost, so profiles only cover requests that reach a handler
+app.add_middleware(ProfilingMiddleware)
+
+# Inside CORS so 304 responses still carry the CORS headers
+app.add_middleware(HTTPCacheMiddleware)
+
+# Concurrency pools and per-client limits for the LLM and browser routes
+if ADMISSION_CONTROL:
+    app.add_middleware(AdmissionControlMiddleware)
 
 app.add_middleware(
     CORSMiddleware,
@@ -19,4 +67,17 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compresses large responses from routes without a cache policy
+app.add_middleware(
+    GZipMiddleware,
+    minimum_size=GZIP_MINIMUM_SIZE,
+    compresslevel=GZIP_LEVEL,
+)
+
+app.add_middleware(MetricsMiddleware)
+
+# Outermost, so traces time what clients see, including shed requests
+if TRAFFIC_CAPTURE_PATH:
+    app.add_middleware(TrafficCaptureMiddleware)
+
 app.include_router(api_router)
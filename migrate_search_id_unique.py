@@ -0,0 +1,60 @@
+"""
+One-off migration adding the unique index on city_metrics.search_id that
+the upserts of the enrichment, import and batch jobs rely on. Tables
+created before the index existed may hold several rows per search_id; all
+but the most recently updated are deleted first:
+
+    python migrate_search_id_unique.py --dry-run
+    python migrate_search_id_unique.py
+"""
+import argparse
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from sqlalchemy import bindparam, text
+from Database.get_verified_db import get_engine, init_db
+from Database.upsert_city_metrics import ensure_search_id_unique
+
+# Every row but the newest of each search_id, in both Postgres and SQLite
+DUPLICATES = """
+SELECT id, search_id FROM (
+    SELECT id, search_id, ROW_NUMBER() OVER (
+        PARTITION BY search_id ORDER BY updated_at DESC NULLS LAST, id DESC
+    ) AS rank
+    FROM city_metrics
+    WHERE search_id IS NOT NULL
+) ranked
+WHERE rank > 1
+"""
+DELETE = text("DELETE FROM city_metrics WHERE id IN :ids").bindparams(
+    bindparam("ids", expanding=True))
+DELETE_BATCH_SIZE = 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Report the duplicates without changing anything.")
+    args = parser.parse_args()
+
+    if not init_db():
+        raise SystemExit("Could not connect to the city metrics database.")
+
+    with get_engine().begin() as connection:
+        duplicates = connection.execute(text(DUPLICATES)).all()
+        search_ids = {search_id for _, search_id in duplicates}
+        print(f"Found {len(duplicates)} duplicate rows for {len(search_ids)} cities.")
+        if args.dry_run:
+            for search_id in sorted(search_ids)[:20]:
+                print(f"  search_id {search_id}")
+            return
+        ids = [id for id, _ in duplicates]
+        for i in range(0, len(ids), DELETE_BATCH_SIZE):
+            connection.execute(DELETE, {"ids": ids[i:i + DELETE_BATCH_SIZE]})
+        ensure_search_id_unique(connection)
+    print("Created the unique index on city_metrics.search_id.")
+
+
+if __name__ == "__main__":
+    main()
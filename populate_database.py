@@ -1,18 +1,25 @@
 import argparse
 import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
 import openai
 from langchain.schema.document import Document
 from utils.get_embedding_function import get_embedding_function
 from langchain_chroma import Chroma
-from dotenv import load_dotenv
 from utils.load_documents import load_documents, load_news
-from utils.constants import BLOGS_COLLECTION, NEWS_COLLECTION
+from utils.constants import (
+    CHROMA_PATH, BLOGS_COLLECTION, NEWS_COLLECTION, LEXICAL_INDEX_PATH,
+    BLOG_SUMMARIES_PATH,
+)
+from utils.lexical_index import LexicalIndex
+from utils.blog_summaries import BlogSummaries, summarize_blogs
+from utils.cache import cache
 
-load_dotenv()
 openai.api_key = os.getenv("OPENAI_API_KEY")
 
 # Constants
-CHROMA_PATH = "chroma"
 DATA_PATH = "Data/Blogs"
 
 
@@ -23,20 +30,59 @@ def main():
                         help="Reset the database.")
     parser.add_argument("--query", type=str,
                         help="Query to search for relevant documents.")
+    # HNSW settings only apply when the collection is created, so changing
+    # them needs --reset. query_rag's 0.9 relevance cutoff assumes l2.
+    parser.add_argument("--hnsw-space", type=str, default="l2",
+                        choices=["l2", "cosine", "ip"])
+    parser.add_argument("--hnsw-m", type=int, default=16,
+                        help="Links per node in the HNSW graph.")
+    parser.add_argument("--hnsw-construction-ef", type=int, default=100,
+                        help="Candidate list size while building the index.")
+    parser.add_argument("--hnsw-search-ef", type=int, default=10,
+                        help="Candidate list size while searching.")
+    args = parser.parse_args()
+
+    metadata = hnsw_metadata(args.hnsw_space, args.hnsw_m,
+                             args.hnsw_construction_ef, args.hnsw_search_ef)
+    if args.reset:
+        reset_collection(BLOGS_COLLECTION)
 
     for file in os.listdir(DATA_PATH):
         documents = load_documents(file)
-        add_to_chroma(documents)
+        add_to_chroma(documents, metadata)
 
 
-def add_to_chroma(documents: list[Document]):
+def hnsw_metadata(space: str = "l2", m: int = 16, construction_ef: int = 100,
+                  search_ef: int = 10) -> dict:
     """
-    Add documents to the Chroma database.
+    Collection metadata configuring Chroma's HNSW index.
+    """
+    return {
+        "hnsw:space": space,
+        "hnsw:M": m,
+        "hnsw:construction_ef": construction_ef,
+        "hnsw:search_ef": search_ef,
+    }
+
+
+def reset_collection(collection_name: str):
+    print(f"Deleting collection {collection_name}...")
+    Chroma(
+        persist_directory=CHROMA_PATH, embedding_function=get_embedding_function(),
+        collection_name=collection_name
+    ).delete_collection()
+
+
+def add_to_chroma(documents: list[Document], collection_metadata: dict = None):
+    """
+    Add documents to the Chroma database. collection_metadata is only used
+    when the collection does not exist yet.
     """
     # Load or create the Chroma database
     db = Chroma(
         persist_directory=CHROMA_PATH, embedding_function=get_embedding_function(),
-        collection_name=BLOGS_COLLECTION
+        collection_name=BLOGS_COLLECTION,
+        collection_metadata=collection_metadata or hnsw_metadata(),
     )
 
     existing_items = db.get(include=[])  # IDs are always included by default
@@ -48,7 +94,41 @@ def add_to_chroma(documents: list[Document]):
         doc for doc in documents if doc.metadata["id"] not in existing_ids]
 
     print(f"Adding {len(new_documents)} new documents to the database...")
-    db.add_documents(new_documents)
+    if new_documents:
+        db.add_documents(new_documents)
+    build_lexical_index(db)
+    build_blog_summaries(db)
+    # Cached resources were built from the old collection
+    cache.invalidate("rag")
+
+
+def build_lexical_index(db: Chroma):
+    """
+    Rebuild the BM25 index over every title in the collection, so
+    query_rag can find posts naming a city without an embedding call.
+    """
+    items = db.get(include=["documents", "metadatas"])
+    ids = [metadata.get("id", "unknown") for metadata in items["metadatas"]]
+    LexicalIndex(ids, items["documents"]).save()
+    print(f"Indexed {len(ids)} titles in {LEXICAL_INDEX_PATH}.")
+
+
+def build_blog_summaries(db: Chroma):
+    """
+    Summarize every post in the collection not summarized yet, so query_rag
+    puts a few sentences per post in its prompt instead of whole posts.
+    """
+    try:
+        summaries = BlogSummaries.load()
+    except FileNotFoundError:
+        summaries = BlogSummaries()
+    ids = [metadata.get("id", "unknown")
+           for metadata in db.get(include=["metadatas"])["metadatas"]]
+    existing = len(summaries)
+    summarize_blogs([id for id in ids if id != "unknown"], summaries)
+    summaries.save()
+    print(f"Summarized {len(summaries) - existing} new posts "
+          f"({len(summaries)} in {BLOG_SUMMARIES_PATH}).")
 
 
 def add_news_to_chroma():
@@ -1,27 +1,44 @@
-import openai
-from fastapi import APIRouter, Depends, Query, HTTPException
-from sqlalchemy.future import select
-from sqlalchemy import or_, case
-from sqlalchemy.ext.asyncio import AsyncSession
+import os
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
+import numpy as np
+from fastapi import APIRouter, Depends, Query, HTTPException, Request, UploadFile, File
+from fastapi.responses import PlainTextResponse
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from typing import Optional, List
 from utils.query_data import query_rag
-from utils.city_score import get_city_score
+from utils.city_score import SCORE_FIELDS, get_city_score, get_city_scores
 from utils.fetch_news import fetch_news
 from utils.City_Data.get_city_data import get_city_data
-from Database.get_news_db import get_news_db, News
-from Database.get_verified_db import get_verified_db
-from Database.get_city_list_db import get_city_list_db, CityMetricsQuery
-from utils.constants import MAIN_URL
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
+from utils.City_Data.formatting import get_city_blocks
+from utils.City_Data.state_fallback import is_state_fallback, state_fallback
+from utils.City_Data.bulk_import import METRIC_FIELDS, import_city_metrics
+from utils.City_Data.percentiles import percentile_tables
+from utils.admin import require_admin
+from utils.profiling import list_profiles, profiled, read_profile
+from utils.warmer import warmer
+from utils.chat_cache import chat_cache, is_cacheable
+from utils.static_bundle import bundle_response, get_bundle
+from utils.geo import city_index, move_heading
+from Database.get_verified_db import get_verified_db, verified_session
+from Database.readonly import search_cities, find_news, get_city, get_cities
+from utils.constants import (
+    COMPARISON_DEADLINE_SECONDS, MAIN_URL, RESOURCES_DEADLINE_SECONDS,
+)
+from utils.deadline import BoundedExecutor, Deadline, deadline, submit
 from Models.models import CityMetrics
+from utils.metrics import DEADLINE_EXCEEDED, timed, record_llm_usage, render_prometheus
+from utils.responses import FastJSONResponse, NDJSONResponse
+from utils.lazy import lazy_import, lazy_object
+
+# Heavy client libraries are only imported when a route first needs them
+openai = lazy_import("openai")
+webdriver = lazy_import("selenium.webdriver")
+By = lazy_object(lambda: lazy_import("selenium.webdriver.common.by").By)
+WebDriverWait = lazy_object(
+    lambda: lazy_import("selenium.webdriver.support.ui").WebDriverWait)
+EC = lazy_import("selenium.webdriver.support.expected_conditions")
 
 # Create the router
 api_router = APIRouter()
@@ -32,36 +49,20 @@ async def get_items_list(
     q: str = Query(
         None, description="City name and state name to search"
     ),
-    db: Session = Depends(get_city_list_db),
 ):
-    print(q)
     if not q or not q.strip():
         raise HTTPException(status_code=400, detail="Search term is required.")
 
-    search_query = f"%{q.strip()}%"
-    query = db.query(CityMetricsQuery).filter(
-        or_(
-            CityMetricsQuery.city.ilike(search_query),
-            CityMetricsQuery.state_name.ilike(search_query),
-            CityMetricsQuery.state_code.ilike(search_query)
-        )
-    ).order_by(
-        case(
-            (CityMetricsQuery.city.ilike(search_query), 1),
-            else_=2
-        )
-    ).limit(20)
-
-    cities = query.all()
+    cities = search_cities(q.strip(), limit=20)
 
     if not cities:
-        return {
+        return FastJSONResponse({
             "results": [],
             "success": False,
             "message": "No matching cities found.",
-        }
+        })
 
-    return {
+    return FastJSONResponse({
         "results": [
             {
                 "id": city.id,
@@ -73,7 +74,7 @@ async def get_items_list(
             for city in cities
         ],
         "success": True,
-    }
+    })
 
 
 # Pydantic models for request validation
@@ -89,109 +90,355 @@ class QueryRequest(BaseModel):
     to_city: Optional[CityRequest] = None
 
 
+# Threads generating /comparison resources, including those still running
+# after their response went out, and the most jobs queued or running; past
+# that, comparisons go out without resources
+RESOURCE_WORKERS = 16
+MAX_PENDING_RESOURCES = 64
+resources_pool = BoundedExecutor(RESOURCE_WORKERS, MAX_PENDING_RESOURCES, "resources")
+
+
+def request_deadline():
+    if COMPARISON_DEADLINE_SECONDS <= 0:
+        return nullcontext()
+    return deadline(COMPARISON_DEADLINE_SECONDS)
+
+
+def wait_for_resources(future: Future | None, budget: Deadline | None) -> dict:
+    """
+    The query_rag result, or a degraded result without resources once the
+    budget runs out, if it failed, or if the pool was full (future is None).
+    resources_pending tells clients the resources are still being generated
+    and will be cached shortly.
+    """
+    if future is None:
+        # The pool was full, so no resources are being generated
+        DEADLINE_EXCEEDED.inc(stage="resources_queue")
+        return {"resources_pending": False, "degraded": True}
+    try:
+        result = future.result(timeout=budget.remaining() if budget else None)
+        return {**result, "resources_pending": False, "degraded": False}
+    except Exception as e:
+        pending = not future.done()
+        if pending:
+            DEADLINE_EXCEEDED.inc(stage="comparison_resources")
+        else:
+            print(f"Could not generate resources: {e}")
+        return {"resources_pending": pending, "degraded": True}
+
+
 @api_router.post("/comparison")
-async def handle_query(request: QueryRequest, db: Session = Depends(get_verified_db)):
+@profiled
+def handle_query(request: QueryRequest, db: Session = Depends(get_verified_db)):
     """
     Compare metrics between two cities.
     """
 
-    def model_to_dict(instance):
-        return {c.name: getattr(instance, c.name) for c in instance.__table__.columns}
-
-    def add_units(city_data):
-        city = {
-            "accessibility": str(int(city_data["accessibility"])),
-            "air_quality_index": str(int(city_data["air_quality_index"])),
-            "city": city_data["city"],
-            "commute_transit_score": str(int(city_data["commute_transit_score"])),
-            "culture_entertainment": str(int(city_data["culture_entertainment"])),
-            "education": str(int(city_data["education"])),
-            "food_groceries": str(int(city_data["food_groceries"])),
-            "future_job_growth_index": f'{city_data["future_job_growth_index"]}%',
-            "healthcare_fitness": str(int(city_data["healthcare_fitness"])),
-            "home_appreciation_rate": f"{city_data['home_appreciation_rate']}%",
-            "home_price": f"${city_data['home_price']:,}",
-            "median_household_income": f"${city_data['median_household_income']:,}",
-            "price_per_square_foot": f"${city_data['price_per_square_foot']:,}",
-            "property_tax": f"${city_data['property_tax']:,}",
-            "recent_job_growth": f'{city_data["recent_job_growth"]}%',
-            "sales_tax": f"{city_data['sales_tax']}%",
-            "state_code": city_data["state_code"],
-            "state_income_tax": f"{city_data['state_income_tax']}%",
-            "state_name": city_data["state_name"],
-            "transportation_cost": str(int(city_data["transportation_cost"])),
-            "unemployment_rate": f"{city_data['unemployment_rate']}%",
-            "utilities": str(int(city_data["utilities"])),
-            "weather_grade": str(int(city_data["weather_grade"])),
-        }
-
-        return city
-
     # Validate input
     if not request.from_city or not request.to_city:
         raise HTTPException(
             status_code=400, detail="Both from_city and to_city are required."
         )
 
-    # Fetch result from RAG function
-    # result = {}
-    result = query_rag(request.from_city.city, request.to_city.city)
-    result["heading"] = {
-        "title": "BIG MOVE!",
-        "description": f"A move from {request.from_city.city} to {request.to_city.city} covers a significant distance. This move would bring substantial changes in cost of living, climate, and urban environment.",
-    }
+    warmer.record_comparison(request.from_city.id, request.to_city.id)
 
-    city_1_data = get_city_data(request.from_city, db)
-    city_2_data = get_city_data(request.to_city, db)
-    # db.commit()
-    # db.refresh(city_1_data)
-    # db.refresh(city_2_data)
+    # Resources are generated alongside the metrics lookups, and keep going
+    # in the background if they miss the response's deadline
+    resources = submit(resources_pool, RESOURCES_DEADLINE_SECONDS,
+                       profiled(query_rag), request.from_city.city, request.to_city.city,
+                       request.to_city.state_code)
 
-    city_1_data = model_to_dict(city_1_data)
-    city_2_data = model_to_dict(city_2_data)
+    with request_deadline() as budget:
+        city_1 = get_city_data(request.from_city, db)
+        city_2 = get_city_data(request.to_city, db)
 
-    city_1_str = add_units(city_1_data)
-    city_2_str = add_units(city_2_data)
+        # Check if city data exists
+        if not city_1 or not city_2:
+            raise HTTPException(
+                status_code=404, detail="City data not found for one or both cities."
+            )
 
-    # Check if city data exists
-    if not city_1_data or not city_2_data:
-        raise HTTPException(
-            status_code=404, detail="City data not found for one or both cities."
-        )
+        # Formatted blocks come with the rows from the shared cache
+        city_1_data, city_1_str = get_city_blocks(city_1)
+        city_2_data, city_2_str = get_city_blocks(city_2)
 
-    return {
+        result = wait_for_resources(resources, budget)
+    result["heading"] = move_heading(request.from_city, request.to_city)
+
+    return FastJSONResponse({
         **result,
         "city_1": city_1_str,
         "city_2": city_2_str,
         "comparison": get_city_score(city_1_data, city_2_data),
+        "percentiles": {
+            "city_1": percentile_tables.profile(city_1_data),
+            "city_2": percentile_tables.profile(city_2_data),
+        },
+        "data_source": {
+            "city_1": "state" if is_state_fallback(city_1) else "city",
+            "city_2": "state" if is_state_fallback(city_2) else "city",
+        },
         "success": True,
-    }
+    })
+
+
+# Pairs per /comparison/batch request, and the most that may also ask for
+# generated resources, each of which is an LLM call
+MAX_BATCH_PAIRS = 500
+MAX_BATCH_RESOURCE_PAIRS = 20
+# query_rag calls run at once for one batch request
+BATCH_RESOURCE_WORKERS = 4
+
+
+class PairRequest(BaseModel):
+    from_id: int
+    to_id: int
+
+
+class BatchComparisonRequest(BaseModel):
+    pairs: List[PairRequest]
+    include_resources: bool = False
+
+
+def load_score_values(cities: dict, db: Session) -> dict:
+    """
+    The SCORE_FIELDS values and data source of each city, from one IN query
+    on CityMetrics, with state-level data for cities without a row.
+    """
+    with timed("city_data_batch_query"):
+        rows = db.query(
+            CityMetrics.search_id, *(getattr(CityMetrics, field) for field in SCORE_FIELDS)
+        ).filter(CityMetrics.search_id.in_(list(cities))).all()
+    values = {row[0]: (tuple(row[1:]), "city") for row in rows}
+    for id, city in cities.items():
+        if id not in values:
+            fallback = state_fallback.city_metrics_for(city)
+            if fallback is not None:
+                values[id] = (tuple(getattr(fallback, field) for field in SCORE_FIELDS), "state")
+    return values
+
+
+def stream_resources(pairs: list, cities: dict):
+    """
+    query_rag for each pair, yielded as each finishes.
+    """
+    pool = ThreadPoolExecutor(BATCH_RESOURCE_WORKERS)
+    try:
+        futures = {}
+        for i, pair in enumerate(pairs):
+            if pair.from_id in cities and pair.to_id in cities:
+                to_city = cities[pair.to_id]
+                future = pool.submit(query_rag, cities[pair.from_id].city,
+                                     to_city.city, to_city.state_code)
+                futures[future] = i
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                yield {"type": "error", "index": i, "detail": f"Resources failed: {e}"}
+                continue
+            yield {"type": "resources", "index": i, **result}
+    finally:
+        # A client that disconnects does not wait for the queued calls
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+@api_router.post("/comparison/batch")
+def compare_batch(request: BatchComparisonRequest, db: Session = Depends(get_verified_db)):
+    """
+    Score many city pairs in one pass, streamed back as NDJSON: a
+    "comparison" line per pair, then with include_resources a "resources"
+    line per pair as each is generated. Lines carry the pair's index in the
+    request; pairs that cannot be scored get an "error" line.
+    """
+    if not request.pairs:
+        raise HTTPException(status_code=400, detail="At least one pair is required.")
+    if len(request.pairs) > MAX_BATCH_PAIRS:
+        raise HTTPException(status_code=400,
+                            detail=f"At most {MAX_BATCH_PAIRS} pairs per request.")
+    if request.include_resources and len(request.pairs) > MAX_BATCH_RESOURCE_PAIRS:
+        raise HTTPException(status_code=400, detail=(
+            f"At most {MAX_BATCH_RESOURCE_PAIRS} pairs per request with resources."))
+
+    pairs = request.pairs
+    cities = get_cities(sorted({id for pair in pairs for id in (pair.from_id, pair.to_id)}))
+    values = load_score_values(cities, db)
+    scored = [i for i, pair in enumerate(pairs)
+              if pair.from_id in values and pair.to_id in values]
+    origins = np.array([values[pairs[i].from_id][0] for i in scored], dtype=float)
+    destinations = np.array([values[pairs[i].to_id][0] for i in scored], dtype=float)
+    scores = dict(zip(scored, get_city_scores(
+        origins.reshape(-1, len(SCORE_FIELDS)), destinations.reshape(-1, len(SCORE_FIELDS)))))
+
+    def results():
+        for i, pair in enumerate(pairs):
+            score = scores.get(i)
+            if score is None:
+                detail = ("City data not found." if i not in scores
+                          else "City data is incomplete.")
+                yield {"type": "error", "index": i, "detail": detail}
+                continue
+            yield {
+                "type": "comparison",
+                "index": i,
+                "from_id": pair.from_id,
+                "to_id": pair.to_id,
+                "comparison": score,
+                "data_source": {
+                    "city_1": values[pair.from_id][1],
+                    "city_2": values[pair.to_id][1],
+                },
+            }
+        if request.include_resources:
+            yield from stream_resources(pairs, cities)
+
+    return NDJSONResponse(results())
+
+
+@api_router.get("/city/{id}/profile")
+@profiled
+def city_profile(id: int, db: Session = Depends(get_verified_db)):
+    """
+    A city's metrics and where each stands among all cities.
+    """
+    city = get_city(id)
+    if city is None:
+        raise HTTPException(status_code=404, detail="City not found.")
+    city_data = get_city_data(city, db)
+    if not city_data:
+        raise HTTPException(status_code=404, detail="City data not found.")
+
+    raw, formatted = get_city_blocks(city_data)
+    return FastJSONResponse({
+        "city": formatted,
+        "percentiles": percentile_tables.profile(raw),
+        "data_source": "state" if is_state_fallback(city_data) else "city",
+        "success": True,
+    })
+
+
+@api_router.get("/bundle/cities/{id}")
+async def bundle_city(id: int, request: Request):
+    """
+    A city's shard from the exported static bundle.
+    """
+    bundle = get_bundle()
+    data = bundle.city(id) if bundle is not None else None
+    if data is None:
+        raise HTTPException(status_code=404, detail="City not found in the bundle.")
+    return bundle_response(request.headers, bundle, f"cities/{id}", data)
+
+
+@api_router.get("/bundle/autocomplete")
+async def bundle_autocomplete(request: Request):
+    """
+    Every city as [id, city, state_code, state_name], from the exported
+    static bundle.
+    """
+    bundle = get_bundle()
+    if bundle is None:
+        raise HTTPException(status_code=404, detail="No bundle has been exported.")
+    return bundle_response(request.headers, bundle, "autocomplete", bundle.autocomplete)
 
 
 @api_router.get("/similar_posts")
-async def get_similar_posts(
+@profiled
+def get_similar_posts(
     city: Optional[str] = Query(
         None, description="Search term to find similar posts"
     ),
-    db: AsyncSession = Depends(get_news_db),
 ):
-    results = db.execute(select(News).filter(
-        News.name.ilike(f"%{city}%"))).scalars().all()[0]
-
-    def serialize_news(news):
-        return {
-            "id": news.id,
-            "name": news.name,
-            "url": news.url,  # Add other attributes as needed
-        }
+    news = find_news(city)
+    if news is None:
+        raise HTTPException(status_code=404, detail="No news found for this city.")
+    warmer.record_news(city)
 
-    results = serialize_news(results)
-    results = fetch_news(results["url"])
+    results = fetch_news(news.url)
 
-    return {
+    return FastJSONResponse({
         "results": results,
         "success": True,
-    }
+    })
+
+
+def metric_filters(params) -> list:
+    """
+    SQLAlchemy conditions from min_<metric> and max_<metric> parameters.
+    """
+    conditions = []
+    for name, value in params.items():
+        bound, _, field = name.partition("_")
+        if bound not in ("min", "max") or not field:
+            continue
+        if field not in METRIC_FIELDS:
+            raise HTTPException(status_code=400, detail=f"Unknown metric: {field}.")
+        try:
+            value = float(value)
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"{name} must be a number.")
+        column = getattr(CityMetrics, field)
+        conditions.append(column >= value if bound == "min" else column <= value)
+    return conditions
+
+
+@api_router.get("/nearby-cities")
+def nearby_cities(
+    request: Request,
+    id: Optional[int] = Query(None, description="City to search around"),
+    lat: Optional[float] = Query(None, ge=-90, le=90),
+    lon: Optional[float] = Query(None, ge=-180, le=180),
+    k: int = Query(10, ge=1, le=100, description="Maximum number of cities"),
+    radius_miles: Optional[float] = Query(None, gt=0),
+):
+    """
+    Cities nearest to a city or a point, nearest first, optionally within
+    radius_miles and filtered on city metrics with min_<metric> and
+    max_<metric> parameters (e.g. max_home_price=400000).
+    """
+    index = city_index()
+    if not len(index):
+        raise HTTPException(
+            status_code=503, detail="City coordinates have not been imported.")
+    if id is not None:
+        location = index.location(id)
+        if location is None:
+            raise HTTPException(status_code=404, detail="No coordinates for this city.")
+        lat, lon = location
+    elif lat is None or lon is None:
+        raise HTTPException(status_code=400, detail="Either id or lat and lon are required.")
+
+    conditions = metric_filters(request.query_params)
+    if not conditions:
+        results = index.nearest(lat, lon, k, radius_miles, exclude=id)
+    else:
+        # Widen the search until enough nearby cities pass the filters
+        with verified_session() as db:
+            fetch = k
+            while True:
+                fetch = min(fetch * 4, len(index))
+                candidates = index.nearest(lat, lon, fetch, radius_miles, exclude=id)
+                allowed = {search_id for search_id, in db.query(CityMetrics.search_id).filter(
+                    CityMetrics.search_id.in_([city.id for city, _ in candidates]),
+                    *conditions,
+                )}
+                results = [hit for hit in candidates if hit[0].id in allowed][:k]
+                if len(results) == k or len(candidates) < fetch or fetch == len(index):
+                    break
+
+    return FastJSONResponse({
+        "results": [
+            {
+                "id": city.id,
+                "city": city.city,
+                "state_name": city.state_name,
+                "state_code": city.state_code,
+                "distance_miles": round(miles, 1),
+            }
+            for city, miles in results
+        ],
+        "success": True,
+    })
 
 
 class Message(BaseModel):
@@ -211,10 +458,12 @@ def chat_with_gpt(messages: List[Message], city: str):
 
         messages = [{"role": "system", "content": system_prompt}] + messages
 
-        response = openai.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=messages,
-        )
+        with timed("llm_chat"):
+            response = openai.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=messages,
+            )
+        record_llm_usage("chat", "gpt-4o-mini", response.usage)
         return response.choices[0].message.content
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {e}")
@@ -226,7 +475,12 @@ def chatbot(request: ChatRequest):
     if not request.messages:
         raise HTTPException(status_code=400, detail="Prompt cannot be empty.")
 
-    response = chat_with_gpt(request.messages, request.city)
+    if chat_cache.enabled and is_cacheable(request.messages):
+        response = chat_cache.get_or_answer(
+            request.city, request.messages[0].content,
+            lambda: chat_with_gpt(request.messages, request.city))
+    else:
+        response = chat_with_gpt(request.messages, request.city)
     return {"response": response}
 
 
@@ -255,12 +509,14 @@ def contact_us(request: ContactUsRequest):
         options.add_argument('--disable-extensions')
         options.add_argument('--disable-gpu')
 
-        driver = webdriver.Chrome(options=options)
-        driver.set_page_load_timeout(90)
+        with timed("contact_browser_start"):
+            driver = webdriver.Chrome(options=options)
+            driver.set_page_load_timeout(90)
 
         # Load the URL and get the page source
         driver.implicitly_wait(6)
-        driver.get(URL)
+        with timed("contact_page_load"):
+            driver.get(URL)
         # ...
 
         # Fill in the form fields
@@ -296,9 +552,10 @@ def contact_us(request: ContactUsRequest):
 
         # Wait for success message
         try:
-            WebDriverWait(driver, 20).until(
-                EC.presence_of_element_located((By.ID, "successMsg"))
-            )
+            with timed("contact_submit_wait"):
+                WebDriverWait(driver, 20).until(
+                    EC.presence_of_element_located((By.ID, "successMsg"))
+                )
             return {
                 "success": True,
                 "message": "Thank You! We have received your request and one of our staff members will reply shortly.",
@@ -317,81 +574,50 @@ def contact_us(request: ContactUsRequest):
             driver.quit()
 
 
-# import csv
-
-# @api_router.post("/add_city_data_bulk_csv")
-# async def add_city_data_bulk_csv(db: Session = Depends(get_verified_db), city_list_db: Session = Depends(get_city_list_db)):
-#     try:
-#         with open('merged.csv', newline='', encoding='utf-8') as csvfile:
-#             reader = csv.DictReader(csvfile)
-
-#             for row in reader:
-#                 try:
-#                     # Extract required fields from the CSV row
-#                     city_name = row.get('city')
-#                     state_name = row.get('state_name')
-#                     state_code = row.get('state_code')
-
-#                     if not city_name or not state_name or not state_code:
-#                         return {
-#                             "success": False,
-#                             "message": "Missing required fields: city, state_name, or state_code in CSV row."
-#                         }
-
-#                     # Check if the city exists in the city list database
-#                     city_list = city_list_db.query(CityMetricsQuery).filter(
-#                         CityMetricsQuery.city == city_name,
-#                         CityMetricsQuery.state_name == state_name,
-#                         CityMetricsQuery.state_code == state_code
-#                     ).first()
-
-#                     if not city_list:
-#                         return {
-#                             "success": False,
-#                             "message": f"City {city_name}, {state_name} not found in city list database."
-#                         }
-
-#                     search_id = city_list.id
-
-#                     # Prepare the city data for insertion
-#                     city_data = CityMetrics(
-#                         search_id=search_id,
-#                         state_name=row.get('state_name'),
-#                         state_code=row.get('state_code'),
-#                         home_price=float(row.get('home_price', 0)),
-#                         property_tax=float(row.get('property_tax', 0)),
-#                         home_appreciation_rate=float(row.get('home_appreciation_rate', 0)),
-#                         price_per_square_foot= float(row.get('price_per_square_foot', 0)) if row.get('price_per_square_foot', 0) else None,
-#                         education=int(row.get('education', 0)),
-#                         healthcare_fitness=int(row.get('healthcare_fitness', 0)),
-#                         weather_grade=int(row.get('weather_grade', 0)),
-#                         air_quality_index=int(row.get('air_quality_index', 0)),
-#                         commute_transit_score=int(row.get('commute_transit_score', 0)),
-#                         accessibility=int(row.get('accessibility', 0)),
-#                         culture_entertainment=int(row.get('culture_entertainment', 0)),
-#                         unemployment_rate=float(row.get('unemployment_rate', 0)),
-#                         recent_job_growth=float(row.get('recent_job_growth', 0)),
-#                         future_job_growth_index=float(row.get('future_job_growth_index', 0)),
-#                         median_household_income=float(row.get('median_household_income', 0)),
-#                         state_income_tax=float(row.get('state_income_tax', 0)),
-#                         utilities=float(row.get('utilities', 0)),
-#                         food_groceries=float(row.get('food_groceries', 0)),
-#                         sales_tax=float(row.get('sales_tax', 0)),
-#                         transportation_cost=float(row.get('transportation_cost', 0)),
-#                         city=row.get('city')
-#                     )
-
-#                     db.add(city_data)
-
-#                 except Exception as e:
-#                     db.rollback()
-#                     return {
-#                         "success": False,
-#                         "message": f"An error occurred while processing city {row.get('city')}: {str(e)}"
-#                     }
-
-#             db.commit()
-#             return {"success": True, "message": "All city data added successfully."}
-
-#     except Exception as e:
-#         return {"success": False, "message": f"An error occurred: {str(e)}"}
+@api_router.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Expose request, stage, cache and LLM token metrics for Prometheus."""
+    return PlainTextResponse(
+        render_prometheus(),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
+
+@api_router.post("/city-metrics/import", dependencies=[Depends(require_admin)])
+def import_city_metrics_file(
+    file: UploadFile = File(...),
+    file_format: Optional[str] = Query(
+        None, alias="format", description="csv or parquet; defaults to the file extension"
+    ),
+    db: Session = Depends(get_verified_db),
+):
+    """
+    Bulk upsert city metrics from a CSV or Parquet upload, reporting
+    rejected rows instead of aborting the whole import.
+    """
+    file_format = file_format or os.path.splitext(file.filename or "")[1].lstrip(".")
+    try:
+        return import_city_metrics(db, file.file, file_format.lower())
+    except ValueError as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@api_router.get("/admin/profiles", dependencies=[Depends(require_admin)])
+def recent_profiles(limit: int = Query(50, ge=1, le=200)):
+    """
+    Most recent request profiles, newest first.
+    """
+    return FastJSONResponse({"profiles": list_profiles(limit=limit), "success": True})
+
+
+@api_router.get("/admin/profiles/{name}", response_class=PlainTextResponse,
+                dependencies=[Depends(require_admin)])
+def get_profile(name: str):
+    """
+    A profile's collapsed stacks, for flamegraph.pl or speedscope.
+    """
+    profile = read_profile(name)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found.")
+    return PlainTextResponse(profile)
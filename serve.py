@@ -0,0 +1,159 @@
+"""
+Serve the API from worker processes forked from one master process that
+has already imported the app and loaded the read-only datasets (city list,
+city index, blog indexes, static bundle, state and percentile tables), so
+the workers share those pages instead of each loading its own copy.
+
+    python serve.py --workers 4 --port 8000
+    python serve.py --workers 4 --memory-report 300
+
+Use it in place of `uvicorn main:app --workers N`. The master restarts
+workers that exit, prints a memory report for itself and each worker on
+SIGUSR1 (and every --memory-report seconds), and stops the workers
+gracefully on SIGTERM or SIGINT.
+"""
+import argparse
+import os
+import signal
+import threading
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import uvicorn
+from utils.memory import memory_report
+from utils.preload import freeze, preload
+
+# Seconds workers get to finish their requests on shutdown
+GRACEFUL_TIMEOUT = 30
+# A worker exiting sooner than this after starting is restarted after a
+# pause, so a crashing app does not fork in a tight loop
+MIN_WORKER_UPTIME = 5
+
+
+def exit_with_master(master_pid: int):
+    """
+    Stop this worker if the master dies without stopping it.
+    """
+    def watch():
+        while os.getppid() == master_pid:
+            time.sleep(1)
+        os.kill(os.getpid(), signal.SIGTERM)
+    threading.Thread(target=watch, name="master-watch", daemon=True).start()
+
+
+class Master:
+    def __init__(self, config: uvicorn.Config, workers: int, report_interval: float):
+        self.config = config
+        self.workers = workers
+        self.report_interval = report_interval
+        self.socket = None
+        # pid -> (worker number, start time)
+        self.children = {}
+        self.stopping = False
+        self.report_requested = False
+
+    def spawn(self, number: int):
+        pid = os.fork()
+        if pid == 0:
+            # Terminal signals go to the master alone, which stops workers
+            # with one SIGTERM each
+            os.setpgid(0, 0)
+            signal.signal(signal.SIGUSR1, signal.SIG_IGN)
+            exit_with_master(os.getppid())
+            try:
+                uvicorn.Server(self.config).run(sockets=[self.socket])
+            finally:
+                os._exit(0)
+        self.children[pid] = (number, time.monotonic())
+
+    def reap(self):
+        while self.children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            number, started = self.children.pop(pid)
+            if self.stopping:
+                continue
+            print(f"Worker {number} (pid {pid}) exited with status "
+                  f"{os.waitstatus_to_exitcode(status)}; restarting.")
+            if time.monotonic() - started < MIN_WORKER_UPTIME:
+                time.sleep(1)
+            self.spawn(number)
+
+    def report(self):
+        workers = sorted(self.children.items(), key=lambda item: item[1][0])
+        processes = {"master": os.getpid(),
+                     **{f"worker {number}": pid for pid, (number, _) in workers}}
+        print(memory_report(processes), flush=True)
+
+    def stop(self):
+        for pid in self.children:
+            os.kill(pid, signal.SIGTERM)
+        deadline = time.monotonic() + GRACEFUL_TIMEOUT
+        while self.children and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.1)
+        for pid in self.children:
+            os.kill(pid, signal.SIGKILL)
+
+    def run(self):
+        self.socket = self.config.bind_socket()
+        freeze()
+
+        def on_stop(signum, frame):
+            self.stopping = True
+
+        def on_report(signum, frame):
+            self.report_requested = True
+
+        signal.signal(signal.SIGTERM, on_stop)
+        signal.signal(signal.SIGINT, on_stop)
+        signal.signal(signal.SIGUSR1, on_report)
+
+        for number in range(self.workers):
+            self.spawn(number)
+        print(f"Master {os.getpid()} started {self.workers} workers.", flush=True)
+
+        next_report = (time.monotonic() + self.report_interval
+                       if self.report_interval else None)
+        while not self.stopping:
+            time.sleep(0.5)
+            self.reap()
+            if next_report is not None and time.monotonic() >= next_report:
+                self.report_requested = True
+                next_report += self.report_interval
+            if self.report_requested:
+                self.report_requested = False
+                self.report()
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", type=str, default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int,
+                        default=int(os.getenv("WEB_CONCURRENCY", str(os.cpu_count() or 1))))
+    parser.add_argument("--memory-report", type=float, default=0,
+                        help="Print the memory report every this many seconds.")
+    parser.add_argument("--log-level", type=str, default="info")
+    parser.add_argument("--forwarded-allow-ips", type=str)
+    args = parser.parse_args()
+
+    preload()
+    from main import app
+
+    config = uvicorn.Config(
+        app, host=args.host, port=args.port, log_level=args.log_level,
+        forwarded_allow_ips=args.forwarded_allow_ips,
+    )
+    Master(config, args.workers, args.memory_report).run()
+
+
+if __name__ == "__main__":
+    main()
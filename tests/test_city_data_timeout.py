@@ -0,0 +1,75 @@
+"""
+A metrics query cancelled by Postgres' statement_timeout falls back to the
+state's data instead of failing the comparison.
+"""
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy.exc import InternalError, OperationalError
+
+from utils.cache import NullCacheBackend, SharedCache
+from utils.City_Data import get_city_data as module
+from utils.City_Data.schemas import CityDetails
+from utils.deadline import deadline
+
+
+class CancelledQuery(Exception):
+    pgcode = module.QUERY_CANCELED
+
+
+class AbortedTransaction(Exception):
+    pass
+
+
+class PostgresSession:
+    """
+    A session on Postgres whose metrics query is cancelled, after which
+    every statement fails until the transaction is rolled back.
+    """
+
+    def __init__(self):
+        self.aborted = False
+        self.statements = []
+        self.rollbacks = 0
+
+    def get_bind(self):
+        return SimpleNamespace(dialect=SimpleNamespace(name="postgresql"))
+
+    def execute(self, statement):
+        if self.aborted:
+            raise InternalError(str(statement), {}, AbortedTransaction())
+        self.statements.append(str(statement))
+
+    def query(self, model):
+        return self
+
+    def filter_by(self, **kwargs):
+        return self
+
+    def first(self):
+        self.aborted = True
+        raise OperationalError("SELECT", {}, CancelledQuery())
+
+    def rollback(self):
+        self.aborted = False
+        self.rollbacks += 1
+
+
+@pytest.fixture
+def city():
+    return CityDetails(id=271, city="Atlanta", state_name="Georgia", state_code="GA")
+
+
+def test_cancelled_query_falls_back_to_state_data(monkeypatch, city):
+    fallback = object()
+    monkeypatch.setattr(module, "cache", SharedCache(NullCacheBackend))
+    monkeypatch.setattr(module.state_fallback, "city_metrics_for",
+                        lambda details: fallback)
+    db = PostgresSession()
+
+    with deadline(5):
+        assert module.get_city_data(city, db) is fallback
+
+    assert db.rollbacks == 1
+    assert len(db.statements) == 1
+    assert db.statements[0].startswith("SET LOCAL statement_timeout = ")
@@ -0,0 +1,177 @@
+import csv
+import io
+from itertools import islice
+from typing import BinaryIO, Iterator
+import numpy as np
+from sqlalchemy.orm import Session
+from Database.get_city_list_db import SessionLocal as CityListSession, CityMetricsQuery
+from Database.upsert_city_metrics import upsert_city_metrics
+from utils.cache import cache
+from .schemas import CityMetricsSchema
+
+
+METRIC_FIELDS = tuple(CityMetricsSchema.model_fields)
+KEY_FIELDS = ("city", "state_name", "state_code")
+
+# Cap on per-row errors returned, so a badly broken file stays reportable
+MAX_REPORTED_ERRORS = 1000
+
+_city_index = None
+
+
+def get_city_index() -> dict:
+    """
+    (city, state name, state code) -> search_id for the whole city list,
+    loaded once so rows are resolved with an in-memory join.
+    """
+    global _city_index
+    if _city_index is None:
+        db = CityListSession()
+        try:
+            rows = db.query(
+                CityMetricsQuery.id, CityMetricsQuery.city,
+                CityMetricsQuery.state_name, CityMetricsQuery.state_code,
+            ).all()
+        finally:
+            db.close()
+        _city_index = {
+            (city.lower(), state_name.lower(), state_code.upper()): id
+            for id, city, state_name, state_code in rows
+        }
+    return _city_index
+
+
+def read_csv_chunks(file: BinaryIO, chunk_size: int) -> Iterator[dict]:
+    """
+    Stream a CSV as column dicts of at most chunk_size rows.
+    """
+    reader = csv.reader(io.TextIOWrapper(file, encoding="utf-8-sig", newline=""))
+    header = [name.strip() for name in next(reader, [])]
+    while True:
+        rows = list(islice(reader, chunk_size))
+        if not rows:
+            return
+        columns = list(zip(*(row + [""] * (len(header) - len(row))
+                             for row in rows)))
+        yield {name: list(values) for name, values in zip(header, columns)}
+
+
+def read_parquet_chunks(file: BinaryIO, chunk_size: int) -> Iterator[dict]:
+    """
+    Stream a Parquet file as column dicts of at most chunk_size rows.
+    """
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ValueError("Parquet import requires the pyarrow package.")
+
+    for batch in pq.ParquetFile(file).iter_batches(batch_size=chunk_size):
+        yield batch.to_pydict()
+
+
+def parse_numeric(values: list) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Convert a column to float64, returning the values and a mask of the
+    entries that are missing or not numeric.
+    """
+    column = np.array(values, dtype=object)
+    try:
+        parsed = column.astype(np.float64)
+    except (TypeError, ValueError):
+        # Slow path only for columns that contain bad values
+        parsed = np.empty(len(column), dtype=np.float64)
+        for i, value in enumerate(column):
+            try:
+                parsed[i] = float(value)
+            except (TypeError, ValueError):
+                parsed[i] = np.nan
+    return parsed, np.isnan(parsed)
+
+
+def validate_chunk(columns: dict, offset: int) -> tuple[list[dict], list[dict]]:
+    """
+    Validate one chunk column by column and resolve each row's search_id.
+    Returns the valid rows and an error entry per rejected row.
+    """
+    missing = [name for name in KEY_FIELDS + METRIC_FIELDS if name not in columns]
+    if missing:
+        raise ValueError(f"Missing required columns: {', '.join(missing)}")
+
+    count = len(columns["city"])
+    problems = [[] for _ in range(count)]
+
+    keys = [
+        tuple(str(value or "").strip() for value in values)
+        for values in zip(*(columns[name] for name in KEY_FIELDS))
+    ]
+    city_index = get_city_index()
+    search_ids = [
+        city_index.get((city.lower(), state_name.lower(), state_code.upper()))
+        for city, state_name, state_code in keys
+    ]
+    for i, search_id in enumerate(search_ids):
+        if search_id is None:
+            city, state_name, state_code = keys[i]
+            problems[i].append(
+                f"City {city}, {state_name} ({state_code}) not found in city list.")
+
+    metrics = {}
+    for name in METRIC_FIELDS:
+        parsed, bad = parse_numeric(columns[name])
+        metrics[name] = parsed
+        for i in np.flatnonzero(bad):
+            problems[i].append(f"Invalid {name}: {columns[name][i]!r}")
+
+    rows, errors = [], []
+    for i in range(count):
+        if problems[i]:
+            errors.append({"row": offset + i + 1, "errors": problems[i]})
+            continue
+        city, state_name, state_code = keys[i]
+        rows.append({
+            "search_id": search_ids[i],
+            "city": city,
+            "state_name": state_name,
+            "state_code": state_code.upper(),
+            **{name: float(metrics[name][i]) for name in METRIC_FIELDS},
+        })
+    return rows, errors
+
+
+def import_city_metrics(db: Session, file: BinaryIO, file_format: str,
+                        chunk_size: int = 5000) -> dict:
+    """
+    Stream a CSV or Parquet file of city metrics into CityMetrics. Each
+    chunk is validated, upserted on search_id and committed on its own, so
+    bad rows are reported instead of aborting the import.
+    """
+    if file_format == "csv":
+        chunks = read_csv_chunks(file, chunk_size)
+    elif file_format == "parquet":
+        chunks = read_parquet_chunks(file, chunk_size)
+    else:
+        raise ValueError(f"Unsupported format: {file_format}")
+
+    total, imported, failed, errors = 0, 0, 0, []
+    for columns in chunks:
+        rows, chunk_errors = validate_chunk(columns, total)
+        total += len(rows) + len(chunk_errors)
+        if rows:
+            # A city listed twice in one chunk cannot be upserted in one
+            # statement; the last occurrence wins, as it would row by row
+            rows = list({row["search_id"]: row for row in rows}.values())
+            imported += len(rows)
+            upsert_city_metrics(db, rows)
+            db.commit()
+            cache.invalidate("city_data")
+        failed += len(chunk_errors)
+        errors.extend(chunk_errors[:MAX_REPORTED_ERRORS - len(errors)])
+
+    return {
+        "success": failed == 0,
+        "rows": total,
+        "imported": imported,
+        "failed": failed,
+        # 1-based data row numbers, not counting a CSV header
+        "errors": errors,
+    }
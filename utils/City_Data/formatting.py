@@ -0,0 +1,104 @@
+from sqlalchemy import event
+from Models.models import CityMetrics
+
+
+# Column names resolved once instead of reflecting __table__ on every call
+CITY_METRICS_COLUMNS = tuple(c.name for c in CityMetrics.__table__.columns)
+
+# Attribute used to keep the blocks on a CityMetrics instance
+_BLOCKS_ATTR = "_city_blocks"
+# Key of the formatted block in a city_data cache entry
+FORMATTED_KEY = "formatted_block"
+
+
+def add_units(city_data):
+    city = {
+        "accessibility": str(int(city_data["accessibility"])),
+        "air_quality_index": str(int(city_data["air_quality_index"])),
+        "city": city_data["city"],
+        "commute_transit_score": str(int(city_data["commute_transit_score"])),
+        "culture_entertainment": str(int(city_data["culture_entertainment"])),
+        "education": str(int(city_data["education"])),
+        "food_groceries": str(int(city_data["food_groceries"])),
+        "future_job_growth_index": f'{city_data["future_job_growth_index"]}%',
+        "healthcare_fitness": str(int(city_data["healthcare_fitness"])),
+        "home_appreciation_rate": f"{city_data['home_appreciation_rate']}%",
+        "home_price": f"${city_data['home_price']:,}",
+        "median_household_income": f"${city_data['median_household_income']:,}",
+        "price_per_square_foot": f"${city_data['price_per_square_foot']:,}",
+        "property_tax": f"${city_data['property_tax']:,}",
+        "recent_job_growth": f'{city_data["recent_job_growth"]}%',
+        "sales_tax": f"{city_data['sales_tax']}%",
+        "state_code": city_data["state_code"],
+        "state_income_tax": f"{city_data['state_income_tax']}%",
+        "state_name": city_data["state_name"],
+        "transportation_cost": str(int(city_data["transportation_cost"])),
+        "unemployment_rate": f"{city_data['unemployment_rate']}%",
+        "utilities": str(int(city_data["utilities"])),
+        "weather_grade": str(int(city_data["weather_grade"])),
+    }
+
+    return city
+
+
+def city_metrics_dict(instance: CityMetrics) -> dict:
+    """
+    Plain dict of a CityMetrics row's column values.
+    """
+    return {name: getattr(instance, name) for name in CITY_METRICS_COLUMNS}
+
+
+def _set_blocks(instance: CityMetrics, city_data: dict, formatted: dict) -> tuple[dict, dict]:
+    blocks = (city_data, formatted)
+    instance.__dict__[_BLOCKS_ATTR] = blocks
+    return blocks
+
+
+def get_city_blocks(instance: CityMetrics) -> tuple[dict, dict]:
+    """
+    Return the (raw metrics, formatted block) pair for a city, reusing the
+    formatted block that came with the row from the shared cache.
+    """
+    blocks = instance.__dict__.get(_BLOCKS_ATTR)
+    if blocks is None:
+        city_data = city_metrics_dict(instance)
+        blocks = _set_blocks(instance, city_data, add_units(city_data))
+    return blocks
+
+
+def city_cache_entry(instance: CityMetrics) -> dict:
+    """
+    A row's column values with its formatted block, as stored in the
+    shared city_data cache. The block is formatted once per cached row
+    instead of on every request that reads it.
+    """
+    try:
+        city_data, formatted = get_city_blocks(instance)
+    except (TypeError, ValueError):
+        # Rows with missing metrics cannot be formatted
+        return city_metrics_dict(instance)
+    return {**city_data, FORMATTED_KEY: formatted}
+
+
+def city_from_cache_entry(entry: dict) -> CityMetrics:
+    """
+    A transient CityMetrics from a city_data cache entry, carrying the
+    entry's formatted block when it has one.
+    """
+    formatted = entry.pop(FORMATTED_KEY, None)
+    instance = CityMetrics(**entry)
+    if formatted is not None:
+        _set_blocks(instance, entry, formatted)
+    return instance
+
+
+@event.listens_for(CityMetrics, "refresh")
+def _on_refresh(instance, context, attrs):
+    # A partial refresh may leave other attributes expired; recompute lazily
+    instance.__dict__.pop(_BLOCKS_ATTR, None)
+
+
+@event.listens_for(CityMetrics, "after_insert")
+@event.listens_for(CityMetrics, "after_update")
+def _on_write(mapper, connection, instance):
+    instance.__dict__.pop(_BLOCKS_ATTR, None)
@@ -1,11 +1,19 @@
 from Models.models import CityMetrics
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.future import select
 from sqlalchemy.orm import Session
 from .schemas import CityDetails, CityMetricsSchema
-from openai import OpenAI
+from .state_fallback import state_fallback
+from .formatting import city_cache_entry, city_from_cache_entry
 import os
 import json
-from utils.constants import PERPLEXITY_MODEL
+from contextlib import contextmanager
+from utils.constants import PERPLEXITY_MODEL, PERPLEXITY_BASE_URL, STATE_DATA_PATH
+from utils.metrics import DEADLINE_EXCEEDED, timed, record_llm_usage
+from utils.lazy import lazy_import, lazy_object
+from utils.cache import cache
+from utils.deadline import DeadlineExceeded, stage_timeout
 from datetime import datetime
 
 system_prompt_for_city = """
@@ -72,44 +80,94 @@ Follow these guidelines:
 """
 
 
-client = OpenAI()
-perplexity_client = OpenAI(api_key=os.getenv(
-    "PERPLEXITY_API_KEY"), base_url="https://api.perplexity.ai")
+openai = lazy_import("openai")
 
+client = lazy_object(lambda: openai.OpenAI())
+perplexity_client = lazy_object(lambda: openai.OpenAI(api_key=os.getenv(
+    "PERPLEXITY_API_KEY"), base_url=PERPLEXITY_BASE_URL))
+async_client = lazy_object(lambda: openai.AsyncOpenAI())
+async_perplexity_client = lazy_object(lambda: openai.AsyncOpenAI(api_key=os.getenv(
+    "PERPLEXITY_API_KEY"), base_url=PERPLEXITY_BASE_URL))
 
-def get_city_data_from_perplexity(city_details: CityDetails):
-    user_prompt = f"City Name: {city_details.city}, State Name: {city_details.state_name} and State Code:{city_details.state_code}"
 
-    response = perplexity_client.chat.completions.create(
-        model=PERPLEXITY_MODEL,
-        messages=[
-            {
-                "role": "system",
-                "content": system_prompt_for_city + default_prompt,
-            },
-            {
-                "role": "user",
-                "content": user_prompt,
-            },
-        ]
-    )
+def city_user_prompt(city_details: CityDetails) -> str:
+    return f"City Name: {city_details.city}, State Name: {city_details.state_name} and State Code:{city_details.state_code}"
+
+
+def city_research_messages(city_details: CityDetails) -> list[dict]:
+    return [
+        {
+            "role": "system",
+            "content": system_prompt_for_city + default_prompt,
+        },
+        {
+            "role": "user",
+            "content": city_user_prompt(city_details),
+        },
+    ]
+
+
+def city_parse_messages(city_data: str, city_details: CityDetails) -> list[dict]:
+    return [
+        {
+            "role": "system",
+            "content": parser_prompt,
+        },
+        {
+            "role": "user",
+            "content": city_data + city_user_prompt(city_details), 
+        },
+    ]
+
+
+def get_city_data_from_perplexity(city_details: CityDetails):
+    with timed("perplexity_city"):
+        response = perplexity_client.chat.completions.create(
+            model=PERPLEXITY_MODEL,
+            messages=city_research_messages(city_details),
+        )
+    record_llm_usage("perplexity_city", PERPLEXITY_MODEL, response.usage)
 
     city_data = response.choices[0].message.content
 
-    response = client.beta.chat.completions.parse(
-        model="gpt-4o-mini",
-        messages=[
-            {
-                "role": "system",
-                "content": parser_prompt,
-            },
-            {
-                "role": "user",
-                "content": city_data + user_prompt, 
-            },
-        ],
-        response_format=CityMetricsSchema
-    )
+    with timed("llm_city_parse"):
+        response = client.beta.chat.completions.parse(
+            model="gpt-4o-mini",
+            messages=city_parse_messages(city_data, city_details),
+            response_format=CityMetricsSchema
+        )
+    record_llm_usage("city_parse", "gpt-4o-mini", response.usage)
+    response = response.choices[0].message.parsed
+    return response.model_dump()
+
+
+async def aresearch_city(city_details: CityDetails) -> str:
+    """
+    Perplexity's free-text research on a city, before it is parsed.
+    """
+    with timed("perplexity_city"):
+        response = await async_perplexity_client.chat.completions.create(
+            model=PERPLEXITY_MODEL,
+            messages=city_research_messages(city_details),
+        )
+    record_llm_usage("perplexity_city", PERPLEXITY_MODEL, response.usage)
+    return response.choices[0].message.content
+
+
+async def aget_city_data_from_perplexity(city_details: CityDetails):
+    """
+    Async version of `get_city_data_from_perplexity` for bulk jobs that fan
+    out many cities concurrently.
+    """
+    city_data = await aresearch_city(city_details)
+
+    with timed("llm_city_parse"):
+        response = await async_client.beta.chat.completions.parse(
+            model="gpt-4o-mini",
+            messages=city_parse_messages(city_data, city_details),
+            response_format=CityMetricsSchema
+        )
+    record_llm_usage("city_parse", "gpt-4o-mini", response.usage)
     response = response.choices[0].message.parsed
     return response.model_dump()
 
@@ -146,19 +204,71 @@ def get_city_data_from_perplexity_for_state(city_details: CityDetails):
     )
     response = response.choices[0].message.parsed
     file_name = city_details.state_name.replace(" ", "_") + ".json"
-    with open(f"Data/State_Data/{file_name}", "w") as f:
-        json.dump(response.model_dump(), f, indent=4)
+    os.makedirs(STATE_DATA_PATH, exist_ok=True)
+    with open(os.path.join(STATE_DATA_PATH, file_name), "w") as f:
+        json.dump({
+            "state_name": city_details.state_name,
+            "state_code": city_details.state_code,
+            **response.model_dump(),
+        }, f, indent=4)
 
     return response.model_dump()
 
 
+# Share of the time left before a deadline that one metrics query may take
+CITY_DATA_SHARE = 0.5
+# Postgres error code of a statement cancelled by statement_timeout
+QUERY_CANCELED = "57014"
+
+
+@contextmanager
+def statement_timeout(db: Session, timeout: float | None):
+    """
+    Cancel the enclosed statements on Postgres after `timeout` seconds.
+    Other databases run them unbounded.
+
+    The timeout is reset only when the block succeeds: a cancelled
+    statement aborts the transaction, where the reset would fail too, and
+    SET LOCAL ends with the transaction the caller rolls back.
+    """
+    if timeout is None or db.get_bind().dialect.name != "postgresql":
+        yield
+        return
+    db.execute(text(f"SET LOCAL statement_timeout = {max(1, int(timeout * 1000))}"))
+    yield
+    db.execute(text("SET LOCAL statement_timeout = DEFAULT"))
+
+
 def get_city_data(city_details: CityDetails, db: Session):
     """
     Get city data from the database based on the zip code.
     """
 
-    city_data = db.query(CityMetrics).filter_by(
-        search_id=city_details.id).first()
+    def query():
+        timeout = stage_timeout("city_data", CITY_DATA_SHARE)
+        with timed("city_data_query"), statement_timeout(db, timeout):
+            return db.query(CityMetrics).filter_by(
+                search_id=city_details.id).first()
+
+    # Cached rows come back as transient CityMetrics with their formatted
+    # block; missing cities are not cached, so rows added by enrichment or
+    # imports show up right away
+    try:
+        city_data = cache.get_or_compute(
+            "city_data", (city_details.id,), query,
+            encode=city_cache_entry, decode=city_from_cache_entry,
+            cache_if=lambda row: row is not None,
+        )
+    except DeadlineExceeded:
+        # Out of time: use the state's data below
+        city_data = None
+    except OperationalError as e:
+        if getattr(e.orig, "pgcode", None) != QUERY_CANCELED:
+            raise
+        DEADLINE_EXCEEDED.inc(stage="city_data")
+        # The cancelled statement aborted the transaction
+        db.rollback()
+        city_data = None
 
     # if city_data and (datetime.now() - city_data.updated_at).days > 365:
     #     updated_data = get_city_data_from_perplexity(city_details)
@@ -184,4 +294,8 @@ def get_city_data(city_details: CityDetails, db: Session):
     #         search_id=city_details.id).first()
     #     db.refresh(city_data)
 
+    # Degrade to state-level data rather than failing the comparison
+    if city_data is None:
+        city_data = state_fallback.city_metrics_for(city_details)
+
     return city_data
@@ -0,0 +1,159 @@
+import asyncio
+import threading
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from Database.get_verified_db import SessionLocal, init_db
+from Models.models import CityMetrics
+from utils.city_score import HIGHER_IS_BETTER
+from .schemas import CityMetricsSchema
+
+
+METRIC_FIELDS = tuple(CityMetricsSchema.model_fields)
+
+# How often a background task brings the tables up to date with the database
+REFRESH_INTERVAL_SECONDS = 30
+# Past this share of changed rows, the tables are rebuilt instead of
+# updated row by row, which would hold the lock for seconds after an import
+REBUILD_FRACTION = 0.05
+
+
+class PercentileTables:
+    """
+    One sorted array per metric over every CityMetrics row, for O(log n)
+    percentile and rank lookups. Rows written since the last refresh
+    (by updated_at) are applied in place; the tables are rebuilt when the
+    set of rows no longer matches the database or many have changed.
+    """
+
+    def __init__(self):
+        self.sorted = {field: array("d") for field in METRIC_FIELDS}
+        # search_id -> the metric values currently in the sorted arrays
+        self.rows = {}
+        self.watermark = None
+        self.loaded = False
+        self.lock = threading.Lock()
+
+    def _insert(self, search_id: int, values: tuple):
+        self.rows[search_id] = values
+        for field, value in zip(METRIC_FIELDS, values):
+            if value is not None:
+                insort(self.sorted[field], value)
+
+    def _remove(self, search_id: int):
+        values = self.rows.pop(search_id, None)
+        if values is None:
+            return
+        for field, value in zip(METRIC_FIELDS, values):
+            if value is not None:
+                column = self.sorted[field]
+                del column[bisect_left(column, value)]
+
+    @staticmethod
+    def _query(db: Session):
+        return db.query(
+            CityMetrics.search_id, CityMetrics.updated_at,
+            *(getattr(CityMetrics, field) for field in METRIC_FIELDS),
+        ).filter(CityMetrics.search_id.isnot(None))
+
+    def load(self, db: Session):
+        """
+        Build the tables from every row.
+        """
+        rows = self._query(db).all()
+        values = {row[0]: tuple(row[2:]) for row in rows}
+        columns = {
+            field: array("d", sorted(row[i] for row in values.values() if row[i] is not None))
+            for i, field in enumerate(METRIC_FIELDS)
+        }
+        watermark = max((row[1] for row in rows if row[1] is not None), default=None)
+        with self.lock:
+            self.sorted, self.rows = columns, values
+            self.watermark = watermark
+            self.loaded = True
+        print(f"Loaded percentile tables for {len(values)} cities.")
+
+    def refresh(self, db: Session):
+        """
+        Apply rows written since the last refresh, or rebuild if the rows
+        differ from the database's or more than REBUILD_FRACTION of them
+        changed.
+        """
+        if not self.loaded:
+            self.load(db)
+            return
+        query = self._query(db)
+        # >= so rows committed within the same timestamp are not missed;
+        # reapplying a row is harmless
+        if self.watermark is not None:
+            query = query.filter(CityMetrics.updated_at >= self.watermark)
+        changed = query.all()
+        if len(changed) > REBUILD_FRACTION * len(self.rows):
+            self.load(db)
+            return
+        with self.lock:
+            for row in changed:
+                if self.rows.get(row[0]) != tuple(row[2:]):
+                    self._remove(row[0])
+                    self._insert(row[0], tuple(row[2:]))
+                if row[1] is not None and (self.watermark is None or row[1] > self.watermark):
+                    self.watermark = row[1]
+        # A delete plus an insert the watermark missed leaves the count
+        # unchanged, so the search_ids are compared by their sum as well
+        count, total = db.query(
+            func.count(CityMetrics.search_id), func.sum(CityMetrics.search_id)).one()
+        if (count, total or 0) != (len(self.rows), sum(self.rows)):
+            self.load(db)
+
+    def lookup(self, field: str, value: float) -> dict | None:
+        """
+        Where a value stands among all cities: its percentile (100 is best,
+        following the metric's direction), its rank (1 is best) and the
+        number of cities ranked.
+        """
+        if value is None:
+            return None
+        with self.lock:
+            column = self.sorted[field]
+            below = bisect_left(column, value)
+            above = len(column) - bisect_right(column, value)
+            total = len(column)
+        if total == 0:
+            return None
+        worse = below if HIGHER_IS_BETTER.get(field, True) else above
+        better = above if HIGHER_IS_BETTER.get(field, True) else below
+        return {
+            "percentile": round(100 * (worse + (total - below - above) / 2) / total, 1),
+            "rank": better + 1,
+            "of": total,
+        }
+
+    def profile(self, city_data: dict) -> dict:
+        return {field: self.lookup(field, city_data.get(field))
+                for field in METRIC_FIELDS}
+
+
+percentile_tables = PercentileTables()
+
+
+def load_percentile_tables():
+    db = SessionLocal()
+    try:
+        percentile_tables.refresh(db)
+    finally:
+        db.close()
+
+
+async def refresh_percentile_tables(interval: float = REFRESH_INTERVAL_SECONDS):
+    """
+    Keep the tables up to date from the background, so requests only read
+    them.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            if await asyncio.to_thread(init_db, 1):
+                await asyncio.to_thread(load_percentile_tables)
+        except Exception as e:
+            print(f"Percentile tables refresh failed: {e}")
@@ -0,0 +1,152 @@
+import json
+import os
+import threading
+import time
+from array import array
+from dataclasses import dataclass
+from sqlalchemy import distinct
+from Database.get_city_list_db import SessionLocal as CityListSession, CityMetricsQuery
+from Models.models import CityMetrics
+from utils.constants import STATE_DATA_PATH
+from .schemas import CityMetricsSchema
+
+
+METRIC_FIELDS = tuple(CityMetricsSchema.model_fields)
+
+# How often, at most, the JSON directory is checked for changes
+CHECK_INTERVAL_SECONDS = 30
+
+
+def load_state_codes() -> dict:
+    """
+    Map state names to codes using the city list.
+    """
+    db = CityListSession()
+    try:
+        rows = db.query(
+            distinct(CityMetricsQuery.state_name), CityMetricsQuery.state_code
+        ).all()
+    finally:
+        db.close()
+    return {name: code for name, code in rows if name and code}
+
+
+@dataclass(frozen=True)
+class StateTable:
+    """
+    One generation of state data, replaced as a whole on reload so readers
+    never mix two.
+    """
+    index: dict
+    state_names: list
+    values: array
+
+
+class StateFallbackStore:
+    """
+    State-level metrics from `Data/State_Data/<State>.json`, held as one
+    flat array of floats (one row of METRIC_FIELDS per state) indexed by
+    state code, in a StateTable swapped whole on reload. Used when a city
+    has no CityMetrics row of its own.
+    """
+
+    def __init__(self, path: str = STATE_DATA_PATH):
+        self.path = path
+        self.table = StateTable({}, [], array("d"))
+        self.signature = None
+        self.checked_at = 0.0
+        self.state_codes = None
+        self.lock = threading.Lock()
+
+    def _signature(self) -> tuple:
+        if not os.path.isdir(self.path):
+            return ()
+        return tuple(sorted(
+            (entry.name, entry.stat().st_mtime_ns, entry.stat().st_size)
+            for entry in os.scandir(self.path)
+            if entry.name.endswith(".json")
+        ))
+
+    def load(self):
+        """
+        Rebuild the table from the JSON files on disk.
+        """
+        signature = self._signature()
+        if self.state_codes is None:
+            self.state_codes = load_state_codes()
+
+        index, state_names, values = {}, [], array("d")
+        for file_name, _, _ in signature:
+            with open(os.path.join(self.path, file_name), "r") as file:
+                data = json.load(file)
+
+            state_name = data.get("state_name") or file_name[:-5].replace("_", " ")
+            state_code = data.get("state_code") or self.state_codes.get(state_name)
+            if not state_code:
+                print(f"Skipping state data {file_name}: unknown state.")
+                continue
+
+            row = [data.get(field) for field in METRIC_FIELDS]
+            if any(value is None for value in row):
+                print(f"Skipping state data {file_name}: missing metrics.")
+                continue
+
+            index[state_code] = len(state_names)
+            state_names.append(state_name)
+            values.extend(float(value) for value in row)
+
+        with self.lock:
+            self.table = StateTable(index, state_names, values)
+            self.signature = signature
+            self.checked_at = time.monotonic()
+        print(f"Loaded state fallback data for {len(index)} states.")
+
+    def refresh_if_changed(self):
+        now = time.monotonic()
+        if now - self.checked_at < CHECK_INTERVAL_SECONDS:
+            return
+        self.checked_at = now
+        if self._signature() != self.signature:
+            self.load()
+
+    def get(self, state_code: str) -> dict | None:
+        """
+        Metrics for a state as a dict, or None if the state is unknown.
+        """
+        self.refresh_if_changed()
+        table = self.table
+        row = table.index.get((state_code or "").upper())
+        if row is None:
+            return None
+        width = len(METRIC_FIELDS)
+        return {
+            "state_name": table.state_names[row],
+            **dict(zip(METRIC_FIELDS, table.values[row * width:(row + 1) * width])),
+        }
+
+    def city_metrics_for(self, city_details) -> CityMetrics | None:
+        """
+        A transient CityMetrics built from the city's state-level data. It is
+        never added to a session.
+        """
+        state = self.get(city_details.state_code)
+        if state is None:
+            return None
+        state_name = state.pop("state_name")
+        return CityMetrics(
+            search_id=city_details.id,
+            city=city_details.city,
+            state_code=city_details.state_code.upper(),
+            state_name=city_details.state_name or state_name,
+            **state,
+        )
+
+
+state_fallback = StateFallbackStore()
+
+
+def is_state_fallback(city: CityMetrics) -> bool:
+    """
+    True for the transient rows built from state-level data.
+    """
+    return city.id is None
@@ -0,0 +1,17 @@
+import os
+import secrets
+from fastapi import Header, HTTPException
+
+
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+
+def require_admin(x_admin_token: str = Header(None)):
+    """
+    Dependency guarding admin endpoints. They stay disabled unless an
+    ADMIN_TOKEN is configured, and callers must send it as X-Admin-Token.
+    """
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled.")
+    if not x_admin_token or not secrets.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token.")
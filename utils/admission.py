@@ -0,0 +1,161 @@
+import asyncio
+import math
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from utils.constants import TRUSTED_PROXY_HOPS
+from utils.metrics import ADMISSION_IN_FLIGHT, ADMISSION_QUEUED, ADMISSION_SHED, match_route
+from utils.rate_limit import TokenBucket
+from utils.responses import FastJSONResponse
+
+# Per-client buckets kept before the least recently seen are dropped
+MAX_TRACKED_CLIENTS = 10000
+
+
+@dataclass
+class RoutePool:
+    """
+    Concurrency limit and bounded wait queue for one expensive route, plus
+    the token bucket applied to each client calling it.
+    """
+    name: str
+    concurrency: int
+    queue_size: int
+    queue_timeout: float
+    client_rate: float  # requests per second per client
+    client_burst: float
+    retry_after: int  # seconds suggested to clients shed for load
+    semaphore: asyncio.Semaphore = field(init=False, repr=False)
+    waiting: int = field(default=0, init=False)
+    clients: OrderedDict = field(default_factory=OrderedDict, init=False, repr=False)
+
+    def __post_init__(self):
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+
+    def client_wait(self, client: str) -> float:
+        """
+        Take a token from the client's bucket. Returns 0 if allowed,
+        otherwise the seconds until the client may retry.
+        """
+        bucket = self.clients.get(client)
+        if bucket is None:
+            bucket = TokenBucket(self.client_rate, self.client_burst)
+            self.clients[client] = bucket
+            if len(self.clients) > MAX_TRACKED_CLIENTS:
+                self.clients.popitem(last=False)
+        else:
+            self.clients.move_to_end(client)
+        return bucket.try_acquire()
+
+
+def default_pools() -> dict:
+    # Only expensive routes are pooled; cheap routes such as
+    # /get-cities-list are never queued or shed, so a spike on the LLM and
+    # browser routes cannot take their capacity
+    return {
+        "/comparison": RoutePool(
+            "comparison", concurrency=8, queue_size=16, queue_timeout=10,
+            client_rate=0.5, client_burst=5, retry_after=5),
+        # Scoring is cheap, but a request may ask for many LLM calls
+        "/comparison/batch": RoutePool(
+            "comparison_batch", concurrency=2, queue_size=4, queue_timeout=10,
+            client_rate=0.1, client_burst=3, retry_after=10),
+        "/chat": RoutePool(
+            "chat", concurrency=16, queue_size=32, queue_timeout=10,
+            client_rate=1, client_burst=10, retry_after=2),
+        # Each request drives its own Chrome process
+        "/contact-us": RoutePool(
+            "contact_us", concurrency=2, queue_size=4, queue_timeout=30,
+            client_rate=1 / 60, client_burst=3, retry_after=30),
+    }
+
+
+def client_address(scope, hops: int = TRUSTED_PROXY_HOPS) -> str:
+    """
+    The client's address: the X-Forwarded-For entry added by the outermost
+    of `hops` trusted proxies, or X-Real-IP, falling back to the peer
+    address. Entries further left are set by the client and not trusted.
+    """
+    if hops > 0:
+        headers = dict(scope.get("headers") or ())
+        forwarded = [address.strip() for address in
+                     headers.get(b"x-forwarded-for", b"").decode("latin-1").split(",")
+                     if address.strip()]
+        if len(forwarded) >= hops:
+            return forwarded[-hops]
+        real_ip = headers.get(b"x-real-ip", b"").decode("latin-1").strip()
+        if real_ip:
+            return real_ip
+    return scope["client"][0] if scope.get("client") else "unknown"
+
+
+class AdmissionControlMiddleware:
+    """
+    ASGI middleware admitting requests to expensive routes through their
+    pools. Requests are rejected with 429 and Retry-After when the client
+    is over its rate, the pool's queue is full or a slot does not free up
+    within the queue timeout.
+    """
+
+    def __init__(self, app, pools: dict = None):
+        self.app = app
+        self.pools = pools if pools is not None else default_pools()
+
+    async def __call__(self, scope, receive, send):
+        pool = None
+        if scope["type"] == "http":
+            pool = self.pools.get(scope["path"])
+        if pool is None:
+            await self.app(scope, receive, send)
+            return
+
+        wait = pool.client_wait(client_address(scope))
+        if wait:
+            await self.shed(scope, receive, send, pool, "rate_limited",
+                            math.ceil(wait))
+            return
+
+        if pool.semaphore.locked():
+            if pool.waiting >= pool.queue_size:
+                await self.shed(scope, receive, send, pool, "queue_full",
+                                pool.retry_after)
+                return
+            pool.waiting += 1
+            ADMISSION_QUEUED.set(pool.waiting, pool=pool.name)
+            acquired = False
+            try:
+                async with asyncio.timeout(pool.queue_timeout):
+                    await pool.semaphore.acquire()
+                    acquired = True
+            except TimeoutError:
+                # The timeout can fire just as the slot was granted; give
+                # it back rather than leak it
+                if acquired:
+                    pool.semaphore.release()
+                await self.shed(scope, receive, send, pool, "queue_timeout",
+                                pool.retry_after)
+                return
+            finally:
+                pool.waiting -= 1
+                ADMISSION_QUEUED.set(pool.waiting, pool=pool.name)
+        else:
+            await pool.semaphore.acquire()
+
+        ADMISSION_IN_FLIGHT.inc(pool=pool.name)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            ADMISSION_IN_FLIGHT.inc(-1, pool=pool.name)
+            pool.semaphore.release()
+
+    @staticmethod
+    async def shed(scope, receive, send, pool: RoutePool, reason: str,
+                   retry_after: int):
+        ADMISSION_SHED.inc(route=scope["path"], reason=reason)
+        match_route(scope)
+        response = FastJSONResponse(
+            {"detail": "Too many requests, please retry later.",
+             "success": False},
+            status_code=429,
+            headers={"Retry-After": str(max(1, retry_after))},
+        )
+        await response(scope, receive, send)
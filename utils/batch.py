@@ -0,0 +1,196 @@
+import json
+import os
+import time
+from utils.constants import BATCH_DIR
+from utils.lazy import lazy_import, lazy_object
+
+openai = lazy_import("openai")
+openai_parsing = lazy_import("openai.lib._parsing._completions")
+
+client = lazy_object(lambda: openai.OpenAI())
+
+ENDPOINT = "/v1/chat/completions"
+# Batch API limits on one input file, with some room for the byte limit
+MAX_REQUESTS_PER_BATCH = 50000
+MAX_BATCH_BYTES = 190 * 1024 * 1024
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+def chat_request(custom_id: str, model: str, messages: list[dict],
+                 response_format=None, **params) -> dict:
+    """
+    One line of a Batch API input file. response_format takes the same
+    pydantic models as client.beta.chat.completions.parse.
+    """
+    body = {"model": model, "messages": messages, **params}
+    if response_format is not None:
+        body["response_format"] = openai_parsing.type_to_response_format_param(
+            response_format)
+    return {"custom_id": custom_id, "method": "POST", "url": ENDPOINT, "body": body}
+
+
+def parse_result(result: dict, response_format):
+    """
+    The parsed response and usage of one line of a batch's output, or
+    raise ValueError for a failed request.
+    """
+    response = result.get("response") or {}
+    if result.get("error") or response.get("status_code") != 200:
+        error = result.get("error") or (response.get("body") or {}).get("error")
+        raise ValueError(f"Request failed: {error}")
+    body = response["body"]
+    message = body["choices"][0]["message"]
+    if message.get("refusal"):
+        raise ValueError(f"Refused: {message['refusal']}")
+    usage = body.get("usage")
+    return (response_format.model_validate_json(message["content"]),
+            openai.types.CompletionUsage(**usage) if usage else None)
+
+
+class BatchJob:
+    """
+    A Batch API job kept in a directory, so an interrupted run resumes at
+    the step it stopped at. The requests are split into input files that
+    are uploaded, created as batches, polled and downloaded, and state.json
+    records each batch's IDs and status. Results are handed to the ingest
+    callback once per batch.
+    """
+
+    def __init__(self, name: str, path: str = BATCH_DIR):
+        self.name = name
+        self.path = os.path.join(path, name)
+        self.state_path = os.path.join(self.path, "state.json")
+        self.state = {"batches": []}
+        if os.path.exists(self.state_path):
+            with open(self.state_path) as file:
+                self.state = json.load(file)
+
+    @property
+    def batches(self) -> list[dict]:
+        return self.state["batches"]
+
+    @property
+    def prepared(self) -> bool:
+        return bool(self.batches)
+
+    def save(self):
+        os.makedirs(self.path, exist_ok=True)
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(self.state, file, indent=2)
+        os.replace(tmp_path, self.state_path)
+
+    def file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def prepare(self, requests) -> int:
+        """
+        Write the requests to input files within the Batch API limits.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        batches, file, count, size = [], None, 0, 0
+        for request in requests:
+            line = json.dumps(request) + "\n"
+            if (file is None or count >= MAX_REQUESTS_PER_BATCH
+                    or size + len(line) > MAX_BATCH_BYTES):
+                if file is not None:
+                    file.close()
+                    batches[-1]["requests"] = count
+                name = f"input-{len(batches):03d}.jsonl"
+                batches.append({"input": name, "status": "prepared"})
+                file, count, size = open(self.file(name), "w"), 0, 0
+            file.write(line)
+            count += 1
+            size += len(line)
+        if file is not None:
+            file.close()
+            batches[-1]["requests"] = count
+        self.state["batches"] = batches
+        self.save()
+        return sum(batch["requests"] for batch in batches)
+
+    def submit(self):
+        for batch in self.batches:
+            if "input_file_id" not in batch:
+                with open(self.file(batch["input"]), "rb") as file:
+                    batch["input_file_id"] = client.files.create(
+                        file=file, purpose="batch").id
+                self.save()
+            if "batch_id" not in batch:
+                created = client.batches.create(
+                    input_file_id=batch["input_file_id"], endpoint=ENDPOINT,
+                    completion_window="24h", metadata={"job": self.name},
+                )
+                batch["batch_id"], batch["status"] = created.id, created.status
+                self.save()
+                print(f"Submitted {batch['input']} as {created.id} "
+                      f"({batch['requests']} requests).")
+
+    def wait(self, poll_interval: float = 30, timeout: float = None):
+        """
+        Poll the batches until each has finished, then download their
+        output and error files.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            pending = [batch for batch in self.batches
+                       if batch["status"] not in TERMINAL_STATUSES]
+            for batch in pending:
+                retrieved = client.batches.retrieve(batch["batch_id"])
+                counts = retrieved.request_counts
+                progress = (f"{retrieved.status}, {counts.completed + counts.failed}/"
+                            f"{counts.total} requests done" if counts else retrieved.status)
+                if progress != batch.get("progress"):
+                    print(f"{batch['batch_id']}: {progress}.")
+                batch["progress"] = progress
+                batch["status"] = retrieved.status
+                batch["output_file_id"] = retrieved.output_file_id
+                batch["error_file_id"] = retrieved.error_file_id
+            if pending:
+                self.save()
+            if all(batch["status"] in TERMINAL_STATUSES for batch in self.batches):
+                break
+            if deadline is not None and time.monotonic() >= deadline:
+                raise TimeoutError(f"Batch job {self.name} is still running; "
+                                   "run it again to resume.")
+            time.sleep(poll_interval)
+
+        for batch in self.batches:
+            for key, name in (("output_file_id", "output"), ("error_file_id", "errors")):
+                file_name = batch["input"].replace("input", name)
+                if not batch.get(key):
+                    continue
+                if not os.path.exists(self.file(file_name)):
+                    tmp_path = self.file(f"{file_name}.tmp")
+                    client.files.content(batch[key]).write_to_file(tmp_path)
+                    os.replace(tmp_path, self.file(file_name))
+                batch[name] = file_name
+        self.save()
+
+    def results(self, batch: dict):
+        for name in (batch.get("output"), batch.get("errors")):
+            if name:
+                with open(self.file(name)) as file:
+                    for line in file:
+                        if line.strip():
+                            yield json.loads(line)
+
+    def ingest(self, callback):
+        """
+        Pass each downloaded batch's results to callback, once. The callback
+        must be idempotent, since a run interrupted while ingesting passes
+        the same batch again.
+        """
+        for batch in self.batches:
+            if batch["status"] == "completed" and not batch.get("ingested"):
+                callback(self.results(batch))
+                batch["ingested"] = True
+                self.save()
+            elif batch["status"] != "completed":
+                print(f"{batch['batch_id']} ended {batch['status']}; "
+                      "its requests were not ingested.")
+
+    def run(self, callback, poll_interval: float = 30, timeout: float = None):
+        self.submit()
+        self.wait(poll_interval, timeout)
+        self.ingest(callback)
@@ -0,0 +1,94 @@
+import os
+import threading
+import msgpack
+from utils.cache import cached
+from utils.constants import BLOG_SUMMARIES_PATH, BLOG_SUMMARY_TOKENS
+from utils.context_builder import summarize
+from utils.get_blogs import fetch_blogs, filter_blog
+
+
+def blog_summary(title: str, body: str, max_tokens: int = BLOG_SUMMARY_TOKENS) -> dict:
+    return {"title": title, "summary": summarize(body, max_tokens)}
+
+
+class BlogSummaries:
+    """
+    Compact summaries of the blog posts by ID, written once by
+    populate_database.py so query_rag does not fetch and parse whole posts.
+    """
+
+    def __init__(self, summaries: dict = None):
+        # blog ID -> {"title", "summary"}
+        self.summaries = summaries or {}
+
+    def __len__(self):
+        return len(self.summaries)
+
+    def __contains__(self, blog_id):
+        return str(blog_id) in self.summaries
+
+    def get(self, blog_id) -> dict | None:
+        return self.summaries.get(str(blog_id))
+
+    def add(self, blog_id, title: str, body: str, max_tokens: int = BLOG_SUMMARY_TOKENS):
+        self.summaries[str(blog_id)] = blog_summary(title, body, max_tokens)
+
+    def save(self, path: str = BLOG_SUMMARIES_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as file:
+            file.write(msgpack.packb(self.summaries))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str = BLOG_SUMMARIES_PATH):
+        with open(path, "rb") as file:
+            return cls(msgpack.unpackb(file.read()))
+
+
+_summaries = None
+_summaries_mtime = None
+_summaries_lock = threading.Lock()
+
+
+def get_blog_summaries(path: str = BLOG_SUMMARIES_PATH) -> BlogSummaries:
+    """
+    The saved summaries, reloaded when populate_database.py rewrites them.
+    Empty if they have not been built.
+    """
+    global _summaries, _summaries_mtime
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return BlogSummaries()
+    with _summaries_lock:
+        if mtime != _summaries_mtime:
+            _summaries, _summaries_mtime = BlogSummaries.load(path), mtime
+        return _summaries
+
+
+def summarize_blogs(blog_ids: list, summaries: BlogSummaries = None) -> BlogSummaries:
+    """
+    Fetch and summarize the posts missing from summaries.
+    """
+    summaries = summaries if summaries is not None else BlogSummaries()
+    missing = [blog_id for blog_id in blog_ids if blog_id not in summaries]
+    for blog in fetch_blogs(missing):
+        post = filter_blog(blog)
+        summaries.add(blog["id"], post["title"], post["description"])
+    return summaries
+
+
+@cached("blog_summary")
+def fetch_blog_summary(blog_id) -> dict | None:
+    """
+    The summary of a post missing from the saved ones, written since the
+    last populate_database.py run. It is kept in the shared cache, so each
+    post is fetched once across workers, and the saved summaries are left
+    as populate_database.py wrote them.
+    """
+    blogs = fetch_blogs([blog_id])
+    if not blogs:
+        return None
+    post = filter_blog(blogs[0])
+    return blog_summary(post["title"], post["description"])
@@ -0,0 +1,344 @@
+import functools
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+import msgpack
+from pydantic import BaseModel
+from utils.constants import CACHE_BACKEND, CACHE_MAX_MB, CACHE_PATH, REDIS_URL
+from utils.deadline import stage_timeout
+from utils.metrics import record_cache
+
+# Default time to live per namespace, in seconds; override with
+# CACHE_TTL_<NAMESPACE>
+DEFAULT_TTLS = {
+    "rag": 24 * 3600,
+    "news": 6 * 3600,
+    "city_data": 24 * 3600,
+    "blog_summary": 24 * 3600,
+}
+DEFAULT_TTL = 3600
+
+# Keys of each namespace's generation token, which size-bounded eviction
+# must never drop: that would silently invalidate the whole namespace
+GENERATION_PREFIX = "gen:"
+
+# How long a worker may hold the lock for computing one value
+LOCK_TIMEOUT_SECONDS = 30
+LOCK_POLL_SECONDS = 0.05
+
+
+def ttl_for(namespace: str) -> int:
+    default = DEFAULT_TTLS.get(namespace, DEFAULT_TTL)
+    return int(os.getenv(f"CACHE_TTL_{namespace.upper()}", default))
+
+
+def _encode(value):
+    if isinstance(value, BaseModel):
+        return value.model_dump()
+    if isinstance(value, datetime):
+        return {"__datetime__": value.isoformat()}
+    raise TypeError(f"Cannot cache value of type {type(value).__name__}")
+
+
+def _decode(value: dict):
+    if "__datetime__" in value:
+        return datetime.fromisoformat(value["__datetime__"])
+    return value
+
+
+def pack(value) -> bytes:
+    return msgpack.packb(value, default=_encode, use_bin_type=True)
+
+
+def unpack(data: bytes):
+    return msgpack.unpackb(data, object_hook=_decode, raw=False,
+                           strict_map_key=False)
+
+
+class SQLiteCacheBackend:
+    """
+    Disk cache in a SQLite file in WAL mode, shared by every worker on the
+    host. When the stored values exceed max_bytes, the oldest entries are
+    evicted.
+    """
+
+    # Check the size bound once every this many writes per process
+    EVICT_EVERY = 100
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.local = threading.local()
+        self.writes = 0
+        os.register_at_fork(after_in_child=self.reset)
+
+    def reset(self):
+        # A forked worker opens its own connections
+        self.local = threading.local()
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY,
+                    value BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    stored_at REAL NOT NULL,
+                    expires_at REAL
+                )
+            """)
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_entries_stored_at ON entries (stored_at)")
+            self.local.conn = conn
+        return conn
+
+    def get(self, key: str) -> bytes | None:
+        row = self.conn.execute(
+            "SELECT value FROM entries WHERE key = ? "
+            "AND (expires_at IS NULL OR expires_at > ?)",
+            (key, time.time()),
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, value: bytes, ttl: float | None):
+        now = time.time()
+        self.conn.execute(
+            "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+            (key, value, len(value), now, now + ttl if ttl else None),
+        )
+        self.writes += 1
+        if self.writes % self.EVICT_EVERY == 0:
+            self.evict()
+
+    def add(self, key: str, value: bytes, ttl: float | None) -> bool:
+        """
+        Store the value only if the key is absent or expired. Returns True
+        if it was stored.
+        """
+        now = time.time()
+        conn = self.conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "DELETE FROM entries WHERE key = ? AND expires_at <= ?", (key, now))
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO entries VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value), now, now + ttl if ttl else None),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return cursor.rowcount == 1
+
+    def delete(self, key: str):
+        self.conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def evict(self):
+        """
+        Drop expired entries, then the oldest entries until the rest fit in
+        90% of max_bytes. Generation tokens are kept.
+        """
+        conn = self.conn
+        conn.execute("DELETE FROM entries WHERE expires_at <= ?", (time.time(),))
+        conn.execute("""
+            DELETE FROM entries WHERE key NOT LIKE ? AND stored_at <= (
+                SELECT stored_at FROM (
+                    SELECT stored_at,
+                           SUM(size) OVER (ORDER BY stored_at DESC) AS total
+                    FROM entries WHERE key NOT LIKE ?
+                ) WHERE total > ? ORDER BY stored_at DESC LIMIT 1
+            )
+        """, (f"{GENERATION_PREFIX}%", f"{GENERATION_PREFIX}%", int(self.max_bytes * 0.9)))
+
+    def clear(self):
+        self.conn.execute("DELETE FROM entries")
+
+
+class RedisCacheBackend:
+    """
+    Cache in Redis, or any server speaking the Redis protocol, shared by
+    every worker that points at it. The size bound is left to the server's
+    maxmemory policy.
+    """
+
+    def __init__(self, url: str):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("CACHE_BACKEND=redis requires the redis package.")
+        self.client = redis.Redis.from_url(url)
+
+    def get(self, key: str) -> bytes | None:
+        return self.client.get(key)
+
+    def set(self, key: str, value: bytes, ttl: float | None):
+        self.client.set(key, value, px=int(ttl * 1000) if ttl else None)
+
+    def add(self, key: str, value: bytes, ttl: float | None) -> bool:
+        return bool(self.client.set(
+            key, value, nx=True, px=int(ttl * 1000) if ttl else None))
+
+    def delete(self, key: str):
+        self.client.delete(key)
+
+    def clear(self):
+        self.client.flushdb()
+
+
+class NullCacheBackend:
+    """
+    Backend for CACHE_BACKEND=none: stores nothing.
+    """
+
+    def get(self, key: str) -> bytes | None:
+        return None
+
+    def set(self, key: str, value: bytes, ttl: float | None):
+        pass
+
+    def add(self, key: str, value: bytes, ttl: float | None) -> bool:
+        return True
+
+    def delete(self, key: str):
+        pass
+
+    def clear(self):
+        pass
+
+
+def create_backend(name: str = CACHE_BACKEND):
+    if name == "sqlite":
+        return SQLiteCacheBackend(CACHE_PATH, CACHE_MAX_MB * 1024 * 1024)
+    if name == "redis":
+        return RedisCacheBackend(REDIS_URL)
+    if name == "none":
+        return NullCacheBackend()
+    raise ValueError(f"Unknown CACHE_BACKEND: {name}")
+
+
+class SharedCache:
+    """
+    Namespaced result cache on top of a shared backend. Values are stored as
+    msgpack. Each namespace has a generation token in its keys, so
+    invalidating a namespace takes effect in every worker at once.
+    """
+
+    def __init__(self, backend_factory=create_backend):
+        self.backend_factory = backend_factory
+        self._backend = None
+        self.lock = threading.Lock()
+
+    @property
+    def backend(self):
+        # Created on first use so importing this module stays cheap
+        if self._backend is None:
+            with self.lock:
+                if self._backend is None:
+                    self._backend = self.backend_factory()
+        return self._backend
+
+    def generation(self, namespace: str) -> str:
+        key = f"{GENERATION_PREFIX}{namespace}"
+        token = self.backend.get(key)
+        if token is None:
+            # A fresh random token, so entries from before an evicted
+            # generation key can never be served again
+            token = uuid.uuid4().bytes
+            if not self.backend.add(key, token, None):
+                token = self.backend.get(key) or token
+        return token.hex()
+
+    def invalidate(self, namespace: str):
+        """
+        Make every cached value in the namespace unreachable.
+        """
+        self.backend.set(f"{GENERATION_PREFIX}{namespace}", uuid.uuid4().bytes, None)
+
+    def key(self, namespace: str, parts: tuple) -> str:
+        digest = hashlib.sha1(pack(parts)).hexdigest()
+        return f"{namespace}:{self.generation(namespace)}:{digest}"
+
+    def get(self, namespace: str, parts: tuple):
+        data = self.backend.get(self.key(namespace, parts))
+        return None if data is None else unpack(data)
+
+    def set(self, namespace: str, parts: tuple, value):
+        """
+        Store a value computed elsewhere, such as by a batch job.
+        """
+        self.backend.set(self.key(namespace, parts), pack(value), ttl_for(namespace))
+
+    def get_or_compute(self, namespace: str, parts: tuple, compute,
+                       encode=None, decode=None, cache_if=None):
+        """
+        Return the cached value for `parts`, or compute and store it. Only
+        one worker computes a given value at a time; the others wait for its
+        result, up to LOCK_TIMEOUT_SECONDS or the current deadline.
+        """
+        key = self.key(namespace, parts)
+        data = self.backend.get(key)
+        record_cache(namespace, data is not None)
+        if data is not None:
+            value = unpack(data)
+            return decode(value) if decode else value
+
+        lock_key = f"{key}:lock"
+        locked = self.backend.add(lock_key, b"", LOCK_TIMEOUT_SECONDS)
+        deadline = time.monotonic() + LOCK_TIMEOUT_SECONDS
+        while not locked and time.monotonic() < deadline:
+            # Stop waiting for the other worker once the current deadline
+            # runs out, by raising DeadlineExceeded
+            stage_timeout(f"{namespace}_lock_wait")
+            time.sleep(LOCK_POLL_SECONDS)
+            data = self.backend.get(key)
+            if data is not None:
+                value = unpack(data)
+                return decode(value) if decode else value
+            locked = self.backend.add(lock_key, b"", LOCK_TIMEOUT_SECONDS)
+
+        try:
+            value = compute()
+            if cache_if is None or cache_if(value):
+                stored = encode(value) if encode else value
+                self.backend.set(key, pack(stored), ttl_for(namespace))
+        finally:
+            if locked:
+                self.backend.delete(lock_key)
+        return value
+
+
+cache = SharedCache()
+
+
+def call_parts(args: tuple, kwargs: dict) -> tuple:
+    """
+    The key parts `cached` stores a call's result under.
+    """
+    return (args, sorted(kwargs.items()))
+
+
+def cached(namespace: str, cache_if=lambda value: value is not None):
+    """
+    Decorator caching a function's result in the shared cache, keyed on its
+    arguments.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            return cache.get_or_compute(
+                namespace, call_parts(args, kwargs),
+                lambda: fn(*args, **kwargs), cache_if=cache_if,
+            )
+        return wrapper
+    return decorator
@@ -0,0 +1,163 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from utils.constants import (
+    CHAT_CACHE_MAX_CITIES, CHAT_CACHE_MAX_PER_CITY, CHAT_CACHE_THRESHOLD,
+    CHAT_CACHE_TTL_SECONDS,
+)
+from utils.get_embedding_function import get_embedding_function
+from utils.metrics import record_cache
+
+
+def normalize_question(text: str) -> str:
+    return " ".join(re.findall(r"[a-z0-9+']+", text.lower()))
+
+
+def is_cacheable(messages: list) -> bool:
+    """
+    Only a conversation's opening question is answered the same way for
+    everyone; later turns depend on what came before.
+    """
+    return len(messages) == 1 and messages[0].role == "user"
+
+
+class CityAnswers:
+    """
+    The cached answers for one city: a matrix of unit question embeddings
+    searched by dot product, in least recently used order.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.vectors = None
+        self.questions = []
+        self.answers = []
+        self.expires = []
+        self.used = []
+
+    def __len__(self):
+        return len(self.answers)
+
+    def remove(self, i: int):
+        self.vectors = np.delete(self.vectors, i, axis=0)
+        for values in (self.questions, self.answers, self.expires, self.used):
+            del values[i]
+
+    def expire(self, now: float):
+        for i in reversed(range(len(self))):
+            if self.expires[i] <= now:
+                self.remove(i)
+
+    def find_exact(self, question: str, now: float) -> int | None:
+        for i, cached in enumerate(self.questions):
+            if cached == question and self.expires[i] > now:
+                return i
+        return None
+
+    def find_similar(self, vector: np.ndarray, threshold: float,
+                     now: float) -> int | None:
+        if not len(self):
+            return None
+        similarities = self.vectors @ vector
+        # Expired answers never win, so a live match behind one is found
+        similarities[np.asarray(self.expires) <= now] = -np.inf
+        i = int(np.argmax(similarities))
+        if similarities[i] >= threshold:
+            return i
+        return None
+
+    def add(self, question: str, vector: np.ndarray, answer: str,
+            ttl: float, now: float):
+        self.expire(now)
+        if len(self) >= self.capacity:
+            self.remove(int(np.argmin(self.used)))
+        vector = vector[np.newaxis, :]
+        self.vectors = vector if self.vectors is None else np.vstack([self.vectors, vector])
+        self.questions.append(question)
+        self.answers.append(answer)
+        self.expires.append(now + ttl)
+        self.used.append(now)
+
+
+class SemanticChatCache:
+    """
+    /chat answers keyed on the meaning of the question, one partition per
+    city. A question whose embedding is at least `threshold` cosine-similar
+    to a cached one gets that answer. Each worker keeps its own cache in
+    memory.
+    """
+
+    def __init__(self, threshold: float = CHAT_CACHE_THRESHOLD,
+                 ttl: float = CHAT_CACHE_TTL_SECONDS,
+                 max_per_city: int = CHAT_CACHE_MAX_PER_CITY,
+                 max_cities: int = CHAT_CACHE_MAX_CITIES):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_per_city = max_per_city
+        self.max_cities = max_cities
+        self.cities = OrderedDict()
+        self.lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold > 0
+
+    def embed(self, question: str) -> np.ndarray:
+        vector = np.asarray(get_embedding_function().embed_query(question),
+                            dtype=np.float32)
+        return vector / np.linalg.norm(vector)
+
+    def get_or_answer(self, city: str | None, question: str, answer) -> str:
+        """
+        The cached answer to a question about a city, or answer() stored
+        for the next similar question.
+        """
+        key = (city or "").strip().lower()
+        normalized = normalize_question(question)
+        now = time.time()
+        with self.lock:
+            answers = self.cities.get(key)
+            i = answers.find_exact(normalized, now) if answers else None
+            if i is not None:
+                return self._hit(key, answers, i, now)
+
+        # Embedding is a network call, so it runs outside the lock
+        try:
+            vector = self.embed(question)
+        except Exception as e:
+            print(f"Chat cache embedding failed: {e}")
+            record_cache("chat", False)
+            return answer()
+
+        with self.lock:
+            answers = self.cities.get(key)
+            i = answers.find_similar(vector, self.threshold, now) if answers else None
+            if i is not None:
+                return self._hit(key, answers, i, now)
+        record_cache("chat", False)
+
+        result = answer()
+        with self.lock:
+            answers = self.cities.get(key)
+            if answers is None:
+                answers = self.cities[key] = CityAnswers(self.max_per_city)
+                if len(self.cities) > self.max_cities:
+                    self.cities.popitem(last=False)
+            self.cities.move_to_end(key)
+            answers.add(normalized, vector, result, self.ttl, time.time())
+        return result
+
+    def _hit(self, key: str, answers: CityAnswers, i: int, now: float) -> str:
+        answers.used[i] = now
+        self.cities.move_to_end(key)
+        record_cache("chat", True)
+        return answers.answers[i]
+
+    def clear(self):
+        with self.lock:
+            self.cities.clear()
+
+
+chat_cache = SemanticChatCache()
@@ -1,3 +1,6 @@
+import numpy as np
+from utils.metrics import instrument
+
 # max_percentage = 99
 # min_percentage = 55
 
@@ -101,47 +104,55 @@ def compute_category_score(origin, destination, fields_config):
     score = linear_transform(avg_ratio)
     return clamp_value(score)
 
+CATEGORY_CONFIGS = {
+    "housing_availability": [
+        {"field": "home_price",                "higher_is_better": False},
+        {"field": "property_tax",              "higher_is_better": False},
+        {"field": "home_appreciation_rate",    "higher_is_better": True},
+        {"field": "price_per_square_foot",     "higher_is_better": False},
+    ],
+    "quality_of_life": [
+        {"field": "education",             "higher_is_better": True},
+        {"field": "healthcare_fitness",    "higher_is_better": True},
+        {"field": "weather_grade",         "higher_is_better": True},
+        {"field": "air_quality_index",     "higher_is_better": True},
+        {"field": "commute_transit_score", "higher_is_better": True},
+        {"field": "accessibility",         "higher_is_better": True},
+        {"field": "culture_entertainment", "higher_is_better": True},
+    ],
+    "job_market_strength": [
+        {"field": "unemployment_rate",       "higher_is_better": False},
+        {"field": "recent_job_growth",       "higher_is_better": True},
+        {"field": "future_job_growth_index", "higher_is_better": True},
+        {"field": "median_household_income", "higher_is_better": True},
+    ],
+    "living_affordability": [
+        {"field": "state_income_tax",    "higher_is_better": False},
+        {"field": "utilities",           "higher_is_better": False},
+        {"field": "food_groceries",      "higher_is_better": False},
+        {"field": "sales_tax",           "higher_is_better": False},
+        {"field": "transportation_cost", "higher_is_better": False},
+    ],
+}
+
+# Whether a larger value of each metric is better for the destination
+HIGHER_IS_BETTER = {
+    field_info["field"]: field_info["higher_is_better"]
+    for fields in CATEGORY_CONFIGS.values()
+    for field_info in fields
+}
+
+@instrument("city_score")
 def get_city_score(origin, destination):
     """
     Compare two cities using straightforward average-of-ratios logic for
     each category, then produce an overall city score.
     """
 
-    category_configs = {
-        "housing_availability": [
-            {"field": "home_price",                "higher_is_better": False},
-            {"field": "property_tax",              "higher_is_better": False},
-            {"field": "home_appreciation_rate",    "higher_is_better": True},
-            {"field": "price_per_square_foot",     "higher_is_better": False},
-        ],
-        "quality_of_life": [
-            {"field": "education",             "higher_is_better": True},
-            {"field": "healthcare_fitness",    "higher_is_better": True},
-            {"field": "weather_grade",         "higher_is_better": True},
-            {"field": "air_quality_index",     "higher_is_better": True},
-            {"field": "commute_transit_score", "higher_is_better": True},
-            {"field": "accessibility",         "higher_is_better": True},
-            {"field": "culture_entertainment", "higher_is_better": True},
-        ],
-        "job_market_strength": [
-            {"field": "unemployment_rate",       "higher_is_better": False},
-            {"field": "recent_job_growth",       "higher_is_better": True},
-            {"field": "future_job_growth_index", "higher_is_better": True},
-            {"field": "median_household_income", "higher_is_better": True},
-        ],
-        "living_affordability": [
-            {"field": "state_income_tax",    "higher_is_better": False},
-            {"field": "utilities",           "higher_is_better": False},
-            {"field": "food_groceries",      "higher_is_better": False},
-            {"field": "sales_tax",           "higher_is_better": False},
-            {"field": "transportation_cost", "higher_is_better": False},
-        ],
-    }
-
-    housing_score = compute_category_score(origin, destination, category_configs["housing_availability"])
-    qol_score = compute_category_score(origin, destination, category_configs["quality_of_life"])
-    job_score = compute_category_score(origin, destination, category_configs["job_market_strength"])
-    living_score = compute_category_score(origin, destination, category_configs["living_affordability"])
+    housing_score = compute_category_score(origin, destination, CATEGORY_CONFIGS["housing_availability"])
+    qol_score = compute_category_score(origin, destination, CATEGORY_CONFIGS["quality_of_life"])
+    job_score = compute_category_score(origin, destination, CATEGORY_CONFIGS["job_market_strength"])
+    living_score = compute_category_score(origin, destination, CATEGORY_CONFIGS["living_affordability"])
 
     overall_city_score = (
         housing_score + qol_score + job_score + living_score
@@ -155,3 +166,58 @@ def get_city_score(origin, destination):
         "living_affordability":   round(living_score, 2),
         "overall_city_score":     round(overall_city_score, 2),
     }
+
+
+# Fields in the column order get_city_scores expects
+SCORE_FIELDS = tuple(HIGHER_IS_BETTER)
+
+SCORE_KEYS = {
+    "housing_availability": "housing_affordability",
+    "quality_of_life": "quality_of_life",
+    "job_market_strength": "job_market_strength",
+    "living_affordability": "living_affordability",
+}
+
+
+def get_ratios(origin: np.ndarray, destination: np.ndarray,
+               higher_is_better: np.ndarray) -> np.ndarray:
+    """
+    get_ratio over arrays of values, one column per field.
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = np.where(higher_is_better, destination / origin, origin / destination)
+    ratio = np.clip(ratio, 0.0, 2.0)
+    ratio = np.where(destination == 0, 0.0, ratio)
+    ratio = np.where(origin == 0, 2.0, ratio)
+    return np.where((origin == 0) & (destination == 0), 1.0, ratio)
+
+
+@instrument("city_scores")
+def get_city_scores(origins: np.ndarray, destinations: np.ndarray) -> list[dict | None]:
+    """
+    get_city_score for many pairs at once. Row i of origins and
+    destinations holds the SCORE_FIELDS values of pair i's cities; pairs
+    with a missing (NaN) value get None.
+    """
+    higher_is_better = np.array([HIGHER_IS_BETTER[field] for field in SCORE_FIELDS])
+    ratios = get_ratios(origins, destinations, higher_is_better)
+    columns = {field: i for i, field in enumerate(SCORE_FIELDS)}
+
+    scores = {}
+    for category, fields_config in CATEGORY_CONFIGS.items():
+        # Summed field by field, in the same order as compute_category_score,
+        # so the results match it exactly
+        total = ratios[:, columns[fields_config[0]["field"]]]
+        for field_info in fields_config[1:]:
+            total = total + ratios[:, columns[field_info["field"]]]
+        scores[SCORE_KEYS[category]] = np.clip(
+            linear_transform(total / len(fields_config)), min_percentage, max_percentage)
+    overall = (scores["housing_affordability"] + scores["quality_of_life"]
+               + scores["job_market_strength"] + scores["living_affordability"]) / 4.0
+    scores["overall_city_score"] = np.clip(overall, min_percentage, max_percentage)
+
+    complete = ~(np.isnan(origins).any(axis=1) | np.isnan(destinations).any(axis=1))
+    keys = list(scores)
+    rows = np.column_stack([scores[key] for key in keys]).tolist()
+    return [{key: round(value, 2) for key, value in zip(keys, row)} if ok else None
+            for row, ok in zip(rows, complete.tolist())]
@@ -1,5 +1,88 @@
-CHROMA_PATH = "chroma"
+import os
+
+CHROMA_PATH = os.getenv("CHROMA_PATH", "chroma")
 NEWS_COLLECTION = "news-collection"
 BLOGS_COLLECTION = "blogs-collection"
-MAIN_URL = 'https://www.gayrealestate.com'
+MAIN_URL = os.getenv("MAIN_URL", 'https://www.gayrealestate.com')
 PERPLEXITY_MODEL="llama-3.1-sonar-large-128k-online"
+PERPLEXITY_BASE_URL = os.getenv(
+    "PERPLEXITY_BASE_URL", "https://api.perplexity.ai")
+STATE_DATA_PATH = os.getenv("STATE_DATA_PATH", "Data/State_Data")
+# Open CityList.db and news.db as immutable; disable if they are written to
+# while the app is running
+SQLITE_IMMUTABLE = os.getenv("SQLITE_IMMUTABLE", "1") == "1"
+# Shared result cache: "sqlite" (a file shared by all workers on the host),
+# "redis" or "none"
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "sqlite")
+CACHE_PATH = os.getenv("CACHE_PATH", "Data/cache.db")
+CACHE_MAX_MB = int(os.getenv("CACHE_MAX_MB", "512"))
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+# Set to 0 to disable the per-route concurrency pools and client limits
+ADMISSION_CONTROL = os.getenv("ADMISSION_CONTROL", "1") == "1"
+# Proxies in front of the app that append to X-Forwarded-For; admission
+# control tells clients apart by the address the outermost of them saw.
+# Set to 0 when clients connect directly, so the header cannot be spoofed
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "1"))
+# Cache warmer: how often it runs, and how many keys and seconds each run
+# may spend precomputing popular comparisons and news pages. It is off with
+# CACHE_BACKEND=none, where everything it computed would be thrown away
+WARMER_ENABLED = os.getenv("WARMER_ENABLED", "1") == "1" and CACHE_BACKEND != "none"
+WARMER_INTERVAL_SECONDS = float(os.getenv("WARMER_INTERVAL_SECONDS", "900"))
+WARMER_MAX_KEYS = int(os.getenv("WARMER_MAX_KEYS", "50"))
+WARMER_BUDGET_SECONDS = float(os.getenv("WARMER_BUDGET_SECONDS", "120"))
+# Reduce blog embeddings to this many dimensions with a fixed random
+# projection (0 keeps the full ada-002 vectors). The collection must be
+# rebuilt with populate_database.py --reset after changing it.
+EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", "0"))
+# Let the embeddings client split inputs over the model's context length,
+# counting tokens with tiktoken. The offline benchmarks turn it off, since
+# the encoding cannot be downloaded there
+EMBEDDING_CHECK_CTX_LENGTH = os.getenv("EMBEDDING_CHECK_CTX_LENGTH", "1") == "1"
+# BM25 index over the blog titles, written by populate_database.py
+LEXICAL_INDEX_PATH = os.getenv(
+    "LEXICAL_INDEX_PATH", os.path.join(CHROMA_PATH, "blogs-lexical.msgpack"))
+# Summaries of each blog post, written by populate_database.py, and the
+# token budgets of one summary and of query_rag's whole blog context
+BLOG_SUMMARIES_PATH = os.getenv(
+    "BLOG_SUMMARIES_PATH", os.path.join(CHROMA_PATH, "blogs-summaries.msgpack"))
+BLOG_SUMMARY_TOKENS = int(os.getenv("BLOG_SUMMARY_TOKENS", "200"))
+RAG_CONTEXT_BUDGET = int(os.getenv("RAG_CONTEXT_BUDGET", "1500"))
+# Statistical profiling of single requests: the share of requests sampled
+# (requests can also ask with X-Profile and the admin token), the sampling
+# interval and how many profiles are kept in PROFILE_DIR
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "Data/profiles")
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "200"))
+# Working directory of batch_jobs.py, one subdirectory per job
+BATCH_DIR = os.getenv("BATCH_DIR", "Data/batches")
+# Semantic cache of /chat answers per city: the cosine similarity a new
+# question needs to a cached one (0 disables the cache), how long answers
+# are kept, and the answers kept per city and the cities kept per worker
+CHAT_CACHE_THRESHOLD = float(os.getenv("CHAT_CACHE_THRESHOLD", "0.95"))
+CHAT_CACHE_TTL_SECONDS = float(os.getenv("CHAT_CACHE_TTL_SECONDS", str(24 * 3600)))
+CHAT_CACHE_MAX_PER_CITY = int(os.getenv("CHAT_CACHE_MAX_PER_CITY", "256"))
+CHAT_CACHE_MAX_CITIES = int(os.getenv("CHAT_CACHE_MAX_CITIES", "500"))
+# Static per-city bundles written by export_static_bundle.py and served
+# from /bundle
+STATIC_BUNDLE_DIR = os.getenv("STATIC_BUNDLE_DIR", "Data/static-bundle")
+# /comparison responds within COMPARISON_DEADLINE_SECONDS (0 waits as long
+# as it takes). Resources still being generated by then are left out and
+# marked pending; their generation keeps running in the background for up
+# to RESOURCES_DEADLINE_SECONDS, so the result is cached for the next request.
+COMPARISON_DEADLINE_SECONDS = float(os.getenv("COMPARISON_DEADLINE_SECONDS", "8"))
+RESOURCES_DEADLINE_SECONDS = float(os.getenv("RESOURCES_DEADLINE_SECONDS", "30"))
+# Timeout of outbound HTTP calls made outside any deadline
+HTTP_TIMEOUT_SECONDS = float(os.getenv("HTTP_TIMEOUT_SECONDS", "10"))
+# Sanitized request traces for benchmarks/replay.py are appended to
+# TRAFFIC_CAPTURE_PATH (unset disables capture), for this share of requests,
+# until the file reaches TRAFFIC_CAPTURE_MAX_MB
+TRAFFIC_CAPTURE_PATH = os.getenv("TRAFFIC_CAPTURE_PATH", "")
+TRAFFIC_CAPTURE_RATE = float(os.getenv("TRAFFIC_CAPTURE_RATE", "1"))
+TRAFFIC_CAPTURE_MAX_MB = float(os.getenv("TRAFFIC_CAPTURE_MAX_MB", "512"))
+# Secret keying the captured client pseudonyms and chat question hashes;
+# set it to match them across restarts and uvicorn workers
+TRAFFIC_CAPTURE_KEY = os.getenv("TRAFFIC_CAPTURE_KEY", "")
+# Where tiktoken keeps the o200k_base encoding. build.sh fetches it there, so
+# the app loads it from disk at startup instead of downloading it
+TIKTOKEN_CACHE_DIR = os.getenv("TIKTOKEN_CACHE_DIR", "Data/tiktoken")
@@ -0,0 +1,133 @@
+import os
+import re
+import threading
+from collections import Counter
+from utils.constants import TIKTOKEN_CACHE_DIR
+from utils.lazy import lazy_import
+from utils.metrics import RAG_CONTEXT_TOKENS
+
+tiktoken = lazy_import("tiktoken")
+
+# gpt-4o-mini's tokenizer
+ENCODING = "o200k_base"
+# Used when the encoding cannot be loaded, e.g. offline without a copy in
+# TIKTOKEN_CACHE_DIR; English text averages about four characters a token
+CHARS_PER_TOKEN = 4
+
+STOPWORDS = frozenset("""
+a about after all also an and any are as at be because been but by can
+could do for from has have how if in into is it its just more most no not
+of on or our out so some than that the their them there these they this
+to up was we were what when which who will with you your
+""".split())
+
+_encoding = None
+_encoding_failed = False
+_encoding_lock = threading.Lock()
+
+
+def get_encoding():
+    """
+    The tiktoken encoding, loaded once, at startup or preload, from
+    TIKTOKEN_CACHE_DIR. None if it cannot be loaded.
+    """
+    global _encoding, _encoding_failed
+    if _encoding is None and not _encoding_failed:
+        with _encoding_lock:
+            if _encoding is None and not _encoding_failed:
+                os.environ["TIKTOKEN_CACHE_DIR"] = TIKTOKEN_CACHE_DIR
+                try:
+                    _encoding = tiktoken.get_encoding(ENCODING)
+                except Exception as e:
+                    _encoding_failed = True
+                    print(f"Could not load the {ENCODING} tokenizer, estimating "
+                          f"token counts instead: {e}")
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    encoding = get_encoding()
+    if encoding is None:
+        return -(-len(text) // CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """
+    The longest prefix of text within max_tokens, cut back to a word
+    boundary.
+    """
+    if max_tokens <= 0:
+        return ""
+    encoding = get_encoding()
+    if encoding is None:
+        if len(text) <= max_tokens * CHARS_PER_TOKEN:
+            return text
+        text = text[:max_tokens * CHARS_PER_TOKEN]
+    else:
+        tokens = encoding.encode(text, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return text
+        text = encoding.decode(tokens[:max_tokens])
+    return text.rsplit(None, 1)[0] if " " in text else text
+
+
+def split_sentences(text: str) -> list[str]:
+    text = re.sub(r"\s+", " ", text).strip()
+    return [sentence for sentence in re.split(r"(?<=[.!?])\s+", text) if sentence]
+
+
+def summarize(text: str, max_tokens: int = 200) -> str:
+    """
+    Extractive summary: the sentences whose words are most frequent across
+    the text, kept in their original order, within max_tokens.
+    """
+    # Posts often repeat themselves; keep each sentence once
+    sentences = list(dict.fromkeys(split_sentences(text)))
+    if count_tokens(" ".join(sentences)) <= max_tokens:
+        return " ".join(sentences)
+
+    def words(sentence):
+        return [word for word in re.findall(r"[a-z0-9+']+", sentence.lower())
+                if word not in STOPWORDS]
+
+    frequency = Counter(word for sentence in sentences for word in words(sentence))
+    scores = []
+    for i, sentence in enumerate(sentences):
+        sentence_words = words(sentence)
+        score = sum(frequency[word] for word in sentence_words) / (len(sentence_words) or 1)
+        # Opening sentences usually introduce the post
+        scores.append((score * (1.5 if i < 2 else 1), i))
+
+    chosen, used = [], 0
+    for _, i in sorted(scores, reverse=True):
+        tokens = count_tokens(sentences[i])
+        if used + tokens > max_tokens:
+            continue
+        chosen.append(i)
+        used += tokens
+    if not chosen:
+        return truncate_tokens(sentences[0], max_tokens)
+    return " ".join(sentences[i] for i in sorted(chosen))
+
+
+def build_context(passages: list[dict], budget: int) -> tuple[str, int]:
+    """
+    Join passages ({"title", "text", "score"}) from most to least relevant
+    until the token budget is spent, truncating the last one that fits
+    partly. Returns the context and its token count.
+    """
+    parts, used = [], 0
+    separator = count_tokens("\n\n---\n\n")
+    for passage in sorted(passages, key=lambda passage: passage["score"], reverse=True):
+        remaining = budget - used - (separator if parts else 0)
+        header = f"title: {passage['title']}\ndescription: "
+        available = remaining - count_tokens(header)
+        # A few words of a post are not worth the title's tokens
+        if available < 32:
+            break
+        text = truncate_tokens(passage["text"], available)
+        parts.append(header + text)
+        used += (separator if len(parts) > 1 else 0) + count_tokens(header + text)
+    RAG_CONTEXT_TOKENS.observe(used)
+    return "\n\n---\n\n".join(parts), used
@@ -0,0 +1,114 @@
+import contextvars
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from utils.metrics import DEADLINE_EXCEEDED
+
+_current = contextvars.ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+class Deadline:
+    """
+    The time by which a request, or work started for it, must be done.
+    """
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() == 0
+
+
+@contextmanager
+def deadline(seconds: float):
+    """
+    Run the enclosed block under a deadline `seconds` from now, which the
+    stages it calls read with `stage_timeout`.
+    """
+    current = Deadline(seconds)
+    token = _current.set(current)
+    try:
+        yield current
+    finally:
+        _current.reset(token)
+
+
+def current_deadline() -> Deadline | None:
+    return _current.get()
+
+
+def stage_timeout(stage: str, share: float = 1.0, default=None):
+    """
+    The timeout of one stage: its share of the time left before the current
+    deadline, or `default` outside any deadline. Raises DeadlineExceeded
+    when no time is left, so a late stage is not started at all.
+    """
+    current = _current.get()
+    if current is None:
+        return default
+    remaining = current.remaining()
+    if remaining == 0:
+        DEADLINE_EXCEEDED.inc(stage=stage)
+        raise DeadlineExceeded(f"No time left for {stage}.")
+    return remaining * share
+
+
+def run_under(current: Deadline, func, *args, **kwargs):
+    """
+    Run func under an existing deadline, unless it passed while func
+    waited for a thread.
+    """
+    if current.expired:
+        DEADLINE_EXCEEDED.inc(stage="queued")
+        raise DeadlineExceeded("Deadline passed while queued.")
+    token = _current.set(current)
+    try:
+        return func(*args, **kwargs)
+    finally:
+        _current.reset(token)
+
+
+class BoundedExecutor:
+    """
+    Thread pool that refuses work once `max_pending` jobs are queued or
+    running, instead of building an unbounded backlog.
+    """
+
+    def __init__(self, workers: int, max_pending: int, name: str):
+        self.pool = ThreadPoolExecutor(workers, thread_name_prefix=name)
+        self.slots = threading.BoundedSemaphore(max_pending)
+
+    def submit(self, func, *args, **kwargs) -> Future | None:
+        """
+        The job's future, or None when the pool is full.
+        """
+        if not self.slots.acquire(blocking=False):
+            return None
+        try:
+            future = self.pool.submit(func, *args, **kwargs)
+        except BaseException:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda _: self.slots.release())
+        return future
+
+
+def submit(pool, seconds: float, func, *args, **kwargs) -> Future | None:
+    """
+    Run func on an executor under its own deadline, starting now, so time
+    spent queued counts against it. The caller's context variables are
+    copied, so a `profiled` func is sampled with the request that started
+    it. Returns None when a BoundedExecutor is full.
+    """
+    context = contextvars.copy_context()
+    return pool.submit(context.run, run_under, Deadline(seconds), func, *args, **kwargs)
@@ -0,0 +1,210 @@
+import math
+import sqlite3
+import threading
+from heapq import heappop, heappush, heapreplace
+import numpy as np
+from Database.readonly import CityTable, city_list_db
+
+EARTH_RADIUS_MILES = 3958.8
+
+CITY_COORDINATES_SQL = """
+    SELECT id, city, state_name, state_code, lat, lon FROM city_metrics
+    WHERE lat IS NOT NULL AND lon IS NOT NULL
+"""
+
+
+def to_unit_vectors(lat, lon) -> np.ndarray:
+    """
+    Points on the unit sphere. The straight-line (chord) distance between
+    two of them grows with their great-circle distance, so a Euclidean
+    KD-tree over these answers haversine queries exactly.
+    """
+    lat, lon = np.radians(lat), np.radians(lon)
+    return np.stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon),
+                     np.sin(lat)], axis=-1)
+
+
+def chord_to_miles(chord: float) -> float:
+    return 2 * EARTH_RADIUS_MILES * math.asin(min(chord / 2, 1.0))
+
+
+def miles_to_chord(miles: float) -> float:
+    return 2 * math.sin(min(miles / EARTH_RADIUS_MILES, math.pi) / 2)
+
+
+def haversine_miles(lat1, lon1, lat2, lon2) -> float:
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_MILES * math.asin(math.sqrt(a))
+
+
+class KDTree:
+    """
+    KD-tree over 3-D points, split on the widest axis at the median and
+    searched best-first by distance to each node's bounding box.
+    """
+
+    def __init__(self, points: np.ndarray, leaf_size: int = 64):
+        self.leaf_size = leaf_size
+        self.order = np.arange(len(points))
+        points = np.asarray(points, dtype=np.float64)
+        # Per node: [start, end) into order, bounding box and children
+        self.ranges, self.lows, self.highs, self.children = [], [], [], []
+        if len(points):
+            self._build(points, 0, len(points))
+        # Leaf points stored contiguously in tree order
+        self.points = points[self.order]
+
+    def _build(self, points: np.ndarray, start: int, end: int) -> int:
+        node = len(self.ranges)
+        box = points[self.order[start:end]]
+        low, high = box.min(axis=0), box.max(axis=0)
+        self.ranges.append((start, end))
+        self.lows.append(tuple(low.tolist()))
+        self.highs.append(tuple(high.tolist()))
+        self.children.append(None)
+        if end - start > self.leaf_size:
+            axis = int(np.argmax(high - low))
+            mid = (start + end) // 2
+            split = np.argpartition(box[:, axis], mid - start)
+            self.order[start:end] = self.order[start:end][split]
+            self.children[node] = (self._build(points, start, mid),
+                                   self._build(points, mid, end))
+        return node
+
+    def _box_distance(self, node: int, point: tuple) -> float:
+        total = 0.0
+        for value, low, high in zip(point, self.lows[node], self.highs[node]):
+            if value < low:
+                total += (low - value) ** 2
+            elif value > high:
+                total += (value - high) ** 2
+        return math.sqrt(total)
+
+    def query(self, point, k: int, max_distance: float = math.inf) -> list[tuple]:
+        """
+        Up to k (distance, index) pairs nearest to point and within
+        max_distance, nearest first.
+        """
+        if not self.ranges or k <= 0:
+            return []
+        point = tuple(float(value) for value in point)
+        target = np.array(point)
+        best = []  # max-heap of (-distance, index)
+        bound = max_distance
+        queue = [(self._box_distance(0, point), 0)]
+        while queue:
+            distance, node = heappop(queue)
+            if distance > bound:
+                break
+            children = self.children[node]
+            if children is not None:
+                for child in children:
+                    child_distance = self._box_distance(child, point)
+                    if child_distance <= bound:
+                        heappush(queue, (child_distance, child))
+                continue
+            start, end = self.ranges[node]
+            distances = np.sqrt(((self.points[start:end] - target) ** 2).sum(axis=1))
+            inside = np.flatnonzero(distances <= bound)
+            for distance, index in zip(distances[inside].tolist(),
+                                       self.order[start + inside].tolist()):
+                if distance > bound:
+                    continue
+                if len(best) < k:
+                    heappush(best, (-distance, index))
+                else:
+                    heapreplace(best, (-distance, index))
+                if len(best) == k:
+                    bound = min(max_distance, -best[0][0])
+        return sorted((-distance, index) for distance, index in best)
+
+
+class CityIndex:
+    """
+    Every city in the city list that has coordinates, with a KD-tree for
+    nearest-neighbour and radius queries.
+    """
+
+    def __init__(self, rows: list[tuple]):
+        # Sorted by ID, the order the city table keeps them in
+        rows = sorted(rows, key=lambda row: row[0])
+        self.cities = CityTable(rows)
+        self.coordinates = np.array([row[4:6] for row in rows], dtype=np.float64)
+        self.tree = KDTree(to_unit_vectors(self.coordinates[:, 0], self.coordinates[:, 1])
+                           if rows else np.empty((0, 3)))
+
+    def __len__(self) -> int:
+        return len(self.cities)
+
+    def location(self, id: int) -> tuple | None:
+        position = self.cities.position(id)
+        if position is None:
+            return None
+        return tuple(self.coordinates[position].tolist())
+
+    def nearest(self, lat: float, lon: float, k: int,
+                radius_miles: float = None, exclude: int = None) -> list[tuple]:
+        """
+        Up to k (CityRow, miles) pairs nearest to (lat, lon), nearest first,
+        optionally only within radius_miles.
+        """
+        max_distance = math.inf if radius_miles is None else miles_to_chord(radius_miles)
+        extra = 1 if exclude is not None and self.cities.position(exclude) is not None else 0
+        hits = self.tree.query(to_unit_vectors(lat, lon), k + extra, max_distance)
+        results = [(self.cities[index], chord_to_miles(distance))
+                   for distance, index in hits if self.cities[index].id != exclude]
+        return results[:k]
+
+    def distance_miles(self, from_id: int, to_id: int) -> float | None:
+        a, b = self.location(from_id), self.location(to_id)
+        if a is None or b is None:
+            return None
+        return haversine_miles(*a, *b)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def city_index() -> CityIndex:
+    """
+    The city index, loaded from CityList.db on first use. It is empty until
+    import_city_coordinates.py has added coordinates.
+    """
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                try:
+                    rows = city_list_db.fetchall(CITY_COORDINATES_SQL)
+                except sqlite3.OperationalError:
+                    print("CityList.db has no coordinates; run import_city_coordinates.py.")
+                    rows = []
+                _index = CityIndex(rows)
+    return _index
+
+
+def move_heading(from_city, to_city) -> dict:
+    """
+    The /comparison heading, sized by the distance between the two cities.
+    """
+    miles = city_index().distance_miles(from_city.id, to_city.id)
+    if miles is None:
+        return {
+            "title": "BIG MOVE!",
+            "description": f"A move from {from_city.city} to {to_city.city} covers a significant distance. This move would bring substantial changes in cost of living, climate, and urban environment.",
+        }
+    distance = f"A move from {from_city.city} to {to_city.city} covers about {round(miles):,} miles."
+    if miles < 100:
+        title = "LOCAL MOVE"
+        description = f"{distance} Your current community stays within easy reach."
+    elif miles < 500:
+        title = "REGIONAL MOVE"
+        description = f"{distance} Expect some changes in cost of living, climate, and urban environment."
+    else:
+        title = "BIG MOVE!"
+        description = f"{distance} This move would bring substantial changes in cost of living, climate, and urban environment."
+    return {"title": title, "description": description,
+            "distance_miles": round(miles, 1)}
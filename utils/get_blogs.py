@@ -1,6 +1,14 @@
 import requests
-from bs4 import BeautifulSoup
-from utils.constants import MAIN_URL
+from utils.constants import HTTP_TIMEOUT_SECONDS, MAIN_URL
+from utils.deadline import stage_timeout
+from utils.lazy import lazy_import
+from utils.metrics import timed
+
+bs4 = lazy_import("bs4")
+
+# Share of the time left that one post fetch may take, so the fetches leave
+# time for the LLM call after them
+WORDPRESS_FETCH_SHARE = 0.25
 
 
 def fetch_blogs(blog_ids: list[str]) -> dict:
@@ -10,8 +18,12 @@ def fetch_blogs(blog_ids: list[str]) -> dict:
 
     blogs = []
     for blog_id in blog_ids:
-        blog = requests.get(
-            MAIN_URL + "/blog/wp-json/wp/v2/posts/" + str(blog_id))
+        timeout = stage_timeout("wordpress_fetch", WORDPRESS_FETCH_SHARE,
+                                default=HTTP_TIMEOUT_SECONDS)
+        with timed("wordpress_fetch"):
+            blog = requests.get(
+                MAIN_URL + "/blog/wp-json/wp/v2/posts/" + str(blog_id),
+                timeout=timeout)
         if blog.status_code == 200:
             blogs.append(blog.json())
 
@@ -24,7 +36,7 @@ def filter_blog(blog: dict) -> dict:
     """
     return {
         "title": blog["title"]["rendered"],
-        "description": BeautifulSoup(blog["content"]["rendered"], "html.parser").text,
+        "description": bs4.BeautifulSoup(blog["content"]["rendered"], "html.parser").text,
     }
 
 
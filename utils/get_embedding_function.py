@@ -1,5 +1,81 @@
-from langchain_openai import OpenAIEmbeddings
+from functools import lru_cache
+import numpy as np
+from utils.constants import EMBEDDING_CHECK_CTX_LENGTH, EMBEDDING_DIMENSIONS
+from utils.lazy import lazy_import
+from utils.metrics import timed
 
-def get_embedding_function():
-    embeddings = OpenAIEmbeddings(model="text-embedding-ada-002")
+langchain_openai = lazy_import("langchain_openai")
+
+
+@lru_cache(maxsize=None)
+def _timed_embeddings_class():
+    # Defined on first use so importing this module does not pull in
+    # langchain_openai
+    class TimedOpenAIEmbeddings(langchain_openai.OpenAIEmbeddings):
+        """
+        OpenAI embeddings that record the query embedding round trip
+        separately from the vector search that follows it.
+        """
+
+        def embed_query(self, text: str) -> list[float]:
+            with timed("embedding"):
+                return super().embed_query(text)
+
+    return TimedOpenAIEmbeddings
+
+
+@lru_cache(maxsize=None)
+def projection_matrix(input_dimensions: int, dimensions: int) -> np.ndarray:
+    """
+    Fixed Gaussian random projection. It is seeded, so documents and queries
+    embedded in different processes are projected identically.
+    """
+    rng = np.random.default_rng(0)
+    return (rng.standard_normal((input_dimensions, dimensions))
+            / np.sqrt(dimensions)).astype(np.float32)
+
+
+def project(vectors, dimensions: int) -> np.ndarray:
+    """
+    Project vectors to `dimensions` and renormalize them, which roughly
+    preserves their distances.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    projected = vectors @ projection_matrix(vectors.shape[-1], dimensions)
+    return projected / np.linalg.norm(projected, axis=-1, keepdims=True)
+
+
+class ProjectedEmbeddings:
+    """
+    Embeddings reduced to fewer dimensions, for a smaller and faster index.
+    """
+
+    def __init__(self, embeddings, dimensions: int):
+        self.embeddings = embeddings
+        self.dimensions = dimensions
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return project(self.embeddings.embed_documents(texts),
+                       self.dimensions).tolist()
+
+    def embed_query(self, text: str) -> list[float]:
+        return project(self.embeddings.embed_query(text),
+                       self.dimensions).tolist()
+
+
+def get_embedding_function(dimensions: int = EMBEDDING_DIMENSIONS,
+                           timeout: float = None):
+    options = {}
+    if timeout is not None:
+        # A call under a deadline gets one attempt within it
+        options = {"request_timeout": timeout, "max_retries": 0}
+    embeddings = _timed_embeddings_class()(
+        model="text-embedding-ada-002",
+        check_embedding_ctx_length=EMBEDDING_CHECK_CTX_LENGTH,
+        **options,
+    )
+    # The blog collection must be built with the same setting it is queried
+    # with; Chroma rejects vectors of the wrong dimensionality
+    if dimensions:
+        embeddings = ProjectedEmbeddings(embeddings, dimensions)
     return embeddings
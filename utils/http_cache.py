@@ -0,0 +1,170 @@
+import gzip
+import hashlib
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+from starlette.datastructures import Headers, MutableHeaders
+from Database.readonly import city_list_db
+from utils.metrics import match_route
+
+# Bump when the payload of a cached route changes shape, so clients holding
+# responses from an older deploy revalidate instead of getting a 304
+RESPONSE_VERSION = "1"
+
+# Responses at least this large are gzipped when the client accepts it
+GZIP_MINIMUM_SIZE = 1000
+GZIP_LEVEL = 6
+
+# How long a data version is trusted before it is read again
+VERSION_TTL_SECONDS = 60
+
+
+@dataclass
+class CachePolicy:
+    max_age: int
+    stale_while_revalidate: int
+    # Returns a version of the data behind the route. Routes with a version
+    # answer If-None-Match without running the handler; routes without one
+    # get an ETag hashed from the response body.
+    version: Optional[Callable[[], str]] = None
+
+    @property
+    def cache_control(self) -> str:
+        return (f"public, max-age={self.max_age}, "
+                f"stale-while-revalidate={self.stale_while_revalidate}")
+
+
+class VersionCache:
+    def __init__(self, load: Callable[[], str]):
+        self.load = load
+        self.value = None
+        self.loaded_at = 0.0
+
+    def __call__(self) -> str:
+        now = time.monotonic()
+        if self.value is None or now - self.loaded_at > VERSION_TTL_SECONDS:
+            self.value = self.load()
+            self.loaded_at = now
+        return self.value
+
+
+CACHE_POLICIES = {
+    "/get-cities-list": CachePolicy(
+        max_age=3600, stale_while_revalidate=86400,
+        version=VersionCache(lambda: city_list_db.table_version("city_metrics")),
+    ),
+    # Scraped pages change without a version we can read, so the ETag
+    # comes from the response body
+    "/similar_posts": CachePolicy(max_age=600, stale_while_revalidate=3600),
+    # Metric filters read city metrics, which enrichment updates in place,
+    # so responses are only kept as long as /similar_posts
+    "/nearby-cities": CachePolicy(max_age=600, stale_while_revalidate=3600),
+}
+
+
+def make_etag(*parts: bytes) -> str:
+    digest = hashlib.sha1(b"\0".join(parts)).hexdigest()
+    return f'"{digest}"'
+
+
+def gzip_etag(etag: str) -> str:
+    # Each encoding of a representation needs its own strong ETag
+    return etag[:-1] + '-gzip"'
+
+
+def matching_etag(if_none_match: str | None, etag: str) -> str | None:
+    """
+    The variant of etag (identity or gzip) listed in If-None-Match, if any.
+    """
+    if not if_none_match:
+        return None
+    if if_none_match.strip() == "*":
+        return etag
+    candidates = {tag.strip() for tag in if_none_match.split(",")}
+    for variant in (etag, gzip_etag(etag)):
+        if variant in candidates:
+            return variant
+    return None
+
+
+class HTTPCacheMiddleware:
+    """
+    ASGI middleware adding ETag and Cache-Control headers to the GET routes
+    in CACHE_POLICIES, answering matching If-None-Match requests with 304
+    and gzipping large bodies.
+    """
+
+    def __init__(self, app, policies: dict = CACHE_POLICIES):
+        self.app = app
+        self.policies = policies
+
+    async def __call__(self, scope, receive, send):
+        policy = None
+        if scope["type"] == "http" and scope["method"] == "GET":
+            policy = self.policies.get(scope["path"])
+        if policy is None:
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        if_none_match = headers.get("if-none-match")
+        accepts_gzip = "gzip" in headers.get("accept-encoding", "")
+
+        etag = None
+        if policy.version is not None:
+            etag = make_etag(
+                RESPONSE_VERSION.encode(), scope["path"].encode(),
+                scope["query_string"], policy.version().encode(),
+            )
+            matched = matching_etag(if_none_match, etag)
+            if matched:
+                match_route(scope)
+                await self.send_not_modified(send, policy, matched)
+                return
+
+        start, body = None, []
+
+        async def buffer(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                start = message
+            elif message["type"] == "http.response.body":
+                body.append(message.get("body", b""))
+
+        await self.app(scope, receive, buffer)
+        body = b"".join(body)
+
+        response_headers = MutableHeaders(raw=start["headers"])
+        if start["status"] != 200:
+            await send(start)
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        if etag is None:
+            etag = make_etag(RESPONSE_VERSION.encode(), body)
+            matched = matching_etag(if_none_match, etag)
+            if matched:
+                await self.send_not_modified(send, policy, matched)
+                return
+
+        response_headers["Cache-Control"] = policy.cache_control
+        response_headers.add_vary_header("Accept-Encoding")
+        if accepts_gzip and len(body) >= GZIP_MINIMUM_SIZE:
+            # mtime=0 keeps the gzipped bytes identical between requests
+            body = gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+            response_headers["Content-Encoding"] = "gzip"
+            etag = gzip_etag(etag)
+        response_headers["ETag"] = etag
+        response_headers["Content-Length"] = str(len(body))
+        await send(start)
+        await send({"type": "http.response.body", "body": body})
+
+    @staticmethod
+    async def send_not_modified(send, policy: CachePolicy, etag: str):
+        headers = MutableHeaders()
+        headers["ETag"] = etag
+        headers["Cache-Control"] = policy.cache_control
+        headers["Vary"] = "Accept-Encoding"
+        await send({"type": "http.response.start", "status": 304,
+                    "headers": headers.raw})
+        await send({"type": "http.response.body", "body": b""})
@@ -0,0 +1,73 @@
+import importlib
+import threading
+
+
+# Lazy imports run one at a time: modules first used from two threads at
+# once can share dependencies (pydantic.v1 under LangChain) that fail when
+# one thread sees the other's half-initialized module. Reentrant, as one
+# import may load another lazy module.
+_import_lock = threading.RLock()
+
+
+class LazyModule:
+    """
+    Stand-in for a module that is imported on first attribute access.
+    """
+
+    def __init__(self, name: str):
+        self.__dict__["_name"] = name
+        self.__dict__["_module"] = None
+
+    def _load(self):
+        module = self.__dict__["_module"]
+        if module is None:
+            with _import_lock:
+                module = self.__dict__["_module"]
+                if module is None:
+                    module = importlib.import_module(self.__dict__["_name"])
+                    self.__dict__["_module"] = module
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = "loaded" if self.__dict__["_module"] else "not loaded"
+        return f"<lazy module {self.__dict__['_name']!r} ({state})>"
+
+
+class LazyObject:
+    """
+    Stand-in for an object (such as an API client) built by `factory` on
+    first attribute access, so construction cost and configuration lookups
+    happen on first use rather than at import time.
+    """
+
+    def __init__(self, factory):
+        self.__dict__["_factory"] = factory
+        self.__dict__["_instance"] = None
+        self.__dict__["_lock"] = threading.Lock()
+
+    def _load(self):
+        instance = self.__dict__["_instance"]
+        if instance is None:
+            with self.__dict__["_lock"]:
+                instance = self.__dict__["_instance"]
+                if instance is None:
+                    instance = self.__dict__["_factory"]()
+                    self.__dict__["_instance"] = instance
+        return instance
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __call__(self, *args, **kwargs):
+        return self._load()(*args, **kwargs)
+
+
+def lazy_import(name: str) -> LazyModule:
+    return LazyModule(name)
+
+
+def lazy_object(factory) -> LazyObject:
+    return LazyObject(factory)
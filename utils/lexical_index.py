@@ -0,0 +1,225 @@
+import math
+import os
+import re
+import threading
+import unicodedata
+from functools import lru_cache
+import msgpack
+from utils.constants import LEXICAL_INDEX_PATH
+
+STOPWORDS = frozenset({
+    "a", "an", "and", "at", "by", "for", "from", "in", "is", "of", "on",
+    "or", "the", "to", "with",
+})
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+# Reciprocal rank fusion constant
+RRF_K = 60
+
+
+def fold(text: str) -> str:
+    # Fold accents so "San José" matches "San Jose"
+    text = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+
+def words(text: str) -> list[str]:
+    return re.findall(r"[a-z0-9]+", fold(text.lower()))
+
+
+def tokenize(text: str) -> list[str]:
+    return [token for token in words(text) if token not in STOPWORDS]
+
+
+def contains_phrase(tokens: list[str], phrase: list[str]) -> bool:
+    n = len(phrase)
+    return any(tokens[i:i + n] == phrase for i in range(len(tokens) - n + 1))
+
+
+def phrase_pattern(name: str) -> str:
+    return r"[\W_]+".join(map(re.escape, words(name)))
+
+
+class PlaceNames:
+    """
+    What the city list says about a name found in a blog title: whether
+    cities in several states share it ("Portland"), which longer city names
+    contain it ("New York" contains "York"), and which state a text puts it
+    in. `cities` yields (city, state_code, state_name) rows.
+    """
+
+    def __init__(self, cities):
+        states = {}
+        self.longer = {}
+        # state code -> state name, and the codes by folded state name
+        self.state_names = {}
+        for city, state_code, state_name in cities:
+            tokens = tuple(tokenize(city or ""))
+            states.setdefault(tokens, set()).add(state_code)
+            if state_code and state_name:
+                self.state_names[state_code] = state_name
+            for n in range(1, len(tokens)):
+                for i in range(len(tokens) - n + 1):
+                    self.longer.setdefault(tokens[i:i + n], set()).add(tokens)
+        self.shared = frozenset(name for name, codes in states.items() if len(codes) > 1)
+        self.state_codes = {" ".join(words(name)): code
+                            for code, name in self.state_names.items()}
+        # Longest first, so "West Virginia" is not read as "Virginia"
+        self.state_pattern = "|".join(
+            phrase_pattern(name)
+            for name in sorted(self.state_names.values(), key=len, reverse=True))
+
+    def is_shared(self, name: str) -> bool:
+        return tuple(tokenize(name)) in self.shared
+
+    def states_named(self, name: str, text: str) -> set[str]:
+        """
+        The codes of the states the text names right after `name`, as in
+        "Portland, Maine" or "Portland, OR". Codes count only in capitals,
+        so "Portland in 2024" is not Indiana.
+        """
+        if not words(name) or not self.state_pattern:
+            return set()
+        pattern = (rf"(?i:\b{phrase_pattern(name)}\b)[\s,]+"
+                   rf"(?:(?i:({self.state_pattern}))\b|([A-Z]{{2}})\b)")
+        codes = set()
+        for match in re.finditer(pattern, fold(text)):
+            if match.group(1):
+                codes.add(self.state_codes[" ".join(words(match.group(1)))])
+            elif match.group(2) in self.state_names:
+                codes.add(match.group(2))
+        return codes
+
+    def in_state(self, name: str, state_code: str, *texts: str) -> bool | None:
+        """
+        Whether `name` in the texts is the city in `state_code`: decided by
+        the first text naming its state, otherwise True unless cities in
+        several states share the name, when it is None (ambiguous).
+        """
+        for text in texts:
+            codes = self.states_named(name, text or "")
+            if codes:
+                return state_code in codes
+        return None if self.is_shared(name) else True
+
+    def names_other_place(self, name: str, title: str) -> bool:
+        """
+        True when every mention of `name` in the title is part of a longer
+        city name, as in "New York" for "York".
+        """
+        phrase, tokens = tokenize(name), tokenize(title)
+        present = set(tokens)
+        covered = set()
+        for other in self.longer.get(tuple(phrase), ()):
+            if present.issuperset(other):
+                n = len(other)
+                for i in range(len(tokens) - n + 1):
+                    if tuple(tokens[i:i + n]) == other:
+                        covered.update(range(i, i + n))
+        n = len(phrase)
+        return not any(tokens[i:i + n] == phrase and not covered.issuperset(range(i, i + n))
+                       for i in range(len(tokens) - n + 1))
+
+
+@lru_cache(maxsize=None)
+def place_names() -> PlaceNames:
+    from Database.readonly import city_list_db
+    return PlaceNames(city_list_db.fetchall(
+        "SELECT city, state_code, state_name FROM city_metrics"))
+
+
+class LexicalIndex:
+    """
+    BM25 inverted index over the blog titles, built alongside the Chroma
+    collection by populate_database.py.
+    """
+
+    def __init__(self, ids: list, titles: list[str]):
+        self.ids = ids
+        self.titles = titles
+        self.tokens = [tokenize(title) for title in titles]
+        self.postings = {}
+        for doc, tokens in enumerate(self.tokens):
+            for token in set(tokens):
+                self.postings.setdefault(token, []).append(doc)
+        self.average_length = (sum(map(len, self.tokens)) / len(self.tokens)
+                               if self.tokens else 0)
+
+    def idf(self, term: str) -> float:
+        df = len(self.postings.get(term, ()))
+        return math.log(1 + (len(self.ids) - df + 0.5) / (df + 0.5))
+
+    def search(self, query: str, k: int = 3) -> list[dict]:
+        """
+        Top k titles by BM25 score. Each hit has the IDF-weighted share of
+        the query terms its title contains (`coverage`), and is `exact` when
+        the title contains every query term, in order.
+        """
+        terms = tokenize(query)
+        weights = {term: self.idf(term) for term in set(terms)}
+        scores = {}
+        for term, idf in weights.items():
+            for doc in self.postings.get(term, ()):
+                tf = self.tokens[doc].count(term)
+                norm = K1 * (1 - B + B * len(self.tokens[doc]) / self.average_length)
+                scores[doc] = scores.get(doc, 0) + idf * tf * (K1 + 1) / (tf + norm)
+        ranked = sorted(scores, key=scores.get, reverse=True)[:k]
+        total = sum(weights.values())
+        return [{
+            "id": self.ids[doc],
+            "content": self.titles[doc],
+            "score": scores[doc],
+            "coverage": sum(weights[term] for term in set(self.tokens[doc])
+                            if term in weights) / total,
+            "exact": contains_phrase(self.tokens[doc], terms),
+        } for doc in ranked]
+
+    def save(self, path: str = LEXICAL_INDEX_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as file:
+            file.write(msgpack.packb({"ids": self.ids, "titles": self.titles}))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str = LEXICAL_INDEX_PATH):
+        with open(path, "rb") as file:
+            data = msgpack.unpackb(file.read())
+        return cls(data["ids"], data["titles"])
+
+
+_index = None
+_index_mtime = None
+_index_lock = threading.Lock()
+
+
+def get_lexical_index(path: str = LEXICAL_INDEX_PATH):
+    """
+    The saved index, reloaded when populate_database.py rewrites it. None if
+    it has not been built.
+    """
+    global _index, _index_mtime
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    with _index_lock:
+        if mtime != _index_mtime:
+            _index, _index_mtime = LexicalIndex.load(path), mtime
+        return _index
+
+
+def reciprocal_rank_fusion(*rankings: list[dict], k: int = 3) -> list[dict]:
+    """
+    Merge ranked hit lists by reciprocal rank, keeping the first copy of
+    each document.
+    """
+    scores, hits = {}, {}
+    for ranking in rankings:
+        for rank, hit in enumerate(ranking):
+            scores[hit["id"]] = scores.get(hit["id"], 0) + 1 / (RRF_K + rank + 1)
+            hits.setdefault(hit["id"], hit)
+    ranked = sorted(scores, key=scores.get, reverse=True)[:k]
+    return [{**hits[id], "score": scores[id]} for id in ranked]
@@ -0,0 +1,54 @@
+# smaps_rollup fields, in kB, summed into each report column
+SMAPS_FIELDS = {
+    "rss": ("Rss",),
+    "pss": ("Pss",),
+    "shared": ("Shared_Clean", "Shared_Dirty"),
+    "private": ("Private_Clean", "Private_Dirty"),
+}
+
+
+def process_memory(pid: int | str = "self") -> dict | None:
+    """
+    A process's memory in bytes: resident (rss), its proportional share of
+    pages shared with other processes (pss), and how much of its resident
+    memory is shared or private. None where /proc/<pid>/smaps_rollup is not
+    available (non-Linux, or kernels before 4.14).
+    """
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as file:
+            lines = file.readlines()
+    except OSError:
+        return None
+    values = {}
+    for line in lines:
+        parts = line.split()
+        if len(parts) == 3 and parts[2] == "kB":
+            values[parts[0].rstrip(":")] = int(parts[1]) * 1024
+    return {column: sum(values.get(field, 0) for field in fields)
+            for column, fields in SMAPS_FIELDS.items()}
+
+
+def format_mb(value: int) -> str:
+    return f"{value / 1024 / 1024:8.1f}"
+
+
+def memory_report(processes: dict) -> str:
+    """
+    A table of process_memory for named PIDs, in MB, with totals. The PSS
+    total is what the processes really use together; the RSS total counts
+    shared pages once per process.
+    """
+    lines = [f"{'process':<16}{'pid':>8}{'rss':>9}{'pss':>9}{'shared':>9}{'private':>9}"]
+    totals = dict.fromkeys(SMAPS_FIELDS, 0)
+    for name, pid in processes.items():
+        usage = process_memory(pid)
+        if usage is None:
+            lines.append(f"{name:<16}{pid:>8}  (no memory information)")
+            continue
+        for column in totals:
+            totals[column] += usage[column]
+        lines.append(f"{name:<16}{pid:>8}" + "".join(
+            f" {format_mb(usage[column])}" for column in SMAPS_FIELDS))
+    lines.append(f"{'total':<16}{'':>8}" + "".join(
+        f" {format_mb(totals[column])}" for column in SMAPS_FIELDS))
+    return "\n".join(lines)
@@ -0,0 +1,291 @@
+import time
+import threading
+from contextlib import contextmanager
+from functools import wraps
+
+
+# Histogram buckets in seconds, covering fast DB lookups up to slow LLM calls
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0
+)
+
+_lock = threading.Lock()
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key: tuple, extra: dict = None) -> str:
+    items = list(key) + list((extra or {}).items())
+    if not items:
+        return ""
+    parts = []
+    for name, value in items:
+        value = str(value).replace("\\", "\\\\").replace(
+            "\n", "\\n").replace('"', '\\"')
+        parts.append(f'{name}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self.values = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        return self.values.get(_label_key(labels), 0)
+
+    def render(self) -> list[str]:
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} counter",
+        ]
+        for key, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    def set(self, value: float, **labels):
+        with _lock:
+            self.values[_label_key(labels)] = value
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, description: str, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(buckets)
+        # label key -> [bucket counts..., sum, count]
+        self.values = {}
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        with _lock:
+            series = self.values.get(key)
+            if series is None:
+                series = self.values[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> list[str]:
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} histogram",
+        ]
+        for key, series in sorted(self.values.items()):
+            for bound, count in zip(self.buckets, series):
+                labels = _format_labels(key, {"le": bound})
+                lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = _format_labels(key, {"le": "+Inf"})
+            lines.append(f"{self.name}_bucket{labels} {series[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {series[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {series[-1]}")
+        return lines
+
+
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Time spent handling HTTP requests, by route template.",
+)
+STAGE_DURATION = Histogram(
+    "stage_duration_seconds",
+    "Time spent in each instrumented pipeline stage.",
+)
+STAGE_ERRORS = Counter(
+    "stage_errors_total",
+    "Number of instrumented stages that raised an exception.",
+)
+CACHE_REQUESTS = Counter(
+    "cache_requests_total",
+    "Cache lookups, by cache name and result (hit or miss).",
+)
+CACHE_HIT_RATIO = Gauge(
+    "cache_hit_ratio",
+    "Fraction of cache lookups that were hits since process start.",
+)
+LLM_TOKENS = Counter(
+    "llm_tokens_total",
+    "LLM tokens consumed, by model, call site and token type.",
+)
+ADMISSION_SHED = Counter(
+    "admission_shed_total",
+    "Requests rejected with 429 by admission control, by route and reason.",
+)
+ADMISSION_IN_FLIGHT = Gauge(
+    "admission_in_flight",
+    "Requests currently running in each admission pool.",
+)
+ADMISSION_QUEUED = Gauge(
+    "admission_queued",
+    "Requests currently waiting for a slot in each admission pool.",
+)
+RAG_RETRIEVAL = Counter(
+    "rag_retrieval_total",
+    "Blog retrievals in query_rag, by the path that served them "
+    "(lexical, hybrid or vector).",
+)
+DEADLINE_EXCEEDED = Counter(
+    "deadline_exceeded_total",
+    "Stages skipped or cut short because their request's deadline passed, "
+    "by stage.",
+)
+
+# Token buckets for prompt sizes
+TOKEN_BUCKETS = (100, 250, 500, 1000, 1500, 2000, 3000, 5000, 8000, 16000, 32000)
+LLM_PROMPT_TOKENS = Histogram(
+    "llm_prompt_tokens",
+    "Prompt tokens of each LLM call, by model and call site.",
+    buckets=TOKEN_BUCKETS,
+)
+RAG_CONTEXT_TOKENS = Histogram(
+    "rag_context_tokens",
+    "Tokens of blog context put into each query_rag prompt.",
+    buckets=TOKEN_BUCKETS,
+)
+
+REGISTRY = [
+    REQUEST_DURATION,
+    STAGE_DURATION,
+    STAGE_ERRORS,
+    CACHE_REQUESTS,
+    CACHE_HIT_RATIO,
+    LLM_TOKENS,
+    ADMISSION_SHED,
+    ADMISSION_IN_FLIGHT,
+    ADMISSION_QUEUED,
+    RAG_RETRIEVAL,
+    DEADLINE_EXCEEDED,
+    LLM_PROMPT_TOKENS,
+    RAG_CONTEXT_TOKENS,
+]
+
+
+@contextmanager
+def timed(stage: str):
+    """
+    Time the enclosed block and record it under the given stage name.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        STAGE_ERRORS.inc(stage=stage)
+        raise
+    finally:
+        STAGE_DURATION.observe(time.perf_counter() - start, stage=stage)
+
+
+def instrument(stage: str):
+    """
+    Decorator version of `timed` for whole functions.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_cache(cache: str, hit: bool):
+    """
+    Record a cache lookup and refresh the hit ratio for that cache.
+    """
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+    hits = CACHE_REQUESTS.get(cache=cache, result="hit")
+    misses = CACHE_REQUESTS.get(cache=cache, result="miss")
+    CACHE_HIT_RATIO.set(hits / (hits + misses), cache=cache)
+
+
+def record_llm_usage(call_site: str, model: str, usage):
+    """
+    Record token usage from an OpenAI-compatible completion `usage` object.
+    """
+    if usage is None:
+        return
+    LLM_TOKENS.inc(usage.prompt_tokens or 0, model=model,
+                   call_site=call_site, type="prompt")
+    LLM_PROMPT_TOKENS.observe(usage.prompt_tokens or 0, model=model,
+                              call_site=call_site)
+    LLM_TOKENS.inc(usage.completion_tokens or 0, model=model,
+                   call_site=call_site, type="completion")
+
+
+def render_prometheus() -> str:
+    """
+    Render every registered metric in the Prometheus text exposition format.
+    """
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+_routes_by_path = {}
+
+
+def match_route(scope):
+    """
+    Store the route for the request's path in the scope, as the router
+    would, for middleware that responds before the router runs. Only
+    routes without path parameters are matched.
+    """
+    path = scope["path"]
+    if path not in _routes_by_path:
+        _routes_by_path[path] = next(
+            (route for route in scope["app"].router.routes
+             if getattr(route, "path", None) == path), None)
+    scope["route"] = _routes_by_path[path]
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording a latency histogram per route template.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # The router stores the matched route in the scope; fall back to
+            # a fixed label so unknown paths cannot blow up label cardinality
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            REQUEST_DURATION.observe(
+                time.perf_counter() - start,
+                method=scope["method"],
+                route=path,
+                status=status["code"],
+            )
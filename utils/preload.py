@@ -0,0 +1,79 @@
+import gc
+import importlib
+import threading
+import time
+from Database.get_verified_db import init_db
+from Database.readonly import preload_city_table
+from utils.blog_summaries import get_blog_summaries
+from utils.City_Data.percentiles import load_percentile_tables
+from utils.City_Data.state_fallback import state_fallback
+from utils.context_builder import get_encoding
+from utils.geo import city_index
+from utils.lexical_index import get_lexical_index, place_names
+from utils.static_bundle import get_bundle
+
+# Modules the app imports on first use. Imported once before forking, their
+# code and data are shared by every worker instead of loaded by each.
+PRELOAD_MODULES = (
+    "openai",
+    "langchain.prompts",
+    "langchain_openai",
+    "langchain_chroma",
+    "chromadb",
+    "bs4",
+    "selenium.webdriver",
+)
+
+
+def preload_modules():
+    for name in PRELOAD_MODULES:
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            print(f"Could not preload {name}: {e}")
+
+
+def preload_metrics():
+    if init_db():
+        load_percentile_tables()
+    else:
+        print("City metrics database unavailable; workers will load it.")
+
+
+# The Chroma collection is not opened here: its client holds SQLite
+# connections and threads that cannot be carried into a forked worker
+PRELOAD_STEPS = (
+    ("modules", preload_modules),
+    ("tokenizer", get_encoding),
+    ("city list", preload_city_table),
+    ("city index", city_index),
+    ("lexical index", get_lexical_index),
+    ("place names", place_names),
+    ("blog summaries", get_blog_summaries),
+    ("static bundle", get_bundle),
+    ("state fallback", state_fallback.load),
+    ("metrics", preload_metrics),
+)
+
+
+def preload():
+    """
+    Load everything workers only read, before they are forked.
+    """
+    for name, step in PRELOAD_STEPS:
+        start = time.perf_counter()
+        step()
+        print(f"Preloaded {name} in {(time.perf_counter() - start) * 1000:.0f}ms.")
+    if threading.active_count() > 1:
+        # Threads do not survive a fork, and locks they hold stay held
+        print(f"Warning: {threading.active_count() - 1} threads running before fork.")
+
+
+def freeze():
+    """
+    Move every object allocated so far out of the garbage collector's
+    reach. Collections in the workers would otherwise write to the headers
+    of these objects and copy the shared pages holding them.
+    """
+    gc.collect()
+    gc.freeze()
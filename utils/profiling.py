@@ -0,0 +1,238 @@
+import asyncio
+import contextvars
+import json
+import os
+import random
+import re
+import secrets
+import sys
+import threading
+import time
+from collections import Counter
+from functools import lru_cache, wraps
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.routing import Match
+from utils.admin import ADMIN_TOKEN
+from utils.constants import (
+    PROFILE_DIR, PROFILE_INTERVAL_MS, PROFILE_MAX_FILES, PROFILE_SAMPLE_RATE,
+)
+
+# Profile names are "<start ms>-<route>-<random>"; only these are served
+PROFILE_NAME = re.compile(r"^\d+-[a-z0-9_]+-[0-9a-f]+$")
+
+_active_profile = contextvars.ContextVar("active_profile", default=None)
+# One profile at a time, so sampled traffic cannot stack up samplers
+_profile_slot = threading.Lock()
+
+
+@lru_cache(maxsize=4096)
+def short_path(filename: str) -> str:
+    for prefix in sorted(sys.path, key=len, reverse=True):
+        if prefix and filename.startswith(prefix + os.sep):
+            return filename[len(prefix) + 1:]
+    return filename
+
+
+def collapse(frame) -> str:
+    """
+    A stack in the collapsed format read by flamegraph.pl and speedscope,
+    outermost frame first.
+    """
+    labels = []
+    while frame is not None:
+        code = frame.f_code
+        labels.append(f"{code.co_qualname} ({short_path(code.co_filename)})")
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class Profile:
+    """
+    Statistical profile of one request: a sampler thread records the stacks
+    of the threads running the request's handler every interval.
+    """
+
+    def __init__(self, method: str, route: str, interval: float):
+        self.method = method
+        self.route = route
+        self.interval = interval
+        self.started_at = time.time()
+        slug = re.sub(r"[^a-z0-9]+", "_", route.lower()).strip("_") or "root"
+        self.name = f"{int(self.started_at * 1000)}-{slug}-{secrets.token_hex(4)}"
+        self.threads = set()
+        self.stacks = Counter()
+        self.samples = 0
+        self.duration = 0.0
+        self.stopped = threading.Event()
+        self.sampler = threading.Thread(target=self._sample, name="profiler", daemon=True)
+
+    def start(self):
+        self.start_time = time.perf_counter()
+        self.sampler.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.sampler.join()
+        self.duration = time.perf_counter() - self.start_time
+
+    def _sample(self):
+        while not self.stopped.wait(self.interval):
+            frames = sys._current_frames()
+            for ident in list(self.threads):
+                frame = frames.get(ident)
+                if frame is not None:
+                    self.stacks[collapse(frame)] += 1
+                    self.samples += 1
+
+    def save(self, status: int, path: str = PROFILE_DIR):
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, f"{self.name}.collapsed"), "w") as file:
+            for stack, count in self.stacks.most_common():
+                file.write(f"{stack} {count}\n")
+        with open(os.path.join(path, f"{self.name}.json"), "w") as file:
+            json.dump({
+                "name": self.name,
+                "method": self.method,
+                "route": self.route,
+                "status": status,
+                "started_at": self.started_at,
+                "duration_ms": round(self.duration * 1000, 1),
+                "samples": self.samples,
+                "interval_ms": self.interval * 1000,
+            }, file)
+        prune_profiles(path)
+
+
+def profiled(func):
+    """
+    Decorator for sync route handlers, letting a profile started by
+    ProfilingMiddleware sample the threadpool thread the handler runs in.
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        profile = _active_profile.get()
+        if profile is None:
+            return func(*args, **kwargs)
+        ident = threading.get_ident()
+        profile.threads.add(ident)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profile.threads.discard(ident)
+    # Only requests to wrapped routes are sampled
+    wrapper.profiled = True
+    return wrapper
+
+
+def is_profiled_route(scope) -> bool:
+    """
+    Whether the request goes to a route wrapped in `profiled`. Others run
+    where the sampler cannot see them and would give empty profiles.
+    """
+    for route in scope["app"].router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(getattr(route, "endpoint", None), "profiled", False)
+    return False
+
+
+def list_profiles(path: str = PROFILE_DIR, limit: int = 50) -> list[dict]:
+    """
+    Metadata of the most recent profiles, newest first.
+    """
+    if not os.path.isdir(path):
+        return []
+    names = sorted((name[:-5] for name in os.listdir(path)
+                    if name.endswith(".json") and PROFILE_NAME.match(name[:-5])),
+                   key=lambda name: int(name.split("-", 1)[0]), reverse=True)
+    profiles = []
+    for name in names[:limit]:
+        try:
+            with open(os.path.join(path, f"{name}.json")) as file:
+                profiles.append(json.load(file))
+        except (OSError, ValueError):
+            continue
+    return profiles
+
+
+def read_profile(name: str, path: str = PROFILE_DIR) -> str | None:
+    if not PROFILE_NAME.match(name):
+        return None
+    try:
+        with open(os.path.join(path, f"{name}.collapsed")) as file:
+            return file.read()
+    except FileNotFoundError:
+        return None
+
+
+def prune_profiles(path: str = PROFILE_DIR, keep: int = PROFILE_MAX_FILES):
+    names = sorted((name[:-5] for name in os.listdir(path)
+                    if name.endswith(".json") and PROFILE_NAME.match(name[:-5])),
+                   key=lambda name: int(name.split("-", 1)[0]))
+    for name in names[:-keep] if len(names) > keep else []:
+        for extension in (".json", ".collapsed"):
+            try:
+                os.remove(os.path.join(path, name + extension))
+            except FileNotFoundError:
+                pass
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware profiling requests sent with `X-Profile: 1` and a valid
+    X-Admin-Token, plus a random PROFILE_SAMPLE_RATE share of requests to
+    `profiled` routes. The profile name is returned in the X-Profile-Id
+    header; profiles without samples are not saved.
+    """
+
+    def __init__(self, app, sample_rate: float = PROFILE_SAMPLE_RATE,
+                 interval_ms: float = PROFILE_INTERVAL_MS):
+        self.app = app
+        self.sample_rate = sample_rate
+        self.interval = interval_ms / 1000
+        # With no admin token and no sampling, no request can be profiled
+        self.enabled = bool(ADMIN_TOKEN) or sample_rate > 0
+
+    def should_profile(self, scope) -> bool:
+        if (self.sample_rate > 0 and random.random() < self.sample_rate
+                and is_profiled_route(scope)):
+            return True
+        if not ADMIN_TOKEN:
+            return False
+        headers = Headers(scope=scope)
+        token = headers.get("x-admin-token")
+        return (headers.get("x-profile") == "1" and token is not None
+                and secrets.compare_digest(token, ADMIN_TOKEN))
+
+    async def __call__(self, scope, receive, send):
+        if (not self.enabled or scope["type"] != "http"
+                or not self.should_profile(scope)
+                or not _profile_slot.acquire(blocking=False)):
+            await self.app(scope, receive, send)
+            return
+
+        profile = Profile(scope["method"], scope["path"], self.interval)
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                MutableHeaders(scope=message)["X-Profile-Id"] = profile.name
+            await send(message)
+
+        token = _active_profile.set(profile)
+        profile.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profile.stop()
+            _active_profile.reset(token)
+            _profile_slot.release()
+            if profile.samples == 0:
+                # Too short to sample, or run where the sampler cannot see it
+                return
+            try:
+                await asyncio.to_thread(profile.save, status)
+            except OSError as e:
+                print(f"Could not save profile {profile.name}: {e}")
@@ -1,11 +1,20 @@
-from langchain_chroma import Chroma
-from langchain.prompts import ChatPromptTemplate
-from openai import OpenAI
 from utils.get_embedding_function import get_embedding_function
-from utils.get_blogs import fetch_blogs, filter_blogs
+from utils.blog_summaries import fetch_blog_summary, get_blog_summaries
 from pydantic import BaseModel
 from typing import List
-from utils.constants import CHROMA_PATH, BLOGS_COLLECTION
+from utils.constants import CHROMA_PATH, BLOGS_COLLECTION, RAG_CONTEXT_BUDGET
+from utils.context_builder import build_context, count_tokens
+from utils.deadline import stage_timeout
+from utils.metrics import RAG_RETRIEVAL, timed, record_llm_usage
+from utils.lazy import lazy_import, lazy_object
+from utils.cache import cached
+from utils.lexical_index import (
+    get_lexical_index, place_names, reciprocal_rank_fusion,
+)
+
+langchain_chroma = lazy_import("langchain_chroma")
+langchain_prompts = lazy_import("langchain.prompts")
+openai = lazy_import("openai")
 
 
 class Resource(BaseModel):
@@ -74,7 +83,15 @@ You are tasked with finding and listing resources related to LGBTQ+ support serv
 **Answer:**
 """
 
-client = OpenAI()
+client = lazy_object(lambda: openai.OpenAI())
+
+# Share of the time left before a deadline that one query embedding may take
+EMBEDDING_SHARE = 0.25
+# Lexical hits considered before keeping those naming the destination
+LEXICAL_CANDIDATES = 10
+# IDF-weighted share of the destination's name a title must contain to be
+# fused with vector results, so a shared "New" or "San" is not enough
+LEXICAL_MIN_COVERAGE = 0.5
 
 
 def format_file_reference(reference):
@@ -97,69 +114,173 @@ def format_file_reference(reference):
 """
 
 
-def query_rag(from_city, to_city):
+def vector_search(db, query_text: str, k: int = 3) -> list[dict]:
+    # vector_search includes the embedding call, which is also timed alone
+    with timed("vector_search"):
+        results = db.similarity_search_with_relevance_scores(query_text, k=k)
+    return [{
+        "id": doc.metadata.get("id", "unknown"),
+        "score": score,
+        "content": doc.page_content,
+    } for doc, score in results]
+
+
+def retrieve_blogs(from_city, to_city, to_state, k: int = 3):
+    """
+    Find the blog titles relevant to a move. Titles naming the destination
+    are found in the lexical index without an embedding call, unless they
+    could be about a city of the same name in another state. Otherwise
+    vector search runs, and titles matching the destination's name or part
+    of it are fused with its results.
+
+    Returns the query text, the sources (None if the collection is empty)
+    and the path that served them.
+    """
+    query_text = "Resources for the LGBTQ+ Community in" + to_city
 
-    db = Chroma(
+    lexical = []
+    index = get_lexical_index()
+    if index is not None:
+        with timed("lexical_search"):
+            hits = index.search(to_city, LEXICAL_CANDIDATES)
+        names, summaries = place_names(), get_blog_summaries()
+        exact = []
+        for hit in hits:
+            # Titles naming "York" only inside "New York" are about another city
+            if names.names_other_place(to_city, hit["content"]):
+                continue
+            # The state named after the city in the title, or else in the
+            # post's summary, tells "Portland, Maine" from Portland, Oregon
+            summary = summaries.get(hit["id"]) or {}
+            in_state = names.in_state(to_city, to_state, hit["content"], summary.get("summary"))
+            if in_state is False:
+                continue
+            lexical.append(hit)
+            if hit["exact"] and in_state:
+                exact.append(hit)
+        # Exact titles that could be about a same-named city elsewhere are
+        # fused with vector search instead
+        if exact:
+            return query_text, lexical_sources(exact[:k]), "lexical"
+        lexical = [hit for hit in lexical if hit["coverage"] >= LEXICAL_MIN_COVERAGE]
+
+    db = langchain_chroma.Chroma(
         persist_directory=CHROMA_PATH,
-        embedding_function=get_embedding_function(),
+        embedding_function=get_embedding_function(
+            timeout=stage_timeout("embedding", EMBEDDING_SHARE)),
         collection_name=BLOGS_COLLECTION
     )
-
-    # Search the DB.
-    query_text = "Resources for the LGBTQ+ Community in" + to_city
-    temperature = 0.2
-    results = db.similarity_search_with_relevance_scores(query_text, k=3)
-    if len(results) == 0 or results[0][1] < 0.9:
+    results = vector_search(db, query_text, k)
+    if len(results) == 0 or results[0]["score"] < 0.9:
         query_text = f"From {from_city} to {to_city}: LGBTQ+ Cities"
-        results = db.similarity_search_with_relevance_scores(query_text, k=3)
+        results = vector_search(db, query_text, k)
+    if len(results) == 0 and not lexical:
+        return query_text, None, "vector"
+    # Skip low-relevance scores
+    results = [result for result in results if result["score"] >= 0.9]
 
-    if len(results) == 0:
-        return {"lgbtq-resources": "No relevant resources found."}
+    if not lexical:
+        return query_text, with_retriever(results, "vector"), "vector"
+    fused = reciprocal_rank_fusion(lexical_sources(lexical),
+                                   with_retriever(results, "vector"), k=k)
+    return query_text, fused, "hybrid"
 
-    sources = []
-    for doc, score in results:
-        if score < 0.9:
-            continue  # Skip low-relevance scores
-        sources.append({
-            "id": doc.metadata.get("id", "unknown"),
-            "score": score,
-            "content": doc.page_content,
-        })
-
-    # Fetch blogs based on source IDs
-    blog_ids = [source["id"] for source in sources]
-    blogs = fetch_blogs(blog_ids)
-    blogs = filter_blogs(blogs)
-
-    # Create the context text for the prompt
-    context_text = "\n\n---\n\n".join(
-        [f"title: {blog['title']}\ndescription: {blog['description']}" for blog in blogs]
-    )
 
-    if len(blogs) == 0:
+def with_retriever(hits: list[dict], retriever: str) -> list[dict]:
+    return [{**hit, "retriever": retriever} for hit in hits]
+
+
+def lexical_sources(hits: list[dict]) -> list[dict]:
+    return with_retriever([{key: hit[key] for key in ("id", "score", "content")}
+                           for hit in hits], "lexical")
+
+
+RAG_MODEL = "gpt-4o-mini"
+
+
+def rag_prompt(from_city, to_city, to_state) -> dict | None:
+    """
+    Retrieve and summarize the blogs for a move and build the query_rag
+    prompt. None when the blog collection is empty.
+    """
+    query_text, sources, path = retrieve_blogs(from_city, to_city, to_state)
+    RAG_RETRIEVAL.inc(path=path)
+    temperature = 0.2
+
+    if sources is None:
+        return None
+
+    # Summaries written at ingest time; posts added since are fetched and
+    # summarized once into the shared cache
+    summaries = get_blog_summaries()
+    passages = []
+    for source in sources:
+        summary = summaries.get(source["id"])
+        if summary is None:
+            with timed("blog_summarize"):
+                summary = fetch_blog_summary(source["id"])
+        # The sources of one retrieval path share a score scale: BM25,
+        # relevance or reciprocal rank fusion
+        if summary is not None:
+            passages.append({"title": summary["title"], "text": summary["summary"],
+                             "score": source["score"]})
+    context_text, context_tokens = build_context(passages, RAG_CONTEXT_BUDGET)
+
+    if len(passages) == 0:
         context_text = "No relevant blogs found, in the database. Please use your own knowledge to generate the response."
         temperature = 0.8
 
     # Format the prompt using the template
-    prompt_template = ChatPromptTemplate.from_template(PROMPT_TEMPLATE)
+    prompt_template = langchain_prompts.ChatPromptTemplate.from_template(PROMPT_TEMPLATE)
     prompt = prompt_template.format(
         context=context_text,
         question=query_text,
         json_template=sample_json
     )
+    return {
+        "prompt": prompt,
+        "temperature": temperature,
+        "sources": sources,
+        "context_tokens": context_tokens,
+    }
 
-    # Make the API call for the completion
-    completion = client.beta.chat.completions.parse(
-        model="gpt-4o-mini",
-        messages=[{"role": "user", "content": prompt}],
-        response_format=ResourceResponse,
-        temperature=temperature
-    )
-
-    # Parse the response into the expected Resource format
-    response_text = completion.choices[0].message.parsed.response
 
+def rag_result(request: dict, parsed: ResourceResponse, usage) -> dict:
+    """
+    The query_rag result for a prompt from rag_prompt and the model's
+    parsed response.
+    """
     return {
-        "lgbtq_resources": response_text,  # Return the response text
-        "sources": sources,  # Add the sources for traceability
+        "lgbtq_resources": parsed.response,  # Return the response text
+        "sources": request["sources"],  # Add the sources for traceability
+        "prompt_stats": {
+            "context_tokens": request["context_tokens"],
+            "context_budget": RAG_CONTEXT_BUDGET,
+            "prompt_tokens": usage.prompt_tokens if usage else count_tokens(request["prompt"]),
+            "completion_tokens": usage.completion_tokens if usage else None,
+        },
     }
+
+
+@cached("rag")
+def query_rag(from_city, to_city, to_state):
+    request = rag_prompt(from_city, to_city, to_state)
+    if request is None:
+        return {"lgbtq-resources": "No relevant resources found."}
+
+    # Under a deadline the call gets the time left, with no retries
+    timeout = stage_timeout("llm_resources")
+    llm = client if timeout is None else client.with_options(timeout=timeout, max_retries=0)
+
+    # Make the API call for the completion
+    with timed("llm_resources"):
+        completion = llm.beta.chat.completions.parse(
+            model=RAG_MODEL,
+            messages=[{"role": "user", "content": request["prompt"]}],
+            response_format=ResourceResponse,
+            temperature=request["temperature"]
+        )
+    record_llm_usage("query_rag", RAG_MODEL, completion.usage)
+
+    # Parse the response into the expected Resource format
+    return rag_result(request, completion.choices[0].message.parsed, completion.usage)
@@ -0,0 +1,50 @@
+import asyncio
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Token bucket allowing `rate` operations per second with bursts of up to
+    `capacity`.
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens +
+                          (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, tokens: float = 1.0) -> float:
+        """
+        Take tokens if available. Returns 0 on success, otherwise the number
+        of seconds until enough tokens will have accumulated.
+        """
+        with self.lock:
+            self._refill(time.monotonic())
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return 0.0
+            return (tokens - self.tokens) / self.rate
+
+
+class AsyncRateLimiter:
+    """
+    Awaitable wrapper around a TokenBucket for asyncio workers.
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.bucket = TokenBucket(rate, capacity)
+
+    async def acquire(self, tokens: float = 1.0):
+        while True:
+            wait = self.bucket.try_acquire(tokens)
+            if wait == 0:
+                return
+            await asyncio.sleep(wait)
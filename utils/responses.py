@@ -0,0 +1,39 @@
+from typing import Any
+import orjson
+from pydantic import BaseModel
+from starlette.responses import JSONResponse, StreamingResponse
+
+OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+
+def _default(obj):
+    if isinstance(obj, BaseModel):
+        return obj.model_dump()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSON response rendered with orjson. Routes that return it directly skip
+    FastAPI's jsonable_encoder pass; Pydantic models are dumped on the fly.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=_default, option=OPTIONS)
+
+
+class NDJSONResponse(StreamingResponse):
+    """
+    Streams each object from an iterator as one line of JSON, as soon as it
+    is produced.
+    """
+
+    media_type = "application/x-ndjson"
+
+    def __init__(self, objects, **kwargs):
+        super().__init__(
+            (orjson.dumps(obj, default=_default,
+                          option=OPTIONS | orjson.OPT_APPEND_NEWLINE)
+             for obj in objects),
+            **kwargs,
+        )
@@ -0,0 +1,172 @@
+import gzip
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import threading
+import time
+import numpy as np
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from utils.constants import STATIC_BUNDLE_DIR
+from utils.http_cache import CachePolicy, gzip_etag, make_etag, matching_etag
+
+# Bundles are directories named after their version; CURRENT names the one
+# being served
+CURRENT_FILE = "CURRENT"
+PACK_FILE = "cities.pack"
+INDEX_FILE = "cities.idx.npy"
+AUTOCOMPLETE_FILE = "autocomplete.json.gz"
+MANIFEST_FILE = "manifest.json"
+AUTOCOMPLETE_FIELDS = ["id", "city", "state_code", "state_name"]
+
+# Shards only change with a new export, which changes their ETags
+BUNDLE_POLICY = CachePolicy(max_age=3600, stale_while_revalidate=86400)
+
+
+def compress(document) -> bytes:
+    # mtime=0 so unchanged data compresses to identical bytes
+    return gzip.compress(json.dumps(document, separators=(",", ":")).encode(),
+                         compresslevel=9, mtime=0)
+
+
+class BundleWriter:
+    """
+    Writes a bundle: one gzipped JSON shard per city, both as files to
+    upload to a CDN or object storage and packed into one file the API
+    memory-maps, plus the autocomplete index.
+    """
+
+    def __init__(self, root: str = STATIC_BUNDLE_DIR):
+        self.root = root
+        self.tmp_path = os.path.join(root, f".export-{os.getpid()}")
+        shutil.rmtree(self.tmp_path, ignore_errors=True)
+        os.makedirs(os.path.join(self.tmp_path, "cities"))
+        self.pack = open(os.path.join(self.tmp_path, PACK_FILE), "wb")
+        self.index = []
+        self.digest = hashlib.sha1()
+
+    def add_city(self, id: int, shard: dict):
+        data = compress(shard)
+        with open(os.path.join(self.tmp_path, "cities", f"{id}.json.gz"), "wb") as file:
+            file.write(data)
+        self.index.append((id, self.pack.tell(), len(data)))
+        self.pack.write(data)
+        self.digest.update(data)
+
+    def finish(self, autocomplete_rows: list, manifest: dict, activate: bool = True) -> str:
+        """
+        Write the index and autocomplete, name the bundle after its content
+        and, if `activate`, make it current. Returns the version.
+        """
+        self.pack.close()
+        index = np.array(sorted(self.index), dtype=np.int64).reshape(-1, 3)
+        np.save(os.path.join(self.tmp_path, INDEX_FILE), index)
+        autocomplete = compress({"fields": AUTOCOMPLETE_FIELDS, "rows": autocomplete_rows})
+        with open(os.path.join(self.tmp_path, AUTOCOMPLETE_FILE), "wb") as file:
+            file.write(autocomplete)
+        self.digest.update(autocomplete)
+
+        version = f"{time.strftime('%Y%m%d%H%M%S')}-{self.digest.hexdigest()[:8]}"
+        with open(os.path.join(self.tmp_path, MANIFEST_FILE), "w") as file:
+            json.dump({"version": version, "cities": len(index), **manifest}, file, indent=2)
+        os.replace(self.tmp_path, os.path.join(self.root, version))
+        if not activate:
+            return version
+        tmp_current = os.path.join(self.root, f"{CURRENT_FILE}.tmp")
+        with open(tmp_current, "w") as file:
+            file.write(version)
+        os.replace(tmp_current, os.path.join(self.root, CURRENT_FILE))
+        return version
+
+
+def prune_bundles(root: str = STATIC_BUNDLE_DIR, keep: int = 3) -> list[str]:
+    """
+    Delete all but the newest `keep` bundles. Workers still mapping a
+    deleted bundle keep reading it until they switch to the current one.
+    """
+    with open(os.path.join(root, CURRENT_FILE)) as file:
+        current = file.read().strip()
+    versions = sorted(name for name in os.listdir(root)
+                      if os.path.isfile(os.path.join(root, name, MANIFEST_FILE)))
+    removed = [version for version in versions[:-keep] if version != current]
+    for version in removed:
+        shutil.rmtree(os.path.join(root, version))
+    return removed
+
+
+class Bundle:
+    """
+    One exported bundle, memory-mapped: a city's shard is a slice of the
+    pack file found by binary search in the index.
+    """
+
+    def __init__(self, path: str, version: str):
+        self.version = version
+        # The content hash part of the version, unchanged by re-exporting
+        # the same data
+        self.digest = version.rsplit("-", 1)[-1]
+        self.index = np.load(os.path.join(path, INDEX_FILE), mmap_mode="r")
+        with open(os.path.join(path, PACK_FILE), "rb") as file:
+            # mmap cannot map an empty file
+            self.pack = (mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+                         if os.fstat(file.fileno()).st_size else b"")
+        with open(os.path.join(path, AUTOCOMPLETE_FILE), "rb") as file:
+            self.autocomplete = file.read()
+
+    def city(self, id: int) -> bytes | None:
+        ids = self.index[:, 0]
+        i = int(np.searchsorted(ids, id))
+        if i == len(ids) or ids[i] != id:
+            return None
+        _, offset, length = self.index[i]
+        return self.pack[offset:offset + length]
+
+
+_bundle = None
+_bundle_mtime = None
+_bundle_lock = threading.Lock()
+
+
+def get_bundle(root: str = STATIC_BUNDLE_DIR) -> Bundle | None:
+    """
+    The current bundle, switched when an export makes a new one current.
+    None if none has been exported.
+    """
+    global _bundle, _bundle_mtime
+    current = os.path.join(root, CURRENT_FILE)
+    try:
+        mtime = os.stat(current).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    with _bundle_lock:
+        if mtime != _bundle_mtime:
+            with open(current) as file:
+                version = file.read().strip()
+            # Earlier bundles stay mapped until the requests using them finish
+            _bundle, _bundle_mtime = Bundle(os.path.join(root, version), version), mtime
+        return _bundle
+
+
+def bundle_response(headers: Headers, bundle: Bundle, key: str, data: bytes) -> Response:
+    """
+    A stored gzipped shard as a response: sent as is to clients accepting
+    gzip, decompressed for the rest, and 304 for a matching If-None-Match.
+    """
+    etag = make_etag(bundle.digest.encode(), key.encode())
+    response_headers = {
+        "Cache-Control": BUNDLE_POLICY.cache_control,
+        "Vary": "Accept-Encoding",
+        "X-Bundle-Version": bundle.version,
+    }
+    matched = matching_etag(headers.get("if-none-match"), etag)
+    if matched:
+        return Response(status_code=304, headers={**response_headers, "ETag": matched})
+    if "gzip" in headers.get("accept-encoding", ""):
+        response_headers["Content-Encoding"] = "gzip"
+        response_headers["ETag"] = gzip_etag(etag)
+    else:
+        data = gzip.decompress(data)
+        response_headers["ETag"] = etag
+    return Response(bytes(data), media_type="application/json", headers=response_headers)
@@ -0,0 +1,210 @@
+import hashlib
+import hmac
+import json
+import os
+import random
+import secrets
+import time
+import msgpack
+from starlette.datastructures import Headers
+from utils.chat_cache import normalize_question
+from utils.constants import (
+    TRAFFIC_CAPTURE_KEY, TRAFFIC_CAPTURE_MAX_MB, TRAFFIC_CAPTURE_PATH,
+    TRAFFIC_CAPTURE_RATE,
+)
+
+# Routes whose requests are not recorded
+SKIPPED_PREFIXES = ("/admin", "/metrics", "/city-metrics/import")
+# Larger bodies are not recorded; the trace keeps only their size
+MAX_BODY_BYTES = 64 * 1024
+
+# Key of the client pseudonyms and question hashes. Without
+# TRAFFIC_CAPTURE_KEY it is drawn when the app is imported, so hashes only
+# match within one server's lifetime (across serve.py's workers, which
+# share it)
+CAPTURE_KEY = TRAFFIC_CAPTURE_KEY.encode() or secrets.token_bytes(16)
+
+
+def keyed_hash(text: str) -> str:
+    return hmac.new(CAPTURE_KEY, text.encode(), hashlib.sha256).hexdigest()[:16]
+
+
+def redact_chat(body: dict) -> dict:
+    """
+    Chat messages are not kept: only their roles and lengths, and a keyed
+    hash of the opening question, so replay can ask the same question
+    again where a client did and hit the answer cache the same way.
+    """
+    messages = [message for message in body.get("messages") or []
+                if isinstance(message, dict)]
+    question = next((message.get("content") for message in messages
+                     if message.get("role") == "user"), None)
+    return {
+        "city": body.get("city"),
+        "messages": [{
+            "role": message.get("role"),
+            "length": (len(message["content"])
+                       if isinstance(message.get("content"), str) else 0),
+        } for message in messages],
+        "question_hash": (keyed_hash(normalize_question(question))
+                          if isinstance(question, str) else None),
+    }
+
+
+def redact_contact(body: dict) -> dict:
+    """
+    Contact forms are all personal data: only the length of the comments,
+    which the browser types out, is kept.
+    """
+    comments = body.get("comments")
+    return {
+        "name": "Redacted",
+        "email": "redacted@example.com",
+        "phone": "555-0100",
+        "comments": "x" * len(comments) if isinstance(comments, str) else "",
+    }
+
+
+REDACTORS = {
+    "/chat": redact_chat,
+    "/contact-us": redact_contact,
+}
+
+
+def sanitize_body(path: str, data: bytes):
+    """
+    A JSON request body with the route's personal data redacted, or None
+    if it is not JSON.
+    """
+    try:
+        body = json.loads(data)
+    except ValueError:
+        return None
+    redact = REDACTORS.get(path)
+    if redact is not None and isinstance(body, dict):
+        body = redact(body)
+    return body
+
+
+class TraceLog:
+    """
+    Append-only msgpack log of request traces. Each trace is one write to a
+    file opened with O_APPEND, so workers can share the file. Nothing is
+    written once the file reaches max_bytes.
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.fd = None
+        self.pid = None
+        self.full = False
+
+    def append(self, trace: dict) -> bool:
+        # Each process opens its own descriptor, including forked workers
+        if self.pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self.fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+            self.pid = os.getpid()
+        if os.fstat(self.fd).st_size >= self.max_bytes:
+            if not self.full:
+                print(f"Traffic capture stopped: {self.path} is full.")
+                self.full = True
+            return False
+        os.write(self.fd, msgpack.packb(trace, use_bin_type=True))
+        return True
+
+
+def read_traces(path: str):
+    """
+    The traces in a log, in the order they were written. A trace cut off
+    by a crash at the end of the file is skipped.
+    """
+    with open(path, "rb") as file:
+        unpacker = msgpack.Unpacker(file, raw=False)
+        try:
+            yield from unpacker
+        except (msgpack.OutOfData, ValueError) as e:
+            print(f"Stopped reading {path} at a damaged trace: {e}")
+
+
+class TrafficCaptureMiddleware:
+    """
+    ASGI middleware recording a sampled share of requests to a TraceLog, for
+    replay by benchmarks/replay.py: the path, query string and JSON body
+    (reduced to its shape on /chat and /contact-us), the route template,
+    status, time to first byte and duration. Clients are recorded as a
+    keyed pseudonym; addresses and headers are not recorded.
+    """
+
+    def __init__(self, app, path: str = TRAFFIC_CAPTURE_PATH,
+                 sample_rate: float = TRAFFIC_CAPTURE_RATE,
+                 max_mb: float = TRAFFIC_CAPTURE_MAX_MB):
+        self.app = app
+        self.log = TraceLog(path, int(max_mb * 1024 * 1024))
+        self.sample_rate = sample_rate
+
+    def pseudonym(self, scope) -> str:
+        client = scope.get("client")
+        return keyed_hash(client[0] if client else "")[:12]
+
+    async def __call__(self, scope, receive, send):
+        if (scope["type"] != "http" or scope["path"].startswith(SKIPPED_PREFIXES)
+                or random.random() >= self.sample_rate):
+            await self.app(scope, receive, send)
+            return
+
+        started_at = time.time()
+        start = time.perf_counter()
+        trace = {
+            "ts": started_at,
+            "method": scope["method"],
+            "path": scope["path"],
+            "query": scope["query_string"].decode("latin-1"),
+            "client": self.pseudonym(scope),
+            "body": None,
+        }
+
+        headers = Headers(scope=scope)
+        length = int(headers.get("content-length") or 0)
+        if length and "json" in headers.get("content-type", "") and length <= MAX_BODY_BYTES:
+            # Read the body here and hand the app the same messages
+            messages, more_body = [], True
+            while more_body:
+                message = await receive()
+                messages.append(message)
+                more_body = message["type"] == "http.request" and message.get("more_body", False)
+            trace["body"] = sanitize_body(
+                scope["path"], b"".join(message.get("body", b"") for message in messages))
+            original_receive = receive
+
+            async def receive():
+                return messages.pop(0) if messages else await original_receive()
+        elif length:
+            trace["body_bytes"] = length
+
+        response = {"status": 500, "ttfb": None, "bytes": 0}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                if response["ttfb"] is None:
+                    response["ttfb"] = time.perf_counter() - start
+                response["bytes"] += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            trace["route"] = getattr(route, "path", None) or "unmatched"
+            trace["status"] = response["status"]
+            trace["ms"] = round((time.perf_counter() - start) * 1000, 2)
+            trace["ttfb_ms"] = (round(response["ttfb"] * 1000, 2)
+                                if response["ttfb"] is not None else None)
+            trace["bytes"] = response["bytes"]
+            try:
+                self.log.append(trace)
+            except OSError as e:
+                print(f"Could not record traffic trace: {e}")
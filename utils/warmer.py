@@ -0,0 +1,191 @@
+import asyncio
+import hashlib
+import threading
+import time
+from array import array
+from Database.get_verified_db import SessionLocal, init_db
+from Database.readonly import find_news, get_city
+from utils.cache import cache, pack, unpack
+from utils.City_Data.get_city_data import get_city_data
+from utils.fetch_news import fetch_news
+from utils.query_data import query_rag
+from utils.constants import (
+    WARMER_BUDGET_SECONDS, WARMER_ENABLED, WARMER_INTERVAL_SECONDS, WARMER_MAX_KEYS,
+)
+
+# Shared state lives directly in the cache backend, outside any namespace,
+# so it survives restarts and is merged across workers
+COUNTS_KEY = "warmer:counts"
+COUNTS_LOCK_KEY = "warmer:counts:lock"
+RUN_LOCK_KEY = "warmer:run"
+
+# Counts lose half their weight every HALF_LIFE_SECONDS, so popularity
+# follows recent traffic
+HALF_LIFE_SECONDS = 24 * 3600
+# Keys kept in the merged counts
+MAX_TRACKED_KEYS = 1000
+
+
+class TopKSketch:
+    """
+    Count-min sketch of key frequencies plus the k keys with the highest
+    estimates. Memory stays fixed however many distinct keys are seen.
+    """
+
+    def __init__(self, k: int = 200, width: int = 2048, depth: int = 4):
+        self.k = k
+        self.width = width
+        self.depth = depth
+        self.counters = array("I", bytes(4 * width * depth))
+        self.top = {}
+        self.lock = threading.Lock()
+
+    def _indexes(self, key: str):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [row * self.width + (h1 + row * h2) % self.width
+                for row in range(self.depth)]
+
+    def add(self, key: str):
+        with self.lock:
+            indexes = self._indexes(key)
+            for i in indexes:
+                self.counters[i] += 1
+            estimate = min(self.counters[i] for i in indexes)
+            if key in self.top or len(self.top) < self.k:
+                self.top[key] = estimate
+                return
+            coldest = min(self.top, key=self.top.get)
+            if estimate > self.top[coldest]:
+                del self.top[coldest]
+                self.top[key] = estimate
+
+    def drain(self) -> dict:
+        """
+        Return the top keys and their counts, and start a new window.
+        """
+        with self.lock:
+            top, self.top = self.top, {}
+            self.counters = array("I", bytes(4 * self.width * self.depth))
+        return top
+
+
+class CacheWarmer:
+    """
+    Records which comparisons and news pages are requested, and periodically
+    precomputes the hottest ones into the shared cache so they are served
+    from it after a deploy or expiry.
+    """
+
+    def __init__(self, budget_seconds: float = WARMER_BUDGET_SECONDS,
+                 max_keys: int = WARMER_MAX_KEYS,
+                 interval: float = WARMER_INTERVAL_SECONDS):
+        self.budget_seconds = budget_seconds
+        self.max_keys = max_keys
+        self.interval = interval
+        self.sketch = TopKSketch()
+        # Counts drained but not yet merged into the shared counts
+        self.unmerged = {}
+
+    def record_comparison(self, from_id: int, to_id: int):
+        self.record(f"comparison:{from_id}:{to_id}")
+
+    def record_news(self, city: str):
+        self.record(f"news:{city}")
+
+    def record(self, key: str):
+        if WARMER_ENABLED:
+            self.sketch.add(key)
+
+    def flush(self) -> dict:
+        """
+        Merge this worker's counts into the shared, decayed counts and return
+        the result.
+        """
+        backend = cache.backend
+        local = self.unmerged
+        for key, count in self.sketch.drain().items():
+            local[key] = local.get(key, 0) + count
+        if not backend.add(COUNTS_LOCK_KEY, b"", 10):
+            # Another worker is merging; keep ours for the next flush
+            self.unmerged = local
+            data = backend.get(COUNTS_KEY)
+            return unpack(data)["counts"] if data else {}
+        self.unmerged = {}
+        try:
+            data = backend.get(COUNTS_KEY)
+            state = unpack(data) if data else {"updated_at": time.time(), "counts": {}}
+            now = time.time()
+            decay = 0.5 ** ((now - state["updated_at"]) / HALF_LIFE_SECONDS)
+            counts = {key: count * decay for key, count in state["counts"].items()}
+            for key, count in local.items():
+                counts[key] = counts.get(key, 0) + count
+            counts = dict(sorted(counts.items(), key=lambda item: item[1],
+                                 reverse=True)[:MAX_TRACKED_KEYS])
+            backend.set(COUNTS_KEY, pack({"updated_at": now, "counts": counts}), None)
+            return counts
+        finally:
+            backend.delete(COUNTS_LOCK_KEY)
+
+    def warm(self, counts: dict) -> dict:
+        """
+        Run the cached pipeline steps for the hottest keys, stopping at
+        max_keys or when the time budget is spent. Keys already cached cost
+        one lookup each.
+        """
+        deadline = time.monotonic() + self.budget_seconds
+        hottest = sorted(counts, key=counts.get, reverse=True)[:self.max_keys]
+        warmed, failed = 0, 0
+        db = SessionLocal() if init_db(retries=1) else None
+        try:
+            for key in hottest:
+                if time.monotonic() >= deadline:
+                    break
+                kind, _, value = key.partition(":")
+                try:
+                    if kind == "comparison":
+                        cities = [get_city(int(id)) for id in value.split(":")]
+                        if None in cities:
+                            continue
+                        query_rag(cities[0].city, cities[1].city, cities[1].state_code)
+                        if db is not None:
+                            for city in cities:
+                                get_city_data(city, db)
+                    elif kind == "news":
+                        news = find_news(value)
+                        if news is not None:
+                            fetch_news(news.url)
+                    warmed += 1
+                except Exception as e:
+                    failed += 1
+                    print(f"Cache warmer failed for {key}: {e}")
+        finally:
+            if db is not None:
+                db.close()
+        return {"warmed": warmed, "failed": failed, "candidates": len(hottest)}
+
+    def run_once(self):
+        counts = self.flush()
+        # Only one worker warms per interval
+        if counts and cache.backend.add(RUN_LOCK_KEY, b"", self.interval * 0.9):
+            start = time.monotonic()
+            result = self.warm(counts)
+            print(f"Cache warmer: warmed {result['warmed']} of "
+                  f"{result['candidates']} hot keys in "
+                  f"{time.monotonic() - start:.1f}s, {result['failed']} failed.")
+
+    async def run(self):
+        """
+        Warm on startup, from the counts saved by earlier runs, then on
+        every interval.
+        """
+        while True:
+            try:
+                await asyncio.to_thread(self.run_once)
+            except Exception as e:
+                print(f"Cache warmer run failed: {e}")
+            await asyncio.sleep(self.interval)
+
+
+warmer = CacheWarmer()